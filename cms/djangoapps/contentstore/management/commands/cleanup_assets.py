@@ -29,6 +29,8 @@ class Command(BaseCommand):
         try:
             # Remove all redundant Mac OS metadata files
             assets_deleted = content_store.remove_redundant_content_for_courses()
+            # Remove the chunks left by uploads which failed partway
+            orphans_deleted = content_store.remove_orphaned_content()
             success = True
         except Exception as err:
             log.info(u"=" * 30 + u"> failed to cleanup")
@@ -38,3 +40,4 @@ class Command(BaseCommand):
         if success:
             log.info(u"=" * 80)
             log.info(u"Total number of assets deleted: {0}".format(assets_deleted))
+            log.info(u"Total number of orphaned contents deleted: {0}".format(orphans_deleted))
@@ -13,8 +13,6 @@ from tempfile import mkdtemp
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import SuspiciousOperation, PermissionDenied
-from django.core.files.temp import NamedTemporaryFile
-from django.core.servers.basehttp import FileWrapper
 from django.http import HttpResponse, HttpResponseNotFound
 from django.utils.translation import ugettext as _
 from django.views.decorators.http import require_http_methods, require_GET
@@ -26,7 +24,7 @@ from xmodule.exceptions import SerializationError
 from xmodule.modulestore.django import modulestore
 from opaque_keys.edx.keys import CourseKey
 from xmodule.modulestore.xml_importer import import_from_xml
-from xmodule.modulestore.xml_exporter import export_to_xml
+from xmodule.modulestore.xml_exporter import export_to_xml, export_to_tar_gz_stream
 
 from .access import has_course_access
 
@@ -359,16 +357,14 @@ def export_handler(request, course_key_string):
     export_url = reverse_course_url('export_handler', course_key) + '?_accept=application/x-tgz'
     if 'application/x-tgz' in requested_format:
         name = course_module.url_name
-        export_file = NamedTemporaryFile(prefix=name + '.', suffix=".tar.gz")
         root_dir = path(mkdtemp())
 
         try:
-            export_to_xml(modulestore(), contentstore(), course_module.id, root_dir, name)
-
-            logging.debug(u'tar file being generated at {0}'.format(export_file.name))
-            with tarfile.open(name=export_file.name, mode='w:gz') as tar_file:
-                tar_file.add(root_dir / name, arcname=name)
+            # Only the xml is written to disk: the static files are streamed into the
+            # tar.gz straight from the contentstore
+            export_to_xml(modulestore(), contentstore(), course_module.id, root_dir, name, export_static_files=False)
         except SerializationError as exc:
+            shutil.rmtree(root_dir)
             log.exception(u'There was an error exporting course %s', course_module.id)
             unit = None
             failed_item = None
@@ -396,6 +392,7 @@ def export_handler(request, course_key_string):
                 'export_url': export_url
             })
         except Exception as exc:
+            shutil.rmtree(root_dir)
             log.exception('There was an error exporting course %s', course_module.id)
             return render_to_response('export.html', {
                 'context_course': course_module,
@@ -405,13 +402,12 @@ def export_handler(request, course_key_string):
                 'course_home_url': reverse_course_url("course_handler", course_key),
                 'export_url': export_url
             })
-        finally:
-            shutil.rmtree(root_dir / name)
 
-        wrapper = FileWrapper(export_file)
-        response = HttpResponse(wrapper, content_type='application/x-tgz')
-        response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(export_file.name.encode('utf-8'))
-        response['Content-Length'] = os.path.getsize(export_file.name)
+        # The tar.gz is sent as it's made, so its length isn't known
+        response = HttpResponse(
+            _stream_export(course_module.id, root_dir, name), content_type='application/x-tgz'
+        )
+        response['Content-Disposition'] = 'attachment; filename=%s.tar.gz' % name.encode('utf-8')
         return response
 
     elif 'text/html' in requested_format:
@@ -423,3 +419,18 @@ def export_handler(request, course_key_string):
     else:
         # Only HTML or x-tgz request formats are supported (no JSON).
         return HttpResponse(status=406)
+
+
+def _stream_export(course_key, root_dir, course_dir):
+    """
+    Yield the bytes of the tar.gz of the course exported to `root_dir`/`course_dir`, then delete `root_dir`.
+    """
+    try:
+        for chunk in export_to_tar_gz_stream(contentstore(), course_key, root_dir, course_dir):
+            yield chunk
+    except Exception:
+        # The response has started, so all that can be done is to cut it short
+        log.exception(u'There was an error streaming the export of course %s', course_key)
+        raise
+    finally:
+        shutil.rmtree(root_dir)
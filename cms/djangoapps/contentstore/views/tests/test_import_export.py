@@ -6,6 +6,7 @@ import json
 import logging
 import os
 import shutil
+from StringIO import StringIO
 import tarfile
 import tempfile
 from path import path
@@ -287,6 +288,8 @@ class ExportTestCase(CourseTestCase):
         """ Export success helper method. """
         self.assertEquals(resp.status_code, 200)
         self.assertTrue(resp.get('Content-Disposition').startswith('attachment'))
+        with tarfile.open(fileobj=StringIO(resp.content), mode='r:gz') as tar_file:
+            self.assertIn('{}/course.xml'.format(self.course.url_name), tar_file.getnames())
 
     def test_export_failure_top_level(self):
         """
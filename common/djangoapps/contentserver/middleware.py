@@ -2,11 +2,18 @@
 Middleware to serve assets.
 """
 
+import calendar
+from datetime import datetime
 import logging
+from uuid import uuid4
 
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import (
     HttpResponse, HttpResponseNotModified, HttpResponseForbidden
 )
+from django.utils.http import http_date, parse_http_date_safe
 from student.models import CourseEnrollment
 
 from xmodule.contentstore.django import contentstore
@@ -22,6 +29,13 @@ from xmodule.exceptions import NotFoundError
 
 log = logging.getLogger(__name__)
 
+# The format Last-Modified was sent in before it was sent as a standard HTTP date
+LEGACY_LAST_MODIFIED_FORMAT = "%a, %d-%b-%Y %H:%M:%S GMT"
+
+# How long whether a user is enrolled in the course of locked assets is cached for, in seconds
+LOCKED_ASSET_ACCESS_CACHE_TIMEOUT = 5 * 60
+
+
 class StaticContentServer(object):
     def process_request(self, request):
         # look to see if the request is prefixed with an asset prefix tag
@@ -49,7 +63,8 @@ class StaticContentServer(object):
                     return response
 
                 # since we fetched it from DB, let's cache it going forward, but only if it's < 1MB
-                # this is because I haven't been able to find a means to stream data out of memcached
+                # this is because I haven't been able to find a means to stream data out of memcached.
+                # Larger assets are streamed from the contentstore's disk cache, if it has one.
                 if content.length is not None:
                     if content.length < 1048576:
                         # since we've queried as a stream, let's read in the stream into memory to set in cache
@@ -63,39 +78,33 @@ class StaticContentServer(object):
             if getattr(content, "locked", False):
                 if not hasattr(request, "user") or not request.user.is_authenticated():
                     return HttpResponseForbidden('Unauthorized')
-                if not request.user.is_staff:
-                    if getattr(loc, 'deprecated', False) and not CourseEnrollment.is_enrolled_by_partial(
-                        request.user, loc.course_key
-                    ):
-                        return HttpResponseForbidden('Unauthorized')
-                    if not getattr(loc, 'deprecated', False) and not CourseEnrollment.is_enrolled(
-                        request.user, loc.course_key
-                    ):
-                        return HttpResponseForbidden('Unauthorized')
+                if not request.user.is_staff and not is_enrolled_for_locked_asset(request.user, loc):
+                    return HttpResponseForbidden('Unauthorized')
 
             # convert over the DB persistent last modified timestamp to a HTTP compatible
-            # timestamp, so we can simply compare the strings
-            last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            # timestamp
+            last_modified_at = calendar.timegm(content.last_modified_at.utctimetuple())
+            last_modified_at_str = http_date(last_modified_at)
+            # the content's stored md5 makes a strong entity tag; pickled instances in the cache
+            # may predate it, though
+            content_digest = getattr(content, 'content_digest', None)
+            etag = '"{}"'.format(content_digest) if content_digest else None
 
             # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
-                if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
-                if if_modified_since == last_modified_at_str:
-                    return HttpResponseNotModified()
+            # entity tags or timestamps, if they match then just return a 304 (Not Modified)
+            if not_modified(request, etag, last_modified_at):
+                response = HttpResponseNotModified()
+                set_validators(response, etag, last_modified_at_str)
+                return response
 
-            # *** File streaming within a byte range ***
+            # *** File streaming within byte ranges ***
             # If a Range is provided, parse Range attribute of the request
             # Add Content-Range in the response if Range is structurally correct
-            # Request -> Range attribute structure: "Range: bytes=first-[last]"
+            # Request -> Range attribute structure: "Range: bytes=first-[last][, first-[last]...]"
             # Response -> Content-Range attribute structure: "Content-Range: bytes first-last/totalLength"
             # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.35
             response = None
-            if request.META.get('HTTP_RANGE'):
-                # Data from cache (StaticContent) has no easy byte management, so we use the DB instead (StaticContentStream)
-                if type(content) == StaticContent:
-                    content = contentstore().find(loc, as_stream=True)
-
+            if request.META.get('HTTP_RANGE') and if_range_matches(request, etag, last_modified_at_str):
                 header_value = request.META['HTTP_RANGE']
                 try:
                     unit, ranges = parse_range_header(header_value, content.length)
@@ -108,43 +117,192 @@ class StaticContentServer(object):
                     if unit != 'bytes':
                         # Only accept ranges in bytes
                         log.warning(u"Unknown unit in Range header: %s for content: %s", header_value, unicode(loc))
-                    elif len(ranges) > 1:
-                        # According to Http/1.1 spec content for multiple ranges should be sent as a multipart message.
-                        # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.16
-                        # But we send back the full content.
-                        log.warning(
-                            u"More than 1 ranges in Range header: %s for content: %s", header_value, unicode(loc)
-                        )
                     else:
-                        first, last = ranges[0]
-
-                        if 0 <= first <= last < content.length:
-                            # If the byte range is satisfiable
+                        # Both cached (StaticContent) and DB (StaticContentStream) content can stream a range
+                        ranges = [(first, last) for first, last in ranges if 0 <= first <= last < content.length]
+                        if not ranges:
+                            log.warning(
+                                u"Cannot satisfy ranges in Range header: %s for content: %s", header_value, unicode(loc)
+                            )
+                            return HttpResponse(status=416)  # Requested Range Not Satisfiable
+                        elif len(ranges) == 1:
+                            first, last = ranges[0]
                             response = HttpResponse(content.stream_data_in_range(first, last))
                             response['Content-Range'] = 'bytes {first}-{last}/{length}'.format(
                                 first=first, last=last, length=content.length
                             )
                             response['Content-Length'] = str(last - first + 1)
+                            response['Content-Type'] = content.content_type
                             response.status_code = 206  # Partial Content
                         else:
-                            log.warning(
-                                u"Cannot satisfy ranges in Range header: %s for content: %s", header_value, unicode(loc)
-                            )
-                            return HttpResponse(status=416)  # Requested Range Not Satisfiable
+                            # According to Http/1.1 spec content for multiple ranges should be sent as a multipart message.
+                            # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.16
+                            response = multipart_byteranges_response(content, ranges)
 
             # If Range header is absent or syntactically invalid return a full content response.
             if response is None:
-                response = HttpResponse(content.stream_data())
-                response['Content-Length'] = content.length
+                disk_cache = getattr(contentstore(), 'disk_cache', None)
+                local_path = getattr(content, 'local_path', None)
+                if local_path and disk_cache is not None and disk_cache.sendfile_header:
+                    # Let the web server send the disk cache's copy
+                    content.close()
+                    response = HttpResponse()
+                    response[disk_cache.sendfile_header] = disk_cache.sendfile_location(local_path)
+                else:
+                    response = HttpResponse(content.stream_data())
+                    response['Content-Length'] = content.length
+                response['Content-Type'] = content.content_type
 
             # "Accept-Ranges: bytes" tells the user that only "bytes" ranges are allowed
             response['Accept-Ranges'] = 'bytes'
-            response['Content-Type'] = content.content_type
-            response['Last-Modified'] = last_modified_at_str
+            set_validators(response, etag, last_modified_at_str)
 
             return response
 
 
+def locked_asset_access_cache_key(user_id, course_key, deprecated=False):
+    """
+    Returns the cache key of whether the user is enrolled in the course, or in any run of
+    the course if `deprecated` (as deprecated asset keys have no run).
+    """
+    return u'contentserver.locked_asset_access.{user_id}.{org}.{course}.{run}'.format(
+        user_id=user_id, org=course_key.org, course=course_key.course, run=u'' if deprecated else course_key.run
+    )
+
+
+def is_enrolled_for_locked_asset(user, loc):
+    """
+    Returns whether the user is enrolled in the course of the locked asset at `loc`.
+
+    The answer is cached for a few minutes, as a page may embed many locked assets of the
+    same course; it's invalidated when the user's enrollment changes.
+    """
+    deprecated = getattr(loc, 'deprecated', False)
+    cache_key = locked_asset_access_cache_key(user.id, loc.course_key, deprecated)
+    enrolled = cache.get(cache_key)
+    if enrolled is None:
+        if deprecated:
+            enrolled = CourseEnrollment.is_enrolled_by_partial(user, loc.course_key)
+        else:
+            enrolled = CourseEnrollment.is_enrolled(user, loc.course_key)
+        cache.set(cache_key, enrolled, LOCKED_ASSET_ACCESS_CACHE_TIMEOUT)
+    return enrolled
+
+
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+def invalidate_locked_asset_access(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Forget whether the user of a changed enrollment is enrolled in its course.
+    """
+    cache.delete_many([
+        locked_asset_access_cache_key(instance.user_id, instance.course_id, deprecated)
+        for deprecated in (False, True)
+    ])
+
+
+def set_validators(response, etag, last_modified_at_str):
+    """
+    Set the headers a client can validate its cached copy of the content with.
+    """
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = last_modified_at_str
+
+
+def parse_etags(header_value):
+    """
+    Returns the list of entity tags in an If-None-Match header value, without any weak
+    indicators. '*' is returned as is.
+    """
+    etags = []
+    for etag in header_value.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        if etag:
+            etags.append(etag)
+    return etags
+
+
+def not_modified(request, etag, last_modified_at):
+    """
+    Returns whether the request's conditional headers show that the client's cached copy of
+    the content is current.
+
+    If-None-Match takes precedence over If-Modified-Since.
+    See spec for details: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.26
+    """
+    if 'HTTP_IF_NONE_MATCH' in request.META:
+        etags = parse_etags(request.META['HTTP_IF_NONE_MATCH'])
+        return '*' in etags or (etag is not None and etag in etags)
+
+    if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+        if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
+        if if_modified_since == datetime.utcfromtimestamp(last_modified_at).strftime(LEGACY_LAST_MODIFIED_FORMAT):
+            # Last-Modified used to be sent in a format which can't be parsed back
+            return True
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and last_modified_at <= if_modified_since
+
+    return False
+
+
+def if_range_matches(request, etag, last_modified_at_str):
+    """
+    Returns whether the Range of the request should be served, according to its If-Range header:
+    if the client's partial copy isn't current, it needs the full content instead.
+
+    See spec for details: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.27
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only a strong entity tag can match
+        return etag is not None and if_range == etag
+    return if_range == last_modified_at_str
+
+
+def multipart_byteranges_response(content, ranges):
+    """
+    Returns a 206 (Partial Content) response with the given ranges of the content, as a multipart/byteranges
+    message.
+
+    See spec for details: http://www.w3.org/Protocols/rfc2616/rfc2616-sec19.html#sec19.2
+    """
+    boundary = uuid4().hex
+    part_headers = [
+        (
+            '\r\n--{boundary}\r\n'
+            'Content-Type: {content_type}\r\n'
+            'Content-Range: bytes {first}-{last}/{length}\r\n'
+            '\r\n'
+        ).format(boundary=boundary, content_type=content.content_type, first=first, last=last, length=content.length)
+        for first, last in ranges
+    ]
+    closing = '\r\n--{boundary}--\r\n'.format(boundary=boundary)
+
+    def stream_parts():
+        """
+        Stream each part's headers, then its range of the content.
+        """
+        for headers, (first, last) in zip(part_headers, ranges):
+            yield headers
+            for chunk in content.stream_data_in_range(first, last):
+                yield chunk
+        yield closing
+
+    response = HttpResponse(stream_parts(), status=206)
+    response['Content-Type'] = 'multipart/byteranges; boundary={}'.format(boundary)
+    response['Content-Length'] = str(
+        sum(len(headers) for headers in part_headers) +
+        sum(last - first + 1 for first, last in ranges) +
+        len(closing)
+    )
+    return response
+
+
 def parse_range_header(header_value, content_length):
     """
     Returns the unit and a list of (start, end) tuples of ranges.
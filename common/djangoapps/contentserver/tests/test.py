@@ -7,9 +7,13 @@ import logging
 import unittest
 from uuid import uuid4
 
+from mock import patch
+
 from django.conf import settings
+from django.core.cache import cache
 from django.test.client import Client
 from django.test.utils import override_settings
+from django.utils.http import http_date
 
 from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.django import modulestore
@@ -17,6 +21,7 @@ from opaque_keys.edx.locations import SlashSeparatedCourseKey
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from xmodule.modulestore.xml_importer import import_from_xml
 
+from cache_toolbox.core import del_cached_content
 from contentserver.middleware import parse_range_header
 from student.models import CourseEnrollment
 
@@ -38,6 +43,8 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
         Create user and login.
         """
         self.staff_pwd = super(ContentStoreToyCourseTest, self).setUp()
+        # Forget the cached access of users from other tests
+        cache.clear()
         self.staff_usr = self.user
         self.non_staff_usr, self.non_staff_pwd = self.create_non_staff_user()
 
@@ -99,6 +106,33 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
         resp = self.client.get(self.url_locked)
         self.assertEqual(resp.status_code, 200)  # pylint: disable=E1103
 
+    def test_locked_asset_access_cached(self):
+        """
+        Test that whether the user is enrolled is only queried once, until the enrollment changes.
+        """
+        enrollment = CourseEnrollment.enroll(self.non_staff_usr, self.course_key)
+        self.client.login(username=self.non_staff_usr, password=self.non_staff_pwd)
+
+        with patch.object(CourseEnrollment, 'is_enrolled_by_partial', wraps=CourseEnrollment.is_enrolled_by_partial) \
+                as mock_is_enrolled:
+            self.assertEqual(self.client.get(self.url_locked).status_code, 200)  # pylint: disable=E1103
+            self.assertEqual(self.client.get(self.url_locked).status_code, 200)  # pylint: disable=E1103
+            self.assertEqual(mock_is_enrolled.call_count, 1)
+
+            enrollment.update_enrollment(is_active=False)
+            self.assertEqual(self.client.get(self.url_locked).status_code, 403)  # pylint: disable=E1103
+            self.assertEqual(mock_is_enrolled.call_count, 2)
+
+            CourseEnrollment.enroll(self.non_staff_usr, self.course_key)
+            self.assertEqual(self.client.get(self.url_locked).status_code, 200)  # pylint: disable=E1103
+            self.assertEqual(mock_is_enrolled.call_count, 3)
+
+        # and unlocking the asset doesn't need the user to be enrolled
+        enrollment.update_enrollment(is_active=False)
+        self.contentstore.set_attr(self.locked_asset, 'locked', False)
+        del_cached_content(self.locked_asset)
+        self.assertEqual(self.client.get(self.url_locked).status_code, 200)  # pylint: disable=E1103
+
     def test_locked_asset_staff(self):
         """
         Test that locked assets behave appropriately in case user is staff.
@@ -143,7 +177,7 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
 
     def test_range_request_multiple_ranges(self):
         """
-        Test that multiple ranges in request outputs the full content.
+        Test that multiple ranges in request outputs a multipart message of the ranges.
         """
         first_byte = self.length_unlocked / 4
         last_byte = self.length_unlocked / 2
@@ -151,9 +185,82 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
             first=first_byte, last=last_byte)
         )
 
-        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
         self.assertNotIn('Content-Range', resp)
-        self.assertEqual(resp['Content-Length'], str(self.length_unlocked))
+        self.assertTrue(resp['Content-Type'].startswith('multipart/byteranges; boundary='))
+        boundary = resp['Content-Type'].split('boundary=')[1]
+        self.assertEqual(resp['Content-Length'], str(len(resp.content)))
+
+        content = self.contentstore.find(self.unlocked_asset).data
+        parts = resp.content.split('--' + boundary)
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[-1], '--\r\n')
+        for part, (first, last) in zip(parts[1:3], [(first_byte, last_byte), (0, self.length_unlocked - 1)]):
+            headers, body = part.split('\r\n\r\n', 1)
+            self.assertIn('Content-Range: bytes {first}-{last}/{length}'.format(
+                first=first, last=last, length=self.length_unlocked), headers)
+            self.assertEqual(body, content[first:last + 1] + '\r\n')
+
+    def test_range_request_multiple_ranges_one_satisfiable(self):
+        """
+        Test that only the satisfiable ranges of a request are sent.
+        """
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-0, {first}-'.format(
+            first=self.length_unlocked)
+        )
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
+        self.assertEqual(resp['Content-Range'], 'bytes 0-0/{length}'.format(length=self.length_unlocked))
+        self.assertEqual(resp['Content-Length'], '1')
+
+    def test_range_request_from_cache(self):
+        """
+        Test that ranges are served from the cached copy of the content.
+        """
+        self.client.get(self.url_unlocked)
+        with patch('contentserver.middleware.contentstore') as mock_contentstore:
+            resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-0')
+        self.assertFalse(mock_contentstore.called)
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
+        self.assertEqual(resp.content, self.contentstore.find(self.unlocked_asset).data[0])
+
+    def test_etag(self):
+        """
+        Test that the entity tag of the content is its md5, and that it validates the client's copy.
+        """
+        resp = self.client.get(self.url_unlocked)
+        etag = '"{}"'.format(self.contentstore.get_attr(self.unlocked_asset, 'md5'))
+        self.assertEqual(resp['ETag'], etag)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH='"other", {}'.format(etag))
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+        # If-None-Match takes precedence over If-Modified-Since
+        resp = self.client.get(
+            self.url_unlocked, HTTP_IF_NONE_MATCH='"other"', HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_if_modified_since(self):
+        """
+        Test that the client's copy is current if it was modified since the content.
+        """
+        last_modified = self.client.get(self.url_unlocked)['Last-Modified']
+        resp = self.client.get(self.url_unlocked, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_if_range(self):
+        """
+        Test that the full content is sent when the client's partial copy isn't current.
+        """
+        etag = self.client.get(self.url_unlocked)['ETag']
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE='"other"')
+        self.assertEqual(resp.status_code, 200)
 
     @ddt.data(
         'bytes 0-',
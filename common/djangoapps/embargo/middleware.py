@@ -32,7 +32,6 @@ EMBARGO_SITE_REDIRECT_URL = 'https://www.edx.org/'
 """
 from functools import partial
 import logging
-import pygeoip
 from lazy import lazy
 
 from django.core.exceptions import MiddlewareNotUsed
@@ -43,6 +42,8 @@ from django.http import HttpResponseRedirect, HttpResponseForbidden
 from ipware.ip import get_ip
 from util.request import course_id_from_url
 
+from geoinfo.utils import country_code_by_addr
+
 from student.models import unique_id_for_user
 from embargo.models import EmbargoedCourse, EmbargoedState, IPFilter
 
@@ -123,15 +124,17 @@ class EmbargoMiddleware(object):
             A unicode message if the user is embargoed, otherwise `None`
 
         """
+        ip_filter = IPFilter.current()
+
         # If blacklisted, immediately fail
-        if ip_addr in IPFilter.current().blacklist_ips:
+        if ip_addr in ip_filter.blacklist_ips:
             return self.REASONS['ip_blacklist'].format(
                 ip_addr=ip_addr,
                 from_course=self._from_course_msg(course_id, course_is_embargoed)
             )
 
         # If we're white-listed, then allow access
-        if ip_addr in IPFilter.current().whitelist_ips:
+        if ip_addr in ip_filter.whitelist_ips:
             return None
 
         # Retrieve the country code from the IP address
@@ -193,10 +196,7 @@ class EmbargoMiddleware(object):
             str: A 2-letter country code.
 
         """
-        if ip_addr.find(':') >= 0:
-            return pygeoip.GeoIP(settings.GEOIPV6_PATH).country_code_by_addr(ip_addr)
-        else:
-            return pygeoip.GeoIP(settings.GEOIP_PATH).country_code_by_addr(ip_addr)
+        return country_code_by_addr(ip_addr)
 
     @property
     def _embargo_redirect_response(self):
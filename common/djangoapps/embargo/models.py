@@ -11,6 +11,8 @@ file and check it in at the same time as your model changes. To do that,
 3. Add the migration file created in edx-platform/common/djangoapps/embargo/migrations/
 """
 
+import bisect
+
 import ipaddr
 
 from django.db import models
@@ -89,11 +91,31 @@ class IPFilter(ConfigurationModel):
     class IPFilterList(object):
         """
         Represent a list of IP addresses with support of networks.
+
+        The networks are indexed as sorted, non-overlapping ranges of
+        addresses, one index per IP version, so that checking whether it
+        contains an address is a binary search.
         """
 
         def __init__(self, ips):
             self.networks = [ipaddr.IPNetwork(ip) for ip in ips]
 
+            ranges = {}
+            for network in self.networks:
+                ranges.setdefault(network.version, []).append((int(network.network), int(network.broadcast)))
+
+            # {version: ([first address of each range], [last address of each range])}
+            self._index = {}
+            for version, version_ranges in ranges.iteritems():
+                starts, ends = [], []
+                for start, end in sorted(version_ranges):
+                    if ends and start <= ends[-1] + 1:
+                        ends[-1] = max(ends[-1], end)
+                    else:
+                        starts.append(start)
+                        ends.append(end)
+                self._index[version] = (starts, ends)
+
         def __iter__(self):
             for network in self.networks:
                 yield network
@@ -104,11 +126,29 @@ class IPFilter(ConfigurationModel):
             except ValueError:
                 return False
 
-            for network in self.networks:
-                if network.Contains(ip):
-                    return True
+            if ip.version not in self._index:
+                return False
+            starts, ends = self._index[ip.version]
+            position = bisect.bisect_right(starts, int(ip)) - 1
+            return position >= 0 and int(ip) <= ends[position]
 
-            return False
+    # The lists of each whitelist or blacklist that has been parsed, so
+    # they're indexed once rather than on every request.
+    _filter_lists = {}
+    MAX_CACHED_FILTER_LISTS = 32
+
+    @classmethod
+    def _filter_list(cls, addresses):
+        """
+        Return the IPFilterList of a comma-separated list of IP addresses.
+        """
+        filter_list = cls._filter_lists.get(addresses)
+        if filter_list is None:
+            filter_list = cls.IPFilterList([addr.strip() for addr in addresses.split(',')])
+            if len(cls._filter_lists) >= cls.MAX_CACHED_FILTER_LISTS:
+                cls._filter_lists.clear()
+            cls._filter_lists[addresses] = filter_list
+        return filter_list
 
     @property
     def whitelist_ips(self):
@@ -117,7 +157,7 @@ class IPFilter(ConfigurationModel):
         """
         if self.whitelist == '':
             return []
-        return self.IPFilterList([addr.strip() for addr in self.whitelist.split(',')])  # pylint: disable=no-member
+        return self._filter_list(self.whitelist)
 
     @property
     def blacklist_ips(self):
@@ -126,4 +166,4 @@ class IPFilter(ConfigurationModel):
         """
         if self.blacklist == '':
             return []
-        return self.IPFilterList([addr.strip() for addr in self.blacklist.split(',')])  # pylint: disable=no-member
+        return self._filter_list(self.blacklist)
@@ -95,3 +95,15 @@ class EmbargoModelsTest(TestCase):
         self.assertTrue('1.1.0.1' in cblacklist)
         self.assertTrue('1.1.1.0' in cblacklist)
         self.assertFalse('1.2.0.0' in cblacklist)
+
+    def test_ip_overlapping_networks(self):
+        blacklist = '1.1.0.0/16, 1.1.4.0/24, 1.2.0.0/16, 10.0.0.1, 2002:c0a8::/32, 2002:c0a8:101::42'
+
+        IPFilter(blacklist=blacklist).save()
+
+        cblacklist = IPFilter.current().blacklist_ips
+        self.assertEqual(len(list(cblacklist)), 6)
+        for addr in ['1.1.0.0', '1.1.4.9', '1.1.255.255', '1.2.0.0', '1.2.255.255', '10.0.0.1', '2002:c0a8:ffff::1']:
+            self.assertTrue(addr in cblacklist)
+        for addr in ['1.0.255.255', '1.3.0.0', '10.0.0.0', '10.0.0.2', '2002:c0a9::1', '::1.1.0.1', 'not an ip']:
+            self.assertFalse(addr in cblacklist)
@@ -0,0 +1,22 @@
+"""
+Tests for geoinfo.utils.
+"""
+
+from django.conf import settings
+from django.test import TestCase
+
+from geoinfo import utils
+
+
+class GeoIPReaderTests(TestCase):
+    """
+    Tests of the shared GeoIP readers.
+    """
+    def test_reader_shared(self):
+        reader = utils.geoip_reader(settings.GEOIP_PATH)
+        self.assertIs(utils.geoip_reader(settings.GEOIP_PATH), reader)
+        self.assertIsNot(utils.geoip_reader(settings.GEOIPV6_PATH), reader)
+
+    def test_country_code_by_addr(self):
+        self.assertEqual(utils.country_code_by_addr('18.0.0.1'), 'US')
+        self.assertEqual(utils.country_code_by_addr('2001:4860:4860::8888'), 'US')
@@ -0,0 +1,46 @@
+"""
+Shared lookups of the country of an IP address.
+
+Opening a GeoIP database reads and parses its header, so rather than
+opening it for each lookup, every thread of the process shares one
+memory-mapped reader per database.
+"""
+
+import threading
+
+import pygeoip
+
+from django.conf import settings
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def geoip_reader(path):
+    """
+    Return the process-wide `pygeoip.GeoIP` reader of the database at `path`,
+    opening it the first time it's asked for.
+
+    pygeoip serializes the reads of each reader, so it's safe to share
+    between threads.
+    """
+    path = unicode(path)
+    reader = _readers.get(path)
+    if reader is None:
+        with _readers_lock:
+            reader = _readers.get(path)
+            if reader is None:
+                reader = _readers[path] = pygeoip.GeoIP(path, pygeoip.MMAP_CACHE)
+    return reader
+
+
+def country_code_by_addr(ip_address):
+    """
+    Return the 2-letter code of the country of an IPv4 or IPv6 address,
+    or an empty string if it's unknown.
+    """
+    if ip_address.find(':') >= 0:
+        return geoip_reader(settings.GEOIPV6_PATH).country_code_by_addr(ip_address)
+    else:
+        return geoip_reader(settings.GEOIP_PATH).country_code_by_addr(ip_address)
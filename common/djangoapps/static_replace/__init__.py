@@ -11,6 +11,16 @@ from xmodule.contentstore.content import StaticContent
 
 log = logging.getLogger(__name__)
 
+# At most this many compiled url regexes (whose prefixes vary with courses' data directories)
+# and course url rewriters are kept
+MAX_URL_REPLACE_REGEXES = 1000
+MAX_URL_REWRITERS = 100
+# At most this many resolved static urls are memoized by each course url rewriter
+MAX_REWRITER_STATIC_URLS = 10000
+
+_url_replace_regexes = {}
+_url_rewriters = {}
+
 
 def _url_replace_regex(prefix):
     """
@@ -28,6 +38,28 @@ def _url_replace_regex(prefix):
         """.format(prefix=prefix)
 
 
+def _compiled_url_replace_regex(prefix):
+    """
+    Return the compiled `_url_replace_regex` for prefix, compiling it only once.
+    """
+    regex = _url_replace_regexes.get(prefix)
+    if regex is None:
+        if len(_url_replace_regexes) >= MAX_URL_REPLACE_REGEXES:
+            _url_replace_regexes.clear()
+        regex = _url_replace_regexes[prefix] = re.compile(_url_replace_regex(prefix))
+    return regex
+
+
+def _static_url_prefix_regex(data_directory, static_asset_path):
+    """
+    Match the prefix of static urls which haven't been replaced yet.
+    """
+    return u'(?:{static_url}|/static/)(?!{data_dir})'.format(
+        static_url=settings.STATIC_URL,
+        data_dir=static_asset_path or data_directory
+    )
+
+
 def try_staticfiles_lookup(path):
     """
     Try to lookup a path in staticfiles_storage.  If it fails, return
@@ -69,7 +101,7 @@ def replace_jump_to_id_urls(text, course_id, jump_to_id_base_url):
         rest = match.group('rest')
         return "".join([quote, jump_to_id_base_url + rest, quote])
 
-    return re.sub(_url_replace_regex('/jump_to_id/'), replace_jump_to_id_url, text)
+    return _compiled_url_replace_regex('/jump_to_id/').sub(replace_jump_to_id_url, text)
 
 
 def replace_course_urls(text, course_key):
@@ -89,7 +121,58 @@ def replace_course_urls(text, course_key):
         rest = match.group('rest')
         return "".join([quote, '/courses/' + course_id + '/', rest, quote])
 
-    return re.sub(_url_replace_regex('/course/'), replace_course_url, text)
+    return _compiled_url_replace_regex('/course/').sub(replace_course_url, text)
+
+
+def _resolve_static_url(prefix, rest, data_directory, course_id, static_asset_path, uses_contentstore):
+    """
+    Return the url which the static url `prefix` + `rest` should be replaced with, or None if
+    it should be left as it is. See `replace_static_urls`.
+
+    uses_contentstore: A function returning whether the static content of course_id is in the
+        contentstore (i.e., the course isn't an xml course)
+    """
+    # Don't mess with things that end in '?raw'
+    if rest.endswith('?raw'):
+        return None
+
+    # In debug mode, if we can find the url as is,
+    if settings.DEBUG and finders.find(rest, True):
+        return None
+    # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
+    elif (not static_asset_path) and course_id and uses_contentstore():
+        # first look in the static file pipeline and see if we are trying to reference
+        # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
+
+        exists_in_staticfiles_storage = False
+        try:
+            exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+
+        if exists_in_staticfiles_storage:
+            url = staticfiles_storage.url(rest)
+        else:
+            # if not, then assume it's courseware specific content and then look in the
+            # Mongo-backed database
+            url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
+    # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
+    else:
+        course_path = "/".join((static_asset_path or data_directory, rest))
+
+        try:
+            if staticfiles_storage.exists(rest):
+                url = staticfiles_storage.url(rest)
+            else:
+                url = staticfiles_storage.url(course_path)
+        # And if that fails, assume that it's course content, and add manually data directory
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+            url = "".join([prefix, course_path])
+
+    return url
 
 
 def replace_static_urls(text, data_directory, course_id=None, static_asset_path=''):
@@ -104,62 +187,109 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
     course_id: The course identifier used to distinguish static content for this course in studio
     static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
     """
+    # the modulestore type of the course is only looked up once, and only if needed
+    modulestore_type = []
+
+    def uses_contentstore():
+        if not modulestore_type:
+            modulestore_type.append(modulestore().get_modulestore_type(course_id))
+        return modulestore_type[0] != ModuleStoreEnum.Type.xml
 
     def replace_static_url(match):
-        original = match.group(0)
-        prefix = match.group('prefix')
+        url = _resolve_static_url(
+            match.group('prefix'), match.group('rest'), data_directory, course_id, static_asset_path, uses_contentstore
+        )
+        if url is None:
+            return match.group(0)
         quote = match.group('quote')
-        rest = match.group('rest')
+        return "".join([quote, url, quote])
 
-        # Don't mess with things that end in '?raw'
-        if rest.endswith('?raw'):
-            return original
-
-        # In debug mode, if we can find the url as is,
-        if settings.DEBUG and finders.find(rest, True):
-            return original
-        # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) \
-                and course_id \
-                and modulestore().get_modulestore_type(course_id) != ModuleStoreEnum.Type.xml:
-            # first look in the static file pipeline and see if we are trying to reference
-            # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
-
-            exists_in_staticfiles_storage = False
-            try:
-                exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-
-            if exists_in_staticfiles_storage:
-                url = staticfiles_storage.url(rest)
-            else:
-                # if not, then assume it's courseware specific content and then look in the
-                # Mongo-backed database
-                url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
-        # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
-        else:
-            course_path = "/".join((static_asset_path or data_directory, rest))
-
-            try:
-                if staticfiles_storage.exists(rest):
-                    url = staticfiles_storage.url(rest)
-                else:
-                    url = staticfiles_storage.url(course_path)
-            # And if that fails, assume that it's course content, and add manually data directory
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-                url = "".join([prefix, course_path])
+    return _compiled_url_replace_regex(
+        _static_url_prefix_regex(data_directory, static_asset_path)
+    ).sub(replace_static_url, text)
 
+
+class CourseUrlRewriter(object):
+    """
+    Replaces the /static/, /course/ and /jump_to_id/ urls in the content of a course in a single
+    pass over the content, as `replace_static_urls`, `replace_course_urls` and
+    `replace_jump_to_id_urls` would one after the other.
+
+    The url each static url resolves to is memoized, so use `course_url_rewriter` to share
+    rewriters between the blocks (and requests) of a course.
+    """
+    def __init__(self, course_id, data_directory, static_asset_path, jump_to_id_base_url):
+        self.course_id = course_id
+        self.data_directory = data_directory
+        self.static_asset_path = static_asset_path
+        self.jump_to_id_base_url = jump_to_id_base_url
+        self._course_url_base = '/courses/' + course_id.to_deprecated_string() + '/'
+        self._regex = _compiled_url_replace_regex(
+            u'(?P<static>{static})|(?P<course>/course/)|(?P<jump_to_id>/jump_to_id/)'.format(
+                static=_static_url_prefix_regex(data_directory, static_asset_path)
+            )
+        )
+        self._uses_contentstore = None
+        self._static_urls = {}
+
+    def uses_contentstore(self):
+        """
+        Is the static content of the course in the contentstore? (i.e., isn't it an xml course)
+        """
+        if self._uses_contentstore is None:
+            self._uses_contentstore = (
+                modulestore().get_modulestore_type(self.course_id) != ModuleStoreEnum.Type.xml
+            )
+        return self._uses_contentstore
+
+    def _static_url(self, prefix, rest):
+        """
+        Return the (memoized) url the static url `prefix` + `rest` resolves to, or None.
+        """
+        key = (prefix, rest)
+        if key in self._static_urls:
+            return self._static_urls[key]
+        url = _resolve_static_url(
+            prefix, rest, self.data_directory, self.course_id, self.static_asset_path, self.uses_contentstore
+        )
+        # finders results in debug mode change as files are added, so don't memoize them
+        if not settings.DEBUG and len(self._static_urls) < MAX_REWRITER_STATIC_URLS:
+            self._static_urls[key] = url
+        return url
+
+    def _replace_url(self, match):
+        """
+        Return the replacement of the url matched by the rewriter's regex.
+        """
+        quote = match.group('quote')
+        rest = match.group('rest')
+        if match.group('course') is not None:
+            return "".join([quote, self._course_url_base, rest, quote])
+        elif match.group('jump_to_id') is not None:
+            return "".join([quote, self.jump_to_id_base_url + rest, quote])
+
+        url = self._static_url(match.group('prefix'), rest)
+        if url is None:
+            return match.group(0)
         return "".join([quote, url, quote])
 
-    return re.sub(
-        _url_replace_regex(u'(?:{static_url}|/static/)(?!{data_dir})'.format(
-            static_url=settings.STATIC_URL,
-            data_dir=static_asset_path or data_directory
-        )),
-        replace_static_url,
-        text
-    )
+    def __call__(self, text):
+        """
+        Return `text` with its urls replaced.
+        """
+        return self._regex.sub(self._replace_url, text)
+
+
+def course_url_rewriter(course_id, data_directory, static_asset_path, jump_to_id_base_url):
+    """
+    Return the `CourseUrlRewriter` for the course, reusing it while this process runs.
+    """
+    key = (course_id, data_directory, static_asset_path, jump_to_id_base_url)
+    rewriter = _url_rewriters.get(key)
+    if rewriter is None:
+        if len(_url_rewriters) >= MAX_URL_REWRITERS:
+            _url_rewriters.clear()
+        rewriter = _url_rewriters[key] = CourseUrlRewriter(
+            course_id, data_directory, static_asset_path, jump_to_id_base_url
+        )
+    return rewriter
@@ -1,8 +1,8 @@
 import re
 
 from nose.tools import assert_equals, assert_true, assert_false  # pylint: disable=E0611
-from static_replace import (replace_static_urls, replace_course_urls,
-                            _url_replace_regex)
+from static_replace import (replace_static_urls, replace_course_urls, replace_jump_to_id_urls,
+                            _url_replace_regex, CourseUrlRewriter)
 from mock import patch, Mock
 
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
@@ -125,3 +125,41 @@ def test_regex():
     for s in no:
         print 'Should not match: {0!r}'.format(s)
         assert_false(re.match(regex, s))
+
+
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_course_url_rewriter(mock_modulestore, mock_storage):
+    """
+    Make sure the rewriter replaces urls as the replace functions do one after the other
+    """
+    mock_storage.exists.return_value = False
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+    jump_to_id_base_url = '/courses/org/course/run/jump_to_id/'
+    rewriter = CourseUrlRewriter(COURSE_KEY, DATA_DIRECTORY, '', jump_to_id_base_url)
+
+    text = '''<img src="/static/file.png"/><a href='/course/info'>info</a>
+        <a href="/jump_to_id/problem">problem</a><a href="/static/file.png?raw">raw</a>'''
+    expected = replace_jump_to_id_urls(
+        replace_course_urls(replace_static_urls(text, DATA_DIRECTORY, COURSE_KEY), COURSE_KEY),
+        COURSE_KEY,
+        jump_to_id_base_url
+    )
+    assert_equals(expected, rewriter(text))
+    assert_equals(expected, rewriter(rewriter(text)))
+
+
+@patch('static_replace.StaticContent')
+@patch('static_replace.modulestore')
+def test_course_url_rewriter_memoizes(mock_modulestore, mock_static_content):
+    """
+    Make sure the rewriter resolves each static url, and the course's modulestore type, once
+    """
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+    mock_static_content.convert_legacy_static_url_with_course_id.return_value = "c4x://mock_url"
+    rewriter = CourseUrlRewriter(COURSE_KEY, DATA_DIRECTORY, '', '/jump_to_id/')
+
+    assert_equals('"c4x://mock_url" "c4x://mock_url"', rewriter(STATIC_SOURCE + ' ' + STATIC_SOURCE))
+    assert_equals('"c4x://mock_url"', rewriter(STATIC_SOURCE))
+    mock_static_content.convert_legacy_static_url_with_course_id.assert_called_once_with('file.png', COURSE_KEY)
+    assert_equals(mock_modulestore.return_value.get_modulestore_type.call_count, 1)
@@ -0,0 +1,211 @@
+"""
+Event tracker backend that buffers events in memory, and sends them to
+another backend in batches, from a background thread.
+
+The backend it wraps is configured like any other::
+
+  TRACKING_BACKENDS = {
+      'mongo': {
+          'ENGINE': 'track.backends.buffered.BufferedBackend',
+          'OPTIONS': {
+              'backend': {
+                  'ENGINE': 'track.backends.mongodb.MongoBackend',
+                  'OPTIONS': {...}
+              },
+              'max_batch_size': 100,
+              'max_batch_age': 1.0,
+              'max_queue_size': 10000,
+          }
+      }
+  }
+
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger('track.backends.buffered')
+
+
+class BufferedBackend(BaseBackend):
+    """
+    Event tracker backend that queues events, and sends them to another
+    backend's `send_many` in batches.
+
+    A batch is sent as soon as there are `max_batch_size` events queued,
+    or when the oldest queued event has waited `max_batch_age` seconds.
+    If `max_queue_size` events are already queued, new events are dropped
+    (and counted in `dropped`), rather than slowing down the requests
+    which send them. Queued events are sent when the process exits.
+
+    A process forked from one with events queued doesn't send them: they
+    are still queued in, and sent by, the process it was forked from.
+
+    """
+
+    def __init__(self, backend, max_batch_size=100, max_batch_age=1.0, max_queue_size=10000, **kwargs):
+        """
+        :Parameters:
+
+          - `backend`: the backend to send the events to, as a dict with
+            the 'ENGINE' and 'OPTIONS' of its configuration.
+          - `max_batch_size`: the most events to send at once
+          - `max_batch_age`: the most seconds an event waits to be sent
+          - `max_queue_size`: the most events to keep queued
+
+        """
+        super(BufferedBackend, self).__init__(**kwargs)
+
+        # The tracker module imports the backends, so import it late.
+        from track.tracker import _instantiate_backend_from_name  # pylint: disable=protected-access
+        self.backend = _instantiate_backend_from_name(backend['ENGINE'], backend.get('OPTIONS', {}))
+
+        self.max_batch_size = max_batch_size
+        self.max_batch_age = max_batch_age
+        self.max_queue_size = max_queue_size
+
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._sending = 0
+        self._closed = False
+        self._pid = None
+        self._thread = None
+
+        atexit.register(self.close)
+
+    def send(self, event):
+        """Queue the event to be sent."""
+        with self._condition:
+            self._forget_parent_events()
+            if self._closed:
+                self._drop(event)
+                return
+            if len(self._queue) >= self.max_queue_size:
+                self._drop(event)
+                return
+            self._start_thread()
+            if not self._queue:
+                self._oldest = time.time()
+            self._queue.append(event)
+            if len(self._queue) >= self.max_batch_size:
+                self._condition.notify_all()
+
+    def _drop(self, event):  # pylint: disable=unused-argument
+        """Count an event that couldn't be queued."""
+        self.dropped += 1
+        dog_stats_api.increment('track.send.buffered.dropped')
+
+    def _forget_parent_events(self):
+        """
+        If this process was forked from the one that queued the events,
+        drop them, so that they aren't sent twice. Must be called with the
+        condition held.
+        """
+        if self._pid is None or self._pid == os.getpid():
+            return
+        self._pid = None
+        self._thread = None
+        self._queue.clear()
+        self._oldest = None
+        self._sending = 0
+
+    def _start_thread(self):
+        """
+        Start the thread that sends the batches, if this process hasn't
+        started it. Must be called with the condition held, after
+        `_forget_parent_events`.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._sending = 0
+        self._thread = threading.Thread(target=self._run, name='track-buffered-backend')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next_batch(self, wait=True):
+        """
+        Take the next batch of events off the queue, waiting until one is
+        due if `wait`. Returns an empty list once the backend is closed and
+        its queue is empty. Must be called with the condition held.
+        """
+        while wait and not self._closed:
+            if len(self._queue) >= self.max_batch_size:
+                break
+            if self._queue:
+                timeout = self._oldest + self.max_batch_age - time.time()
+                if timeout <= 0:
+                    break
+            else:
+                timeout = None
+            self._condition.wait(timeout)
+
+        batch = []
+        while self._queue and len(batch) < self.max_batch_size:
+            batch.append(self._queue.popleft())
+        self._oldest = time.time() if self._queue else None
+        self._sending += len(batch)
+        return batch
+
+    def _send_batch(self, batch):
+        """Send a batch of events to the wrapped backend."""
+        try:
+            with dog_stats_api.timer('track.send.buffered.batch'):
+                self.backend.send_many(batch)
+        except Exception:  # pylint: disable=broad-except
+            # The events are lost, as they would have been if they had
+            # been sent one at a time.
+            log.exception('Error sending a batch of %d events', len(batch))
+        finally:
+            with self._condition:
+                self._sending -= len(batch)
+                self._condition.notify_all()
+
+    def _run(self):
+        """Send batches as they become due, until the backend is closed."""
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+            if not batch:
+                return
+            self._send_batch(batch)
+
+    def flush(self):
+        """
+        Send all the queued events now, and wait until they have been sent.
+        """
+        with self._condition:
+            self._forget_parent_events()
+        while True:
+            with self._condition:
+                batch = self._next_batch(wait=False)
+            if not batch:
+                break
+            self._send_batch(batch)
+        with self._condition:
+            # Wait for any batch this process's thread is sending.
+            while self._sending:
+                self._condition.wait()
+
+    def close(self):
+        """
+        Send all the queued events, and stop sending events: any events
+        sent from now on are dropped.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()
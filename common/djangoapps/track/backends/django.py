@@ -81,3 +81,17 @@ class DjangoBackend(BaseBackend):
             tldat.save(using=self.name)
         except Exception as e:  # pylint: disable=broad-except
             log.exception(e)
+
+    def send_many(self, events):
+        """
+        Save the events with a single query. If that fails, e.g. because of
+        one bad event, save them one at a time, so that only the bad ones are
+        lost.
+        """
+        tldats = [TrackingLog(**{x: event.get(x, '') for x in LOGFIELDS}) for event in events]
+        try:
+            TrackingLog.objects.using(self.name).bulk_create(tldats)
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception(e)
+            for event in events:
+                self.send(event)
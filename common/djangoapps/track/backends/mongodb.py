@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 import logging
 
+from bson.errors import BSONError
 import pymongo
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
@@ -95,3 +96,25 @@ class MongoBackend(BaseBackend):
             # during the next event.
             msg = 'Error inserting to MongoDB event tracker backend'
             log.exception(msg)
+
+    def send_many(self, events):
+        """
+        Insert the events in to the Mongo collection, all at once.
+
+        The insert carries on past the events the database rejects. If an
+        event can't be encoded, which fails the whole insert before it's
+        sent, the events are inserted one at a time, so that only the bad
+        ones are lost.
+        """
+        try:
+            self.collection.insert(events, manipulate=False, continue_on_error=True)
+        except BSONError:
+            for event in events:
+                try:
+                    self.send(event)
+                except BSONError:
+                    msg = 'Error encoding event for MongoDB event tracker backend'
+                    log.exception(msg)
+        except PyMongoError:
+            msg = 'Error inserting to MongoDB event tracker backend'
+            log.exception(msg)
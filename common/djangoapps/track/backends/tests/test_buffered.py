@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+
+from django.test import TestCase
+
+from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
+
+
+def memory_backend(**options):
+    """The configuration of a MemoryBackend, to be wrapped by a BufferedBackend"""
+    return {
+        'ENGINE': '{}.MemoryBackend'.format(__name__),
+        'OPTIONS': options,
+    }
+
+
+class TestBufferedBackend(TestCase):
+    def make_backend(self, **options):
+        backend = BufferedBackend(memory_backend(), **options)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_wrapped_backend(self):
+        backend = BufferedBackend(memory_backend(flag=True))
+        self.assertIsInstance(backend.backend, MemoryBackend)
+        self.assertTrue(backend.backend.flag)
+
+    def test_sent_in_batches(self):
+        backend = self.make_backend(max_batch_size=3, max_batch_age=60)
+        events = [{'test': i} for i in xrange(7)]
+
+        for event in events:
+            backend.send(event)
+        self.assertTrue(backend.backend.wait_for(6))
+        backend.flush()
+
+        self.assertEqual(backend.backend.batches, [events[0:3], events[3:6], events[6:7]])
+
+    def test_sent_when_old(self):
+        backend = self.make_backend(max_batch_size=100, max_batch_age=0.01)
+
+        backend.send({'test': 1})
+        self.assertTrue(backend.backend.wait_for(1))
+
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+
+    def test_bounded_queue(self):
+        backend = self.make_backend(max_batch_size=100, max_batch_age=60, max_queue_size=5)
+
+        for i in xrange(8):
+            backend.send({'test': i})
+        self.assertEqual(backend.dropped, 3)
+        backend.flush()
+
+        self.assertEqual(backend.backend.batches, [[{'test': i} for i in xrange(5)]])
+
+    def test_close(self):
+        backend = self.make_backend(max_batch_size=100, max_batch_age=60)
+
+        backend.send({'test': 1})
+        backend.close()
+        backend.send({'test': 2})
+
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+        self.assertEqual(backend.dropped, 1)
+
+    def test_errors_logged(self):
+        backend = self.make_backend(max_batch_size=1, max_batch_age=60)
+        backend.backend.fail = True
+
+        backend.send({'test': 1})
+        backend.flush()
+        backend.backend.fail = False
+        backend.send({'test': 2})
+        backend.flush()
+
+        self.assertEqual(backend.backend.batches, [[{'test': 2}]])
+
+    def test_fork(self):
+        backend = self.make_backend(max_batch_size=100, max_batch_age=60)
+        backend.send({'test': 1})
+
+        pid = os.fork()
+        if pid == 0:
+            # Only the events the child queued are sent by it
+            try:
+                backend.send({'test': 2})
+                backend.flush()
+                os._exit(0 if backend.backend.batches == [[{'test': 2}]] else 1)  # pylint: disable=protected-access
+            finally:
+                os._exit(2)  # pylint: disable=protected-access
+        __, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+        backend.flush()
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+
+
+class MemoryBackend(BaseBackend):
+    """Keeps the batches of events it's sent in a list"""
+    def __init__(self, **options):
+        super(MemoryBackend, self).__init__(**options)
+        self.flag = options.get('flag', False)
+        self.fail = False
+        self.batches = []
+        self.condition = threading.Condition()
+
+    def send(self, event):
+        self.send_many([event])
+
+    def send_many(self, events):
+        if self.fail:
+            raise Exception('Failed to save events')
+        with self.condition:
+            self.batches.append(list(events))
+            self.condition.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        """Wait until at least `count` events have been sent"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while sum(len(batch) for batch in self.batches) < count and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+            return sum(len(batch) for batch in self.batches) >= count
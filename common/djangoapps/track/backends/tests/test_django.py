@@ -23,3 +23,30 @@ class TestDjangoBackend(TestCase):
 
         # Check if time is stored in UTC
         self.assertEqual(str(results[0].time), '2013-01-01 17:01:00+00:00')
+
+    def test_django_backend_send_many(self):
+        events = [
+            {'username': 'first', 'time': '2013-01-01T12:01:00-05:00'},
+            {'username': 'second', 'time': '2013-01-01T12:02:00-05:00'},
+        ]
+        with self.assertNumQueries(1):
+            self.backend.send_many(events)
+
+        self.assertEqual(
+            sorted(tracking_log.username for tracking_log in TrackingLog.objects.all()),
+            ['first', 'second']
+        )
+
+    def test_django_backend_send_many_bad_event(self):
+        events = [
+            {'username': 'first', 'time': '2013-01-01T12:01:00-05:00'},
+            {'username': 'bad', 'time': 'not a time'},
+            {'username': 'third', 'time': '2013-01-01T12:03:00-05:00'},
+        ]
+        self.backend.send_many(events)
+
+        # Only the bad event is lost
+        self.assertEqual(
+            sorted(tracking_log.username for tracking_log in TrackingLog.objects.all()),
+            ['first', 'third']
+        )
@@ -2,7 +2,8 @@ from __future__ import absolute_import
 
 from uuid import uuid4
 
-from mock import patch
+from bson.errors import InvalidDocument
+from mock import call, patch
 
 from django.test import TestCase
 
@@ -38,3 +39,30 @@ class TestMongoBackend(TestCase):
 
         self.assertEqual(events[0], first_argument(calls[0]))
         self.assertEqual(events[1], first_argument(calls[1]))
+
+    def test_mongo_backend_send_many(self):
+        events = [{'test': 1}, {'test': 2}]
+
+        self.backend.send_many(events)
+
+        # The events are inserted all at once
+
+        self.backend.collection.insert.assert_called_once_with(events, manipulate=False, continue_on_error=True)
+
+    def test_mongo_backend_send_many_bad_event(self):
+        events = [{'test': 1}, {'test': object()}, {'test': 3}]
+
+        def insert(documents, **kwargs):  # pylint: disable=unused-argument
+            # Like pymongo, fail to encode the whole batch when one event can't be
+            if isinstance(documents, list) or documents is events[1]:
+                raise InvalidDocument('cannot encode object')
+        self.backend.collection.insert.side_effect = insert
+
+        self.backend.send_many(events)
+
+        # The events are inserted one at a time once the batch fails
+        self.assertEqual(
+            self.backend.collection.insert.mock_calls,
+            [call(events, manipulate=False, continue_on_error=True)] +
+            [call(event, manipulate=False) for event in events]
+        )
@@ -157,6 +157,14 @@ def replace_static_urls(data_dir, block, view, frag, context, course_id=None, st
     ))
 
 
+def replace_urls(url_rewriter, block, view, frag, context):  # pylint: disable=unused-argument
+    """
+    Substitutes the /static/, /course/ and /jump_to_id/ urls in the fragment's content in
+    a single pass, using a :class:`static_replace.CourseUrlRewriter`.
+    """
+    return wrap_fragment(frag, url_rewriter(frag.content))
+
+
 def grade_histogram(module_id):
     '''
     Print out a histogram of grades on a given problem in staff member debug info.
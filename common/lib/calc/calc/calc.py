@@ -228,85 +228,271 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     if math_expr.strip() == "":
         return float('nan')
 
-    # Parse the tree.
-    math_interpreter = ParseAugmenter(math_expr, case_sensitive)
-    math_interpreter.parse_algebra()
+    return compile_expression(math_expr, case_sensitive).evaluate(variables, functions)
 
-    # Get our variables together.
-    all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
 
-    # ...and check them
-    math_interpreter.check_variables(all_variables, all_functions)
+# How many compiled expressions to keep. Grading a formula problem compiles
+# the instructor's answer and each student's answer once.
+MAX_COMPILED_EXPRESSIONS = 1000
+_compiled_expressions = {}
 
-    # Create a recursion to evaluate the tree.
-    if case_sensitive:
-        casify = lambda x: x
-    else:
-        casify = lambda x: x.lower()  # Lowercase for case insens.
 
-    evaluate_actions = {
-        'number': eval_number,
-        'variable': lambda x: all_variables[casify(x[0])],
-        'function': lambda x: all_functions[casify(x[0])](x[1]),
-        'atom': eval_atom,
-        'power': eval_power,
-        'parallel': eval_parallel,
-        'product': eval_product,
-        'sum': eval_sum
-    }
+def compile_expression(math_expr, case_sensitive=False):
+    """
+    Return the `CompiledExpression` for `math_expr`, parsing it only once.
 
-    return math_interpreter.reduce_tree(evaluate_actions)
+    Raises the pyparsing `ParseException` if it doesn't parse.
+    """
+    key = (math_expr, case_sensitive)
+    expression = _compiled_expressions.get(key)
+    if expression is None:
+        if len(_compiled_expressions) >= MAX_COMPILED_EXPRESSIONS:
+            _compiled_expressions.clear()
+        expression = _compiled_expressions[key] = CompiledExpression(math_expr, case_sensitive)
+    return expression
 
 
-class ParseAugmenter(object):
+class CompiledExpression(object):
     """
-    Holds the data for a particular parse.
+    A math expression, parsed once into a tree of functions which can evaluate
+    it for any values of its variables.
 
-    Retains the `math_expr` and `case_sensitive` so they needn't be passed
-    around method to method.
-    Eventually holds the parse tree and sets of variables as well.
+    Evaluating it gives the same results as `evaluator` always has: each node
+    of the tree is computed by the same evaluation action, from the values of
+    its children and its operators.
     """
     def __init__(self, math_expr, case_sensitive=False):
+        self.math_expr = math_expr
+        self.case_sensitive = case_sensitive
+        if math_expr.strip() == "":
+            self.variables_used = self.functions_used = frozenset()
+            self._evaluate = self._evaluate_vector = lambda all_variables, all_functions: float('nan')
+            return
+
+        math_interpreter = ParseAugmenter(math_expr, case_sensitive)
+        math_interpreter.parse_algebra()
+        self.variables_used = frozenset(math_interpreter.variables_used)
+        self.functions_used = frozenset(math_interpreter.functions_used)
+        self._check_variables = math_interpreter.check_variables
+        self._evaluate = self._compile_node(math_interpreter.tree, COMPILED_ACTIONS, apply_function)
+        self._evaluate_vector = self._compile_node(math_interpreter.tree, VECTOR_ACTIONS, apply_function_vector)
+
+    def _compile_node(self, node, actions, function_applier):
         """
-        Create the ParseAugmenter for a given math expression string.
+        Return a function of (all_variables, all_functions) computing the value
+        of the parse tree `node`, or `node` itself if it's a terminal (string).
 
-        Do the parsing later, when called like `OBJ.parse_algebra()`.
+        The nodes other than numbers, variables and functions are computed by
+        `actions`, and functions are applied by `function_applier`.
         """
-        self.case_sensitive = case_sensitive
-        self.math_expr = math_expr
-        self.tree = None
-        self.variables_used = set()
-        self.functions_used = set()
+        if not isinstance(node, ParseResults):
+            return node
 
-        def vpa(tokens):
-            """
-            When a variable is recognized, store it in `variables_used`.
-            """
-            varname = tokens[0][0]
-            self.variables_used.add(varname)
+        if self.case_sensitive:
+            casify = lambda x: x
+        else:
+            casify = lambda x: x.lower()  # Lowercase for case insens.
 
-        def fpa(tokens):
+        node_name = node.getName()
+        if node_name == 'number':
+            value = eval_number(node)
+            return lambda all_variables, all_functions: value
+        elif node_name == 'variable':
+            name = casify(node[0])
+            return lambda all_variables, all_functions: all_variables[name]
+        elif node_name == 'function':
+            name = casify(node[0])
+            argument = self._compile_node(node[1], actions, function_applier)
+            return lambda all_variables, all_functions: function_applier(
+                all_functions[name], argument(all_variables, all_functions)
+            )
+
+        action = actions[node_name]
+        kids = [self._compile_node(k, actions, function_applier) for k in node]
+        if all(callable(kid) for kid in kids):
+            return lambda all_variables, all_functions: action([kid(all_variables, all_functions) for kid in kids])
+
+        def evaluate_node(all_variables, all_functions):
             """
-            When a function is recognized, store it in `functions_used`.
+            Evaluate the node's children, leaving its operators as they are.
             """
-            varname = tokens[0][0]
-            self.functions_used.add(varname)
-
-        self.variable_parse_action = vpa
-        self.function_parse_action = fpa
+            return action([
+                kid(all_variables, all_functions) if callable(kid) else kid
+                for kid in kids
+            ])
+        return evaluate_node
 
-    def parse_algebra(self):
+    def evaluate(self, variables, functions):
         """
-        Parse an algebraic expression into a tree.
+        Evaluate the expression with the given variables and unary functions,
+        as `evaluator` would.
+        """
+        # Get our variables together.
+        all_variables, all_functions = add_defaults(variables, functions, self.case_sensitive)
+        if self.variables_used or self.functions_used:
+            # ...and check them
+            self._check_variables(all_variables, all_functions)
+        return self._evaluate(all_variables, all_functions)
+
+    def evaluate_many(self, variables_list, functions):
+        """
+        Evaluate the expression for each of the dicts of variables in
+        `variables_list`, with the given unary functions, and return the list
+        of results.
+
+        The samples are evaluated together, as NumPy arrays. If that raises
+        an error, or gives any sample a result that isn't finite (so perhaps
+        the result of dividing by zero, or of a function outside its domain),
+        they're evaluated one at a time with `evaluate` instead. So the results,
+        and the errors raised, are those that `evaluate` gives for each sample.
+        """
+        variables_list = list(variables_list)
+        results = None
+        if len(variables_list) > 1:
+            results = self._evaluate_together(variables_list, functions)
+        if results is None:
+            results = [self.evaluate(variables, functions) for variables in variables_list]
+        return results
+
+    def _evaluate_together(self, variables_list, functions):
+        """
+        Evaluate the expression for all of `variables_list` at once, for
+        `evaluate_many`. Returns None if that doesn't give a finite result
+        for each of them.
+        """
+        names = set(variables_list[0])
+        if any(set(variables) != names for variables in variables_list):
+            return None
+        samples = len(variables_list)
+        variables = {}
+        for name in names:
+            values = numpy.array([sample[name] for sample in variables_list])
+            if values.dtype.kind not in 'fc':
+                return None
+            variables[name] = values
+
+        all_variables, all_functions = add_defaults(variables, functions, self.case_sensitive)
+        if self.variables_used or self.functions_used:
+            self._check_variables(all_variables, all_functions)
+
+        try:
+            with numpy.errstate(all='ignore'):
+                results = numpy.asarray(self._evaluate_vector(all_variables, all_functions))
+                if results.ndim == 0:
+                    # it doesn't depend on the variables
+                    results = numpy.array([results] * samples)
+                if results.shape != (samples,) or not numpy.isfinite(results).all():
+                    return None
+        except Exception:  # pylint: disable=broad-except
+            return None
+        return results.tolist()
+
+
+def apply_function(function, argument):
+    """
+    Apply a unary function to the value of its argument.
+    """
+    return function(argument)
 
-        Store a `pyparsing.ParseResult` in `self.tree` with proper groupings to
-        reflect parenthesis and order of operations. Leave all operators in the
-        tree and do not parse any strings of numbers into their float versions.
 
-        Adding the groups and result names makes the `repr()` of the result
-        really gross. For debugging, use something like
-          print OBJ.tree.asXML()
-        """
+def apply_function_vector(function, argument):
+    """
+    Apply a unary function to an array of values of its argument. NumPy's
+    functions take the whole array; others are applied to each value.
+    """
+    if isinstance(function, numpy.ufunc) or numpy.ndim(argument) == 0:
+        return function(argument)
+    return numpy.array([function(value) for value in argument])
+
+
+# The evaluation actions for the nodes of a CompiledExpression, other than
+# numbers, variables and functions, which are compiled specially.
+COMPILED_ACTIONS = {
+    'atom': eval_atom,
+    'power': eval_power,
+    'parallel': eval_parallel,
+    'product': eval_product,
+    'sum': eval_sum
+}
+
+
+# The following evaluation actions are like those above, but they work on
+# NumPy arrays of values, as well as on numbers.
+
+def eval_atom_vector(parse_result):
+    """
+    Return the value wrapped by the atom, like `eval_atom`.
+    """
+    return next(k for k in parse_result if not isinstance(k, basestring))
+
+
+def eval_power_vector(parse_result):
+    """
+    Exponentiate, right to left, like `eval_power`.
+    """
+    parse_result = reversed([k for k in parse_result if not isinstance(k, basestring)])
+    return reduce(lambda a, b: b ** a, parse_result)
+
+
+def eval_parallel_vector(parse_result):
+    """
+    Compute values according to the parallel resistors operator, like
+    `eval_parallel`, giving NaN where any of the inputs is zero.
+    """
+    if len(parse_result) == 1:
+        return parse_result[0]
+    values = [k for k in parse_result if not isinstance(k, basestring)]
+    has_zero = reduce(numpy.logical_or, [numpy.equal(value, 0) for value in values])
+    result = 1. / sum(1. / value for value in values)
+    return numpy.where(has_zero, float('nan'), result)
+
+
+def eval_sum_vector(parse_result):
+    """
+    Add the inputs, keeping in mind their sign, like `eval_sum`.
+    """
+    total = 0.0
+    current_op = operator.add
+    for token in parse_result:
+        if isinstance(token, basestring):
+            current_op = operator.sub if token == '-' else operator.add
+        else:
+            total = current_op(total, token)
+    return total
+
+
+def eval_product_vector(parse_result):
+    """
+    Multiply the inputs, like `eval_product`.
+    """
+    prod = 1.0
+    current_op = operator.mul
+    for token in parse_result:
+        if isinstance(token, basestring):
+            current_op = operator.truediv if token == '/' else operator.mul
+        else:
+            prod = current_op(prod, token)
+    return prod
+
+
+VECTOR_ACTIONS = {
+    'atom': eval_atom_vector,
+    'power': eval_power_vector,
+    'parallel': eval_parallel_vector,
+    'product': eval_product_vector,
+    'sum': eval_sum_vector
+}
+
+
+_algebra_grammar = None
+
+
+def algebra_grammar():
+    """
+    Return the pyparsing grammar of algebraic expressions, building it only once.
+    """
+    global _algebra_grammar  # pylint: disable=global-statement
+    if _algebra_grammar is None:
         # 0.33 or 7 or .34 or 16.
         number_part = Word(nums)
         inner_number = (number_part + Optional("." + Optional(number_part))) | ("." + number_part)
@@ -333,11 +519,9 @@ class ParseAugmenter(object):
         # and may contain numbers afterward.
         inner_varname = Word(alphas + "_", alphanums + "_")
         varname = Group(inner_varname)("variable")
-        varname.setParseAction(self.variable_parse_action)
 
         # Same thing for functions.
         function = Group(inner_varname + Suppress("(") + expr + Suppress(")"))("function")
-        function.setParseAction(self.function_parse_action)
 
         atom = number | function | varname | "(" + expr + ")"
         atom = Group(atom)("atom")
@@ -357,7 +541,63 @@ class ParseAugmenter(object):
 
         # Finish the recursion.
         expr << sum_term  # pylint: disable=W0104
-        self.tree = (expr + stringEnd).parseString(self.math_expr)[0]
+        _algebra_grammar = expr + stringEnd
+    return _algebra_grammar
+
+
+class ParseAugmenter(object):
+    """
+    Holds the data for a particular parse.
+
+    Retains the `math_expr` and `case_sensitive` so they needn't be passed
+    around method to method.
+    Eventually holds the parse tree and sets of variables as well.
+    """
+    def __init__(self, math_expr, case_sensitive=False):
+        """
+        Create the ParseAugmenter for a given math expression string.
+
+        Do the parsing later, when called like `OBJ.parse_algebra()`.
+        """
+        self.case_sensitive = case_sensitive
+        self.math_expr = math_expr
+        self.tree = None
+        self.variables_used = set()
+        self.functions_used = set()
+
+    def parse_algebra(self):
+        """
+        Parse an algebraic expression into a tree.
+
+        Store a `pyparsing.ParseResult` in `self.tree` with proper groupings to
+        reflect parenthesis and order of operations. Leave all operators in the
+        tree and do not parse any strings of numbers into their float versions.
+        Store the names of the variables and functions it uses in
+        `self.variables_used` and `self.functions_used`.
+
+        Adding the groups and result names makes the `repr()` of the result
+        really gross. For debugging, use something like
+          print OBJ.tree.asXML()
+        """
+        self.tree = algebra_grammar().parseString(self.math_expr)[0]
+        self.variables_used = set()
+        self.functions_used = set()
+        self._find_names(self.tree)
+
+    def _find_names(self, node):
+        """
+        Add the names of the variables and functions in the tree `node` to
+        `self.variables_used` and `self.functions_used`.
+        """
+        if not isinstance(node, ParseResults):
+            return
+        node_name = node.getName()
+        if node_name == 'variable':
+            self.variables_used.add(node[0])
+        elif node_name == 'function':
+            self.functions_used.add(node[0])
+        for kid in node:
+            self._find_names(kid)
 
     def reduce_tree(self, handle_actions, terminal_converter=None):
         """
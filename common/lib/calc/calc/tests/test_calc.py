@@ -5,6 +5,7 @@ Unit tests for calc.py
 import unittest
 import numpy
 import calc
+from mock import patch
 from pyparsing import ParseException
 
 # numpy's default behavior when it evaluates a function outside its domain
@@ -558,3 +559,76 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Test that calc.compile_expression parses once, and evaluates like calc.evaluator
+    """
+
+    def setUp(self):
+        super(CompiledExpressionTest, self).setUp()
+        calc.calc._compiled_expressions.clear()  # pylint: disable=protected-access
+
+    def test_parsed_once(self):
+        with patch.object(calc.ParseAugmenter, 'parse_algebra', autospec=True,
+                          side_effect=calc.ParseAugmenter.parse_algebra) as parse_algebra:
+            results = [calc.evaluator({'x': x}, {}, "x^2 + 2*x") for x in xrange(5)]
+            expression = calc.compile_expression("x^2 + 2*x")
+        self.assertEqual(parse_algebra.call_count, 1)
+        self.assertEqual(results, [0, 3, 8, 15, 24])
+        self.assertEqual(expression.evaluate({'x': 5}, {}), 35)
+
+    def test_cache_key(self):
+        self.assertIs(calc.compile_expression("R1*r1"), calc.compile_expression("R1*r1"))
+        expression = calc.compile_expression("R1*r1", case_sensitive=True)
+        self.assertIsNot(expression, calc.compile_expression("R1*r1"))
+        self.assertEqual(expression.variables_used, set(['R1', 'r1']))
+        self.assertEqual(expression.evaluate({'R1': 2, 'r1': 3}, {}), 6)
+
+    def test_variables_checked(self):
+        expression = calc.compile_expression("f(x) + y")
+        self.assertEqual(expression.functions_used, set(['f']))
+        self.assertEqual(expression.evaluate({'x': 1, 'y': 2}, {'f': lambda x: 3 * x}), 5)
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'f y'):
+            expression.evaluate({'x': 1}, {})
+
+    def test_empty(self):
+        self.assertTrue(numpy.isnan(calc.compile_expression("  ").evaluate({}, {})))
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseException):
+            calc.compile_expression("5+(")
+
+    def test_evaluate_many(self):
+        expression = calc.compile_expression("sin(x)^2 + x||y - 3*y/x + e^z")
+        samples = [{'x': x, 'y': y, 'z': 1.5 - x} for x, y in [(1.5, 2), (-2.25, 0.5), (3, 7.25), (0.5, -1)]]
+        expected = [expression.evaluate(sample, {}) for sample in samples]
+        results = expression.evaluate_many(samples, {})
+        self.assertEqual(len(results), len(expected))
+        for result, value in zip(results, expected):
+            self.assertAlmostEqual(result, value)
+
+    def test_evaluate_many_complex(self):
+        expression = calc.compile_expression("x*j + f(y)")
+        samples = [{'x': 1.0 + 1j, 'y': 2.0}, {'x': -2.0, 'y': 3.0}]
+        results = expression.evaluate_many(samples, {'f': lambda y: y + 1})
+        self.assertEqual(results, [2 + 1j, 4 - 2j])
+
+    def test_evaluate_many_constant(self):
+        expression = calc.compile_expression("2^3 + pi")
+        self.assertEqual(expression.evaluate_many([{'x': 1.0}, {'x': 2.0}], {}), [8 + numpy.pi] * 2)
+        self.assertEqual(expression.evaluate_many([], {}), [])
+
+    def test_evaluate_many_like_scalar(self):
+        # Samples whose results aren't finite, or raise errors, are evaluated one at a time
+        expression = calc.compile_expression("1/x")
+        with self.assertRaises(ZeroDivisionError):
+            expression.evaluate_many([{'x': 1.0}, {'x': 0.0}], {})
+        results = calc.compile_expression("x||y").evaluate_many([{'x': 1.0, 'y': 1.0}, {'x': 0.0, 'y': 1.0}], {})
+        self.assertEqual(results[0], 0.5)
+        self.assertTrue(numpy.isnan(results[1]))
+        with self.assertRaisesRegexp(ValueError, 'factorial'):
+            calc.compile_expression("fact(x)").evaluate_many([{'x': 2.0}, {'x': -1.5}], {})
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'y'):
+            calc.compile_expression("x + y").evaluate_many([{'x': 1.0}, {'x': 2.0}], {})
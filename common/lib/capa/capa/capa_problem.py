@@ -13,11 +13,14 @@ Main module which shows problems (of "capa" type).
 This is used by capa_module.
 """
 
+from collections import OrderedDict
 from copy import deepcopy
 from datetime import datetime
+import hashlib
 import logging
 import os.path
 import re
+import threading
 
 from lxml import etree
 from pytz import UTC
@@ -58,6 +61,12 @@ html_problem_semantics = [
 
 log = logging.getLogger(__name__)
 
+# The number of parsed problems kept by each process (see ParsedProblem)
+PARSED_PROBLEM_CACHE_SIZE = 1000
+
+# The number of script contexts (one per seed and student) kept for each parsed problem
+PARSED_PROBLEM_CONTEXT_CACHE_SIZE = 20
+
 #-----------------------------------------------------------------------------
 # main class for this module
 
@@ -110,6 +119,139 @@ class LoncapaSystem(object):
         self.matlab_api_key = matlab_api_key
 
 
+class ParsedProblem(object):
+    """
+    The part of constructing a LoncapaProblem which doesn't depend on the seed or the student:
+    the problem's xml tree, with the ids of its responses, inputs and solutions assigned.
+    Problems which don't include files are cached by the process (see `get`), so the xml of each
+    problem is only parsed once. Each LoncapaProblem works on its own copy of the tree.
+
+    The contexts produced by running the problem's scripts are kept too (see `get_context`), so
+    a problem rebuilt for the same seed and student doesn't run its scripts again.
+    """
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, tree, responses):
+        """
+        tree: the problem's xml tree
+        responses: a list, for each response in the tree, of a tuple of its position in
+            `tree.iter()` and the positions of its inputfields
+        """
+        self.tree = tree
+        self.responses = responses
+        self._contexts = OrderedDict()
+
+    @classmethod
+    def get(cls, problem_text, problem_id, process_includes):
+        """
+        Return the ParsedProblem for the problem with xml `problem_text` and id `problem_id`,
+        parsing it only if it isn't cached.
+
+        process_includes: a function handling the <include> tags of the tree passed to it in place
+        """
+        text = problem_text.encode('utf-8') if isinstance(problem_text, unicode) else problem_text
+        key = (hashlib.sha1(text).hexdigest(), problem_id)
+        with cls._cache_lock:
+            parsed = cls._cache.pop(key, None)
+            if parsed is not None:
+                cls._cache[key] = parsed
+                return parsed
+
+        tree = etree.XML(problem_text)
+        has_includes = tree.find('.//include') is not None
+        if has_includes:
+            process_includes(tree)
+        parsed = cls(tree, cls._assign_ids(tree, problem_id))
+
+        # the included files may change, so problems including them are parsed every time
+        if not has_includes:
+            with cls._cache_lock:
+                cls._cache[key] = parsed
+                while len(cls._cache) > PARSED_PROBLEM_CACHE_SIZE:
+                    cls._cache.popitem(last=False)
+        return parsed
+
+    @staticmethod
+    def _assign_ids(tree, problem_id):
+        """
+        Assign ids to all the responses, their inputs (textline, schematic, etc.) and solutions
+        in tree, in place. Returns the positions of the responses and their inputfields (see
+        __init__).
+        """
+        response_positions = []
+        response_id = 1
+        for response in tree.xpath('//' + "|//".join(responsetypes.registry.registered_tags())):
+            response_id_str = problem_id + "_" + str(response_id)
+            # create and save ID for this response
+            response.set('id', response_id_str)
+            response_id += 1
+
+            answer_id = 1
+            input_tags = inputtypes.registry.registered_tags()
+            inputfields = tree.xpath(
+                "|".join(['//' + response.tag + '[@id=$id]//' + x for x in (input_tags + solution_tags)]),
+                id=response_id_str
+            )
+
+            # assign one answer_id for each input type or solution type
+            for entry in inputfields:
+                entry.attrib['response_id'] = str(response_id)
+                entry.attrib['answer_id'] = str(answer_id)
+                entry.attrib['id'] = "%s_%i_%i" % (problem_id, response_id, answer_id)
+                answer_id = answer_id + 1
+
+            response_positions.append((response, inputfields))
+
+        # <solution>...</solution> may not be associated with any specific response; give
+        # IDs for those separately
+        # TODO: We should make the namespaces consistent and unique (e.g. %s_problem_%i).
+        solution_id = 1
+        for solution in tree.findall('.//solution'):
+            solution.attrib['id'] = "%s_solution_%i" % (problem_id, solution_id)
+            solution_id += 1
+
+        positions = {element: position for position, element in enumerate(tree.iter())}
+        return [
+            (positions[response], [positions[entry] for entry in inputfields])
+            for response, inputfields in response_positions
+        ]
+
+    def copy(self):
+        """
+        Return a copy of the tree, and a list of tuples of each response in the copy and
+        its inputfields.
+        """
+        tree = deepcopy(self.tree)
+        elements = list(tree.iter())
+        return tree, [
+            (elements[response], [elements[entry] for entry in inputfields])
+            for response, inputfields in self.responses
+        ]
+
+    def get_context(self, key):
+        """
+        Return a copy of the script context stored for `key` by `set_context`, or None.
+        """
+        with self._cache_lock:
+            context = self._contexts.pop(key, None)
+            if context is None:
+                return None
+            self._contexts[key] = context
+        return deepcopy(context)
+
+    def set_context(self, key, context):
+        """
+        Store a copy of the script context for `key`, which must identify everything the
+        problem's scripts were run with (seed, student, python path and files).
+        """
+        context = deepcopy(context)
+        with self._cache_lock:
+            self._contexts[key] = context
+            while len(self._contexts) > PARSED_PROBLEM_CONTEXT_CACHE_SIZE:
+                self._contexts.popitem(last=False)
+
+
 class LoncapaProblem(object):
     """
     Main class for capa Problems.
@@ -159,20 +301,18 @@ class LoncapaProblem(object):
         problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
         self.problem_text = problem_text
 
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
-
-        # handle any <include file="foo"> tags
-        self._process_includes()
+        # parse problem XML file into an element tree, handling any <include file="foo">
+        # tags, and add ID's to it (or copy the cached result of doing so)
+        parsed = ParsedProblem.get(problem_text, self.problem_id, self._process_includes)
+        self.tree, responses = parsed.copy()
 
         # construct script processor context (eg for customresponse problems)
-        self.context = self._extract_context(self.tree)
+        self.context = self._extract_context(self.tree, parsed)
 
-        # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
-        # transformations.  This also creates the dict (self.responders) of Response
-        # instances for each question in the problem. The dict has keys = xml subtree of
-        # Response, values = Response instance
-        self._preprocess_problem(self.tree)
+        # Pre-parse the XML tree: performs some in-place transformations.  This also
+        # creates the dict (self.responders) of Response instances for each question
+        # in the problem. The dict has keys = xml subtree of Response, values = Response instance
+        self._preprocess_problem(self.tree, responses)
 
         if not self.student_answers:  # True when student_answers is an empty dict
             self.set_initial_display()
@@ -529,12 +669,12 @@ class LoncapaProblem(object):
 
     # ======= Private Methods Below ========
 
-    def _process_includes(self):
+    def _process_includes(self, tree):
         """
         Handle any <include file="foo"> tags by reading in the specified file and inserting it
-        into our XML tree.  Fail gracefully if debugging.
+        into the XML tree.  Fail gracefully if debugging.
         """
-        includes = self.tree.findall('.//include')
+        includes = tree.findall('.//include')
         for inc in includes:
             filename = inc.get('file')
             if filename is not None:
@@ -613,13 +753,16 @@ class LoncapaProblem(object):
 
         return path
 
-    def _extract_context(self, tree):
+    def _extract_context(self, tree, parsed=None):
         """
         Extract content of <script>...</script> from the problem.xml file, and exec it in the
         context of this problem.  Provides ability to randomize problems, and also set
         variables for problem answer checking.
 
         Problem XML goes to Python execution context. Runs everything in script tags.
+
+        If `parsed` (the problem's ParsedProblem) is given, a context it has kept for the
+        same seed, student and files is used instead of running the scripts again.
         """
         context = {}
         context['seed'] = self.seed
@@ -654,21 +797,35 @@ class LoncapaProblem(object):
                 extra_files.append(("python_lib.zip", zip_lib))
                 python_path.append("python_lib.zip")
 
-            try:
-                safe_exec(
-                    all_code,
-                    context,
-                    random_seed=self.seed,
-                    python_path=python_path,
-                    extra_files=extra_files,
-                    cache=self.capa_system.cache,
-                    slug=self.problem_id,
-                    unsafely=self.capa_system.can_execute_unsafe_code(),
-                )
-            except Exception as err:
-                log.exception("Error while execing script code: " + all_code)
-                msg = "Error while executing script code: %s" % str(err).replace('<', '&lt;')
-                raise responsetypes.LoncapaProblemError(msg)
+            unsafely = self.capa_system.can_execute_unsafe_code()
+            context_key = (
+                self.seed,
+                self.capa_system.anonymous_student_id,
+                tuple(python_path),
+                hashlib.sha1(zip_lib).hexdigest() if zip_lib is not None else None,
+                unsafely,
+            )
+            cached_context = parsed.get_context(context_key) if parsed is not None else None
+            if cached_context is not None:
+                context = cached_context
+            else:
+                try:
+                    safe_exec(
+                        all_code,
+                        context,
+                        random_seed=self.seed,
+                        python_path=python_path,
+                        extra_files=extra_files,
+                        cache=self.capa_system.cache,
+                        slug=self.problem_id,
+                        unsafely=unsafely,
+                    )
+                except Exception as err:
+                    log.exception("Error while execing script code: " + all_code)
+                    msg = "Error while executing script code: %s" % str(err).replace('<', '&lt;')
+                    raise responsetypes.LoncapaProblemError(msg)
+                if parsed is not None:
+                    parsed.set_context(context_key, context)
 
         # Store code source in context, along with the Python path needed to run it correctly.
         context['script_code'] = all_code
@@ -774,39 +931,19 @@ class LoncapaProblem(object):
 
         return tree
 
-    def _preprocess_problem(self, tree):  # private
+    def _preprocess_problem(self, tree, responses):  # private
         """
-        Assign IDs to all the responses
-        Assign sub-IDs to all entries (textline, schematic, etc.)
         Annoted correctness and value
         In-place transformation
 
-        Also create capa Response instances for each responsetype and save as self.responders
+        Create capa Response instances for each responsetype and save as self.responders
+        (`responses` lists each response in tree and its inputfields, whose ids have been
+        assigned by ParsedProblem)
 
         Obtain all responder answers and save as self.responder_answers dict (key = response)
         """
-        response_id = 1
         self.responders = {}
-        for response in tree.xpath('//' + "|//".join(responsetypes.registry.registered_tags())):
-            response_id_str = self.problem_id + "_" + str(response_id)
-            # create and save ID for this response
-            response.set('id', response_id_str)
-            response_id += 1
-
-            answer_id = 1
-            input_tags = inputtypes.registry.registered_tags()
-            inputfields = tree.xpath(
-                "|".join(['//' + response.tag + '[@id=$id]//' + x for x in (input_tags + solution_tags)]),
-                id=response_id_str
-            )
-
-            # assign one answer_id for each input type or solution type
-            for entry in inputfields:
-                entry.attrib['response_id'] = str(response_id)
-                entry.attrib['answer_id'] = str(answer_id)
-                entry.attrib['id'] = "%s_%i_%i" % (self.problem_id, response_id, answer_id)
-                answer_id = answer_id + 1
-
+        for response, inputfields in responses:
             # instantiate capa Response
             responsetype_cls = responsetypes.registry.get_class_for_tag(response.tag)
             responder = responsetype_cls(response, inputfields, self.context, self.capa_system)
@@ -823,11 +960,3 @@ class LoncapaProblem(object):
                 log.debug('responder %s failed to properly return get_answers()',
                           self.responders[response])  # FIXME
                 raise
-
-        # <solution>...</solution> may not be associated with any specific response; give
-        # IDs for those separately
-        # TODO: We should make the namespaces consistent and unique (e.g. %s_problem_%i).
-        solution_id = 1
-        for solution in tree.findall('.//solution'):
-            solution.attrib['id'] = "%s_solution_%i" % (self.problem_id, solution_id)
-            solution_id += 1
@@ -0,0 +1,217 @@
+"""
+The program each worker of a `capa.safe_exec.worker_pool.WorkerPool` runs in the sandbox.
+
+The worker imports the modules problem code commonly uses, then repeatedly forks a child
+which waits for one job (a line of json) on stdin, runs it under the job's resource limits,
+writes its result (json) to a pipe of its own, and exits. So every job runs in a fresh copy
+of the warm interpreter, and the worker never parses the code or data of any job.
+
+Only the worker writes to its stdout: the child's stdout and stderr are /dev/null. When a job
+ends, the worker writes a line of json ending it, followed by the job's result, as the child
+wrote it (see `main`). So nothing a job does can forge the end or result of any job.
+
+This file is copied into the sandbox and run there, so it must only use the standard library.
+
+Usage: python pool_worker.py '{"preload": [...], "cpu": 1, "realtime": 1}'
+
+"""
+import errno
+import json
+import os
+import resource
+import signal
+import sys
+import traceback
+
+# The globals that can be sent back (the same as codejail sends back).
+OK_TYPES = (type(None), int, long, float, str, unicode, list, tuple, dict)
+BAD_KEYS = ("__builtins__",)
+
+# The pid of the child running the current job.
+CHILD_PID = None
+
+
+class DevNull(object):
+    """
+    A stand-in for stdout, so that the code can print without affecting the results.
+    """
+    def write(self, *args, **kwargs):
+        pass
+
+
+def jsonable(value):
+    """
+    Can `value` be sent back?
+    """
+    if not isinstance(value, OK_TYPES):
+        return False
+    try:
+        json.dumps(value)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+def read_line(fd):
+    """
+    Read a line from the file descriptor `fd`. Returns '' at the end of the file.
+    """
+    chunks = []
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith('\n'):
+            break
+    return ''.join(chunks)
+
+
+def write_all(fd, data):
+    """
+    Write all of `data` to the file descriptor `fd`.
+    """
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def run_job(cpu_limit, started_fd, result_fd):
+    """
+    Run one job, in a child of the worker, and write its result to `result_fd`. Never returns.
+    """
+    # No subprocesses, and the job's CPU limit. Neither can be raised again by the job.
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    if cpu_limit:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+
+    line = read_line(0)
+    if not line:
+        # stdin was closed: the pool is done with this worker
+        os._exit(0)  # pylint: disable=protected-access
+    # The job can't read the jobs which follow it, or write to the worker's stdout.
+    os.close(0)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.close(devnull)
+    job = json.loads(line)
+
+    # Tell the worker the job started, so that it applies the real time limit.
+    write_all(started_fd, job['token'].encode('ascii') + '\n')
+    os.close(started_fd)
+
+    result = {}
+    try:
+        os.chdir(job['dir'])
+        os.environ['TMPDIR'] = os.path.join(job['dir'], 'tmp')
+        import tempfile
+        tempfile.tempdir = None
+        sys.path.extend(job['python_path'])
+        sys.stdout = DevNull()
+
+        g_dict = job['globals']
+        exec job['code'] in g_dict  # pylint: disable=exec-used
+
+        result['globals'] = dict(
+            (key, value) for key, value in g_dict.iteritems() if key not in BAD_KEYS and jsonable(value)
+        )
+    except MemoryError:
+        result['error'] = traceback.format_exc()
+        result['breach'] = True
+    except BaseException:  # pylint: disable=broad-except
+        result['error'] = traceback.format_exc()
+
+    write_all(result_fd, json.dumps(result))
+    os._exit(0)  # pylint: disable=protected-access
+
+
+def kill_child(signum, frame):  # pylint: disable=unused-argument
+    """
+    Kill the child running the current job, which has run out of real time.
+    """
+    if CHILD_PID is not None:
+        try:
+            os.kill(CHILD_PID, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def wait_for_child(pid, result_fd, realtime_limit):
+    """
+    Read what the child `pid` writes to `result_fd` until it closes it, and wait for it to exit,
+    killing it if it runs for longer than `realtime_limit` seconds. Returns a pair: what the
+    child wrote, and its status, as returned by `os.waitpid`.
+    """
+    global CHILD_PID  # pylint: disable=global-statement
+    CHILD_PID = pid
+    if realtime_limit:
+        signal.setitimer(signal.ITIMER_REAL, realtime_limit)
+    try:
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(result_fd, 65536)
+            except OSError as err:
+                if err.errno != errno.EINTR:
+                    raise
+                continue
+            if not chunk:
+                break
+            chunks.append(chunk)
+        while True:
+            try:
+                return ''.join(chunks), os.waitpid(pid, 0)[1]
+            except OSError as err:
+                if err.errno != errno.EINTR:
+                    raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        CHILD_PID = None
+
+
+def main(options):
+    """
+    Run jobs until stdin is closed.
+
+    After each job, writes a line of json to stdout with the job's token (as "end"), the exit
+    status or signal of its child, and the "length" of its result, followed by the result.
+    """
+    for module_name in options.get('preload', ()):
+        try:
+            __import__(module_name)
+        except Exception:  # pylint: disable=broad-except
+            # the job will get the error if it uses the module
+            pass
+    signal.signal(signal.SIGALRM, kill_child)
+
+    while True:
+        started_read, started_write = os.pipe()
+        result_read, result_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(started_read)
+            os.close(result_read)
+            run_job(options.get('cpu'), started_write, result_write)
+        os.close(started_write)
+        os.close(result_write)
+
+        token = read_line(started_read).strip()
+        os.close(started_read)
+        if not token:
+            os.close(result_read)
+            os.waitpid(pid, 0)
+            break
+
+        result, status = wait_for_child(pid, result_read, options.get('realtime'))
+        os.close(result_read)
+        end = {'end': token, 'exit': None, 'signal': None, 'length': len(result)}
+        if os.WIFSIGNALED(status):
+            end['signal'] = os.WTERMSIG(status)
+        else:
+            end['exit'] = os.WEXITSTATUS(status)
+        write_all(1, json.dumps(end) + '\n' + result)
+        del result
+
+
+if __name__ == '__main__':
+    main(json.loads(sys.argv[1]))
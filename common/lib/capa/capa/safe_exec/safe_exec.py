@@ -4,9 +4,13 @@ from codejail.safe_exec import safe_exec as codejail_safe_exec
 from codejail.safe_exec import not_safe_exec as codejail_not_safe_exec
 from codejail.safe_exec import json_safe, SafeExecException
 from . import lazymod
+from . import worker_pool
 from dogapi import dog_stats_api
 
+from collections import OrderedDict
+from contextlib import contextmanager
 import hashlib
+import threading
 
 # Establish the Python environment for Capa.
 # Capa assumes float-friendly division always.
@@ -70,6 +74,241 @@ def update_hash(hasher, obj):
         hasher.update(repr(obj))
 
 
+# The code which runs the jobs of a SafeExecBatch in one sandboxed execution.
+# Each job gets its own globals, and the globals it returns are filtered just as
+# codejail filters the globals of one execution. The jobs share an interpreter,
+# so after each job its state is put back as it was: the modules loaded, the
+# globals of each (including the builtins), sys.path and the working directory.
+# Modules are snapshotted as soon as they are first imported, so a module one
+# job imports stays loaded, unchanged, for the jobs after it. numpy's global
+# random state is reseeded, as it is in each new process.
+BATCH_CODE = """\
+import __builtin__
+import json
+import os
+import sys
+import traceback
+
+MISSING = object()
+
+def json_safe(d):
+    ok_types = (type(None), int, long, float, str, unicode, list, tuple, dict)
+    jd = {}
+    for k, v in d.iteritems():
+        if not isinstance(v, ok_types) or k == "__builtins__":
+            continue
+        try:
+            json.dumps(v)
+        except Exception:
+            continue
+        jd[k] = v
+    return jd
+
+class Snapshot(object):
+    def __init__(self):
+        self.modules = {}
+        self.path = list(sys.path)
+        self.cwd = os.getcwd()
+        self.add_new_modules()
+
+    def add_new_modules(self):
+        for name, module in sys.modules.items():
+            if name in self.modules:
+                continue
+            module_dict = getattr(module, "__dict__", None)
+            if isinstance(module_dict, dict):
+                module_dict = dict(module_dict)
+            else:
+                module_dict = None
+            self.modules[name] = (module, module_dict)
+            # A new submodule is an attribute of its package.
+            parent, _, child = name.rpartition(".")
+            if module is not None and parent in self.modules and self.modules[parent][1] is not None:
+                self.modules[parent][1][child] = module
+
+    def restore(self):
+        for name in sys.modules.keys():
+            if name not in self.modules:
+                del sys.modules[name]
+        for name, (module, saved) in self.modules.iteritems():
+            if sys.modules.get(name, MISSING) is not module:
+                sys.modules[name] = module
+            if saved is None:
+                continue
+            current = module.__dict__
+            try:
+                # Quick, since the values of an unchanged module are identical.
+                if current == saved:
+                    continue
+            except Exception:
+                pass
+            for key in [key for key in current if key not in saved]:
+                del current[key]
+            for key, value in saved.iteritems():
+                if current.get(key, MISSING) is not value:
+                    current[key] = value
+        sys.path[:] = self.path
+        os.chdir(self.cwd)
+        if "numpy.random" in sys.modules:
+            sys.modules["numpy.random"].seed()
+
+real_import = __builtin__.__import__
+import_depth = [0]
+
+def snapshot_import(*args, **kwargs):
+    # Modules are only complete once the outermost import is done.
+    import_depth[0] += 1
+    try:
+        return real_import(*args, **kwargs)
+    finally:
+        import_depth[0] -= 1
+        if not import_depth[0]:
+            snapshot.add_new_modules()
+
+def run_jobs(jobs):
+    results = []
+    for code, g_dict in jobs:
+        try:
+            exec compile(code, "<jailed code>", "exec", 0, True) in g_dict
+        except BaseException:
+            results.append([traceback.format_exc(), None])
+        else:
+            results.append([None, json_safe(g_dict)])
+        snapshot.restore()
+    return results
+
+__builtin__.__import__ = snapshot_import
+snapshot = Snapshot()
+try:
+    batch_results = run_jobs(batch_jobs)
+finally:
+    __builtin__.__import__ = real_import
+del batch_jobs
+"""
+
+# The SafeExecBatch, if any, that safe_exec calls in this thread go through.
+_local = threading.local()
+
+
+class SafeExecDeferred(BaseException):
+    """
+    Raised by `safe_exec` in place of running code that a `SafeExecBatch` is recording.
+
+    It isn't an `Exception`, so that it passes through the code between `safe_exec` and the
+    caller which is recording, rather than being handled as an error in the executed code.
+    """
+    pass
+
+
+class SafeExecBatch(object):
+    """
+    Runs many `safe_exec` calls together, in a single sandboxed execution.
+
+    While a batch is `recording`, a call to `safe_exec` which it has no result for is recorded,
+    and raises `SafeExecDeferred` rather than running. `run` then runs all the calls recorded
+    so far, one sandboxed execution for each set of calls that share a Python path. While the
+    batch is `replaying`, calls to `safe_exec` which it has results for get those results, and
+    other calls run as usual. Calls which run `unsafely` aren't batched: they run in this
+    process, so there's no sandbox to share.
+
+    So doing some work once while recording, running the batch, and doing it again while
+    replaying, runs the code it needs together, with the same results. Work that needs the
+    results of some code to know what other code to run can record and run more than once.
+    """
+    def __init__(self):
+        self._pending = OrderedDict()
+        self._results = {}
+        self._unbatchable = set()
+        self._recording = False
+
+    @contextmanager
+    def _current(self, recording):
+        """
+        Make this the batch that `safe_exec` calls go through, while in the `with` block.
+        """
+        previous = getattr(_local, 'batch', None)
+        _local.batch = self
+        self._recording = recording
+        try:
+            yield self
+        finally:
+            _local.batch = previous
+            self._recording = False
+
+    def recording(self):
+        """
+        Record the `safe_exec` calls made in the `with` block, rather than running them.
+        """
+        return self._current(recording=True)
+
+    def replaying(self):
+        """
+        Give `safe_exec` calls made in the `with` block the results this batch has for them.
+        """
+        return self._current(recording=False)
+
+    def _get(self, key):
+        """
+        Return the result for the call with cache key `key`, or None if there's none.
+        """
+        return self._results.get(key)
+
+    def _record(self, key, code, globals_dict, random_seed, python_path, extra_files, unsafely):
+        """
+        Record a call, and return True, if recording and the call can be batched.
+        """
+        if not self._recording or unsafely or key in self._unbatchable:
+            return False
+        group = (tuple(python_path or ()), tuple(tuple(f) for f in extra_files or ()))
+        self._pending[key] = (group, CODE_PROLOG % random_seed + LAZY_IMPORTS + code, json_safe(globals_dict))
+        return True
+
+    def run(self, slug=None):
+        """
+        Run the recorded calls, and return how many there were.
+
+        If the execution of a set of calls fails as a whole (say, because together they use
+        more than the sandbox's limit on CPU time), those calls are run separately when next
+        made, rather than batched.
+        """
+        groups = OrderedDict()
+        for key, (group, code, globals_dict) in self._pending.iteritems():
+            groups.setdefault(group, []).append((key, code, globals_dict))
+        count = len(self._pending)
+        self._pending.clear()
+
+        for (python_path, extra_files), jobs in groups.iteritems():
+            batch_globals = {'batch_jobs': [[code, globals_dict] for _, code, globals_dict in jobs]}
+            try:
+                with dog_stats_api.timer('capa.safe_exec.batch.time'):
+                    _exec_fn(False)(
+                        BATCH_CODE, batch_globals,
+                        python_path=list(python_path), extra_files=list(extra_files) or None, slug=slug,
+                    )
+                results = batch_globals['batch_results']
+            except (SafeExecException, KeyError):
+                self._unbatchable.update(key for key, _, _ in jobs)
+                continue
+            for (key, _, _), (emsg, cleaned_results) in zip(jobs, results):
+                if emsg:
+                    emsg = "Couldn't execute jailed code: {}".format(emsg)
+                self._results[key] = (emsg, cleaned_results or {})
+        return count
+
+
+def _exec_fn(unsafely):
+    """
+    Return the codejail function to execute code with.
+    """
+    pool = worker_pool.get_pool()
+    if unsafely:
+        return codejail_not_safe_exec
+    elif pool is not None:
+        return pool.safe_exec
+    else:
+        return codejail_safe_exec
+
+
 @dog_stats_api.timed('capa.safe_exec.time')
 def safe_exec(
     code,
@@ -105,15 +344,22 @@ def safe_exec(
     caller, that will be used in log messages.
 
     If `unsafely` is true, then the code will actually be executed without sandboxing.
+    Otherwise, if a worker pool is configured (see `worker_pool.configure`), the code
+    is executed by one of its warm sandboxed workers.
+
+    If a `SafeExecBatch` is recording or replaying, the call goes through it.
 
     """
-    # Check the cache for a previous result.
-    if cache:
+    batch = getattr(_local, 'batch', None)
+    if cache or batch is not None:
         safe_globals = json_safe(globals_dict)
         md5er = hashlib.md5()
         md5er.update(repr(code))
         update_hash(md5er, safe_globals)
         key = "safe_exec.%r.%s" % (random_seed, md5er.hexdigest())
+
+    # Check the cache for a previous result.
+    if cache:
         cached = cache.get(key)
         if cached is not None:
             # We have a cached result.  The result is a pair: the exception
@@ -124,25 +370,33 @@ def safe_exec(
                 raise SafeExecException(emsg)
             return
 
-    # Create the complete code we'll run.
-    code_prolog = CODE_PROLOG % random_seed
+    batched = None
+    if batch is not None:
+        batched = batch._get(key)  # pylint: disable=protected-access
+        if batched is None and batch._record(  # pylint: disable=protected-access
+                key, code, globals_dict, random_seed, python_path, extra_files, unsafely
+        ):
+            raise SafeExecDeferred()
 
-    # Decide which code executor to use.
-    if unsafely:
-        exec_fn = codejail_not_safe_exec
+    if batched is not None:
+        # The batch ran the code, with the same results as running it now.
+        emsg, cleaned_results = batched
+        globals_dict.update(cleaned_results)
+        e = SafeExecException(emsg)
     else:
-        exec_fn = codejail_safe_exec
+        # Create the complete code we'll run.
+        code_prolog = CODE_PROLOG % random_seed
 
-    # Run the code!  Results are side effects in globals_dict.
-    try:
-        exec_fn(
-            code_prolog + LAZY_IMPORTS + code, globals_dict,
-            python_path=python_path, extra_files=extra_files, slug=slug,
-        )
-    except SafeExecException as e:
-        emsg = e.message
-    else:
-        emsg = None
+        # Run the code!  Results are side effects in globals_dict.
+        try:
+            _exec_fn(unsafely)(
+                code_prolog + LAZY_IMPORTS + code, globals_dict,
+                python_path=python_path, extra_files=extra_files, slug=slug,
+            )
+        except SafeExecException as e:
+            emsg = e.message
+        else:
+            emsg = None
 
     # Put the result back in the cache.  This is complicated by the fact that
     # the globals dict might not be entirely serializable.
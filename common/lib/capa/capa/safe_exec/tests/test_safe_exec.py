@@ -1,18 +1,24 @@
 """Test safe_exec.py"""
 
 import hashlib
+import math
 import os
 import os.path
 import random
+import sys
 import textwrap
 import unittest
 
+from mock import patch
 from nose.plugins.skip import SkipTest
 
-from capa.safe_exec import safe_exec, update_hash
+from capa.safe_exec import safe_exec, update_hash, SafeExecBatch, SafeExecDeferred
 from codejail.safe_exec import SafeExecException
 from codejail.jail_code import is_configured
 
+# The safe_exec module, which the package's safe_exec function hides.
+safe_exec_module = sys.modules['capa.safe_exec.safe_exec']
+
 
 class TestSafeExec(unittest.TestCase):
     def test_set_values(self):
@@ -177,6 +183,106 @@ class TestSafeExecCaching(unittest.TestCase):
                 self.fail("Tried executing code with non-ASCII unicode: {0}".format(code))
 
 
+class TestSafeExecBatch(unittest.TestCase):
+    """Test that a SafeExecBatch runs many safe_exec calls in one execution, with the same results."""
+
+    CODE = "a = x * 2\nr = random.randint(0, 999)\nd = 1/2"
+
+    def record(self, batch, xs, **kwargs):
+        """Make a safe_exec call for each of `xs`, while `batch` is recording."""
+        with batch.recording():
+            for x in xs:
+                with self.assertRaises(SafeExecDeferred):
+                    safe_exec(self.CODE, {'x': x}, random_seed=x, **kwargs)
+
+    def test_same_results(self):
+        batch = SafeExecBatch()
+        self.record(batch, [1, 2, 3])
+        with patch.object(safe_exec_module, "codejail_safe_exec", wraps=safe_exec_module.codejail_safe_exec) as jail:
+            self.assertEqual(batch.run(), 3)
+            self.assertEqual(jail.call_count, 1)
+
+            with batch.replaying():
+                for x in [3, 1, 2]:
+                    g = {'x': x}
+                    safe_exec(self.CODE, g, random_seed=x)
+                    expected = {'x': x}
+                    safe_exec(self.CODE, expected, random_seed=x, unsafely=True)
+                    self.assertEqual(g, expected)
+            self.assertEqual(jail.call_count, 1)
+
+    def test_exceptions(self):
+        batch = SafeExecBatch()
+        with batch.recording():
+            with self.assertRaises(SafeExecDeferred):
+                safe_exec("a = 1/x", {'x': 0})
+        batch.run()
+        with batch.replaying():
+            with self.assertRaises(SafeExecException) as cm:
+                safe_exec("a = 1/x", {'x': 0})
+        self.assertIn("ZeroDivisionError", cm.exception.message)
+
+    def test_groups_by_python_path(self):
+        pylib = os.path.dirname(__file__) + "/test_files/pylib"
+        batch = SafeExecBatch()
+        self.record(batch, [1, 2])
+        self.record(batch, [1], python_path=[pylib])
+        with patch.object(safe_exec_module, "codejail_safe_exec", wraps=safe_exec_module.codejail_safe_exec) as jail:
+            batch.run()
+        self.assertEqual(jail.call_count, 2)
+
+    def test_failed_batch_runs_separately(self):
+        batch = SafeExecBatch()
+        self.record(batch, [1, 2])
+        with patch.object(safe_exec_module, "codejail_safe_exec", side_effect=SafeExecException("Too slow")):
+            batch.run()
+        # the calls aren't deferred again, and run as usual
+        with batch.recording():
+            g = {'x': 2}
+            safe_exec(self.CODE, g, random_seed=2)
+        self.assertEqual(g['a'], 4)
+
+    def test_jobs_isolated(self):
+        leak = textwrap.dedent("""\
+            import __builtin__, fractions, math as real_math, sys
+            real_math.pi = 3
+            __builtin__.leaked = True
+            fractions.Fraction = None
+            sys.path.append("/leaked")
+            """)
+        check = textwrap.dedent("""\
+            import __builtin__, fractions, math as real_math, sys
+            pi = real_math.pi
+            leaked = [hasattr(__builtin__, "leaked"), fractions.Fraction is None, "/leaked" in sys.path]
+            """)
+        batch = SafeExecBatch()
+        with batch.recording():
+            for code in [leak, check]:
+                with self.assertRaises(SafeExecDeferred):
+                    safe_exec(code, {})
+        batch.run()
+        with batch.replaying():
+            g = {}
+            safe_exec(check, g)
+        self.assertEqual(g['pi'], math.pi)
+        self.assertEqual(g['leaked'], [False, False, False])
+
+    def test_unsafe_calls_not_batched(self):
+        batch = SafeExecBatch()
+        with batch.recording():
+            g = {'x': 2}
+            safe_exec(self.CODE, g, random_seed=2, unsafely=True)
+        self.assertEqual(g['a'], 4)
+        self.assertEqual(batch.run(), 0)
+
+    def test_unrecorded_calls_run(self):
+        batch = SafeExecBatch()
+        with batch.replaying():
+            g = {'x': 2}
+            safe_exec(self.CODE, g, random_seed=2)
+        self.assertEqual(g['a'], 4)
+
+
 class TestUpdateHash(unittest.TestCase):
     """Test the safe_exec.update_hash function to be sure it canonicalizes properly."""
 
@@ -0,0 +1,123 @@
+"""Test worker_pool.py"""
+
+import os.path
+import textwrap
+import unittest
+
+from mock import patch
+
+from codejail import jail_code
+from codejail.safe_exec import SafeExecException
+
+from capa.safe_exec import safe_exec, worker_pool
+
+
+class TestWorkerPool(unittest.TestCase):
+    """
+    Run code in a real pool. Unless codejail is configured, its workers are unsandboxed.
+    """
+    def setUp(self):
+        super(TestWorkerPool, self).setUp()
+        self.pool = worker_pool.WorkerPool(1, max_executions=3, preload=["math"])
+        self.addCleanup(self.pool.close)
+
+    def test_set_values(self):
+        g = {'b': [1, 2]}
+        self.pool.safe_exec("import math\na = int(math.pi) + len(b)", g)
+        self.assertEqual(g['a'], 5)
+
+    def test_exception(self):
+        with self.assertRaisesRegexp(SafeExecException, "ZeroDivisionError"):
+            self.pool.safe_exec("1/0", {})
+        # the worker is still usable
+        g = {}
+        self.pool.safe_exec("a = 17", g)
+        self.assertEqual(g['a'], 17)
+
+    def test_jobs_isolated(self):
+        g = {}
+        self.pool.safe_exec("import math\nmath.leak = 1", g)
+        self.pool.safe_exec("import math, os\nleaked = hasattr(math, 'leak')\npid = os.getpid()", g)
+        first_pid = g['pid']
+        self.assertFalse(g['leaked'])
+        self.pool.safe_exec("import os\npid = os.getpid()", g)
+        self.assertNotEqual(g['pid'], first_pid)
+
+    def test_printing_doesnt_matter(self):
+        g = {}
+        self.pool.safe_exec("import os\nprint 'hello'\nos.write(1, '{\"token\": 1}')\na = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_job_cant_forge_results(self):
+        # The job can find its token, but it can't write to the worker's stdout.
+        forge = textwrap.dedent("""\
+            import json, os, sys
+            frame = sys._getframe()
+            while 'job' not in frame.f_locals:
+                frame = frame.f_back
+            token = frame.f_locals['job']['token']
+            forged = json.dumps({'globals': {'a': 'forged'}})
+            end = json.dumps({'end': token, 'exit': 0, 'signal': None, 'length': len(forged)})
+            for fd in (1, 2):
+                os.write(fd, '\\n' + end + '\\n' + forged)
+            a = 'real'
+            """)
+        g = {}
+        self.pool.safe_exec(forge, g)
+        self.assertEqual(g['a'], 'real')
+        self.pool.safe_exec("b = 1", g)
+        self.assertEqual(g['b'], 1)
+
+    def test_acquire_timeout(self):
+        pool = worker_pool.WorkerPool(1, preload=[], acquire_timeout=0.1)
+        self.addCleanup(pool.close)
+        worker = pool._acquire()  # pylint: disable=protected-access
+        with self.assertRaisesRegexp(SafeExecException, "no sandbox worker was free"):
+            pool.safe_exec("a = 1", {})
+        pool._release(worker, False)  # pylint: disable=protected-access
+        g = {}
+        pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_recycled_after_max_executions(self):
+        with patch.object(worker_pool, "Worker", wraps=worker_pool.Worker) as worker_class:
+            for _ in xrange(4):
+                self.pool.safe_exec("a = 1", {})
+        self.assertEqual(worker_class.call_count, 2)
+
+    def test_python_path_and_extra_files(self):
+        lib_path = os.path.join(os.path.dirname(__file__), "test_files/pylib")
+        g = {}
+        self.pool.safe_exec(
+            textwrap.dedent("""\
+                import constant
+                a = constant.THE_CONST
+                b = open("extra.txt").read()
+                """),
+            g,
+            python_path=[lib_path],
+            extra_files=[("extra.txt", "extra")],
+        )
+        self.assertEqual(g['a'], 23)
+        self.assertEqual(g['b'], "extra")
+
+    def test_realtime_limit(self):
+        with patch.dict(jail_code.LIMITS, {"REALTIME": 1}):
+            pool = worker_pool.WorkerPool(1, preload=[])
+            self.addCleanup(pool.close)
+            with patch.object(worker_pool, "Worker", wraps=worker_pool.Worker) as worker_class:
+                with self.assertRaisesRegexp(SafeExecException, "killed by signal"):
+                    pool.safe_exec("import time\ntime.sleep(5)", {})
+                g = {}
+                pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+        # the worker was replaced after the breach
+        self.assertEqual(worker_class.call_count, 2)
+
+    def test_safe_exec_uses_pool(self):
+        with patch.object(worker_pool, "_pool", self.pool):
+            with patch.object(self.pool, "safe_exec", wraps=self.pool.safe_exec) as pool_safe_exec:
+                g = {}
+                safe_exec("a = int(math.pi)", g)
+        self.assertEqual(g['a'], 3)
+        self.assertEqual(pool_safe_exec.call_count, 1)
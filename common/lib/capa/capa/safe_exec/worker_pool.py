@@ -0,0 +1,396 @@
+"""
+A pool of warm sandboxed Python workers for capa's safe_exec.
+
+Starting a sandboxed Python process and importing numpy and friends into it costs much more
+than running most problem code. A pool keeps a few sandboxed workers running (see
+pool_worker.py). Each has the modules problem code commonly uses imported, and runs each job
+in a freshly forked copy of itself, with the same resource limits codejail applies, so jobs
+are as isolated from each other as they are when each runs in its own sandboxed process.
+
+Workers are replaced after `max_executions` jobs, and whenever a job breaches a resource limit.
+
+If codejail isn't configured for Python, the workers run unsandboxed, like codejail's
+not_safe_exec, which is how the pool runs in development and tests.
+
+"""
+import json
+import logging
+import os
+import os.path
+import resource
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from codejail import jail_code
+from codejail.safe_exec import json_safe, SafeExecException
+
+from . import pool_worker
+
+log = logging.getLogger(__name__)
+
+# How many jobs a worker runs before it's replaced.
+DEFAULT_MAX_EXECUTIONS = 100
+
+# The modules the workers import before running any job.
+DEFAULT_PRELOAD = [
+    "numpy",
+    "math",
+    "scipy",
+    "calc",
+    "eia",
+    "chem.chemcalc",
+    "chem.chemtools",
+    "chem.miller",
+    "verifiers.draganddrop",
+]
+
+# How many seconds a worker may take to answer, beyond the job's real time limit, before it's
+# considered stuck and killed.
+WORKER_GRACE_TIME = 10
+
+# How many seconds a job waits for a worker to be free before it fails.
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+# We'll need the code from pool_worker.py in the sandbox, so read it now.
+pool_worker_py_file = pool_worker.__file__
+if pool_worker_py_file.endswith("c"):
+    pool_worker_py_file = pool_worker_py_file[:-1]
+
+pool_worker_py = open(pool_worker_py_file).read()
+
+
+def _copy_into(path, directory):
+    """
+    Copy the file or directory at `path` into `directory`.
+    """
+    dest = os.path.join(directory, os.path.basename(path))
+    if os.path.isdir(path):
+        shutil.copytree(path, dest)
+    else:
+        shutil.copy(path, dest)
+
+
+class Worker(object):
+    """
+    One running pool_worker.py process, sandboxed if codejail is configured for Python.
+    """
+    def __init__(self, preload):
+        self.executions = 0
+        self.sandboxed = jail_code.is_configured("python")
+        self.limits = dict(jail_code.LIMITS)
+
+        self.homedir = tempfile.mkdtemp(prefix="codejail-pool-")
+        # Make directory readable by other users ('sandbox' user needs to be able to read it).
+        os.chmod(self.homedir, 0775)
+        with open(os.path.join(self.homedir, "pool_worker.py"), "w") as worker_file:
+            worker_file.write(pool_worker_py)
+
+        options = json.dumps({
+            'preload': preload,
+            'cpu': self.limits.get("CPU"),
+            'realtime': self.limits.get("REALTIME"),
+        })
+        if self.sandboxed:
+            command = jail_code.COMMANDS["python"]
+            cmd = []
+            if command['user']:
+                cmd.extend(['sudo', '-u', command['user']])
+            cmd.extend(command['cmdline_start'])
+            env = {}
+        else:
+            # Like not_safe_exec, unsandboxed code gets our Python path.
+            cmd = [sys.executable, '-B']
+            env = {'PYTHONPATH': os.pathsep.join(sys.path)}
+        cmd.extend(["pool_worker.py", options])
+
+        with open(os.devnull, "w") as devnull:
+            self.process = subprocess.Popen(
+                cmd,
+                cwd=self.homedir,
+                env=env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+                preexec_fn=self._set_process_limits,
+                close_fds=True,
+            )
+        self._stdout = self.process.stdout.fileno()
+        self._buffer = ""
+
+    def _set_process_limits(self):
+        """
+        Apply codejail's limits on memory and file writes to the worker. The CPU and real time
+        limits are applied to each job by the worker itself. Unlike codejail, the worker must be
+        able to fork, but each job is prevented from doing so.
+        """
+        vmem = self.limits.get("VMEM")
+        if vmem:
+            resource.setrlimit(resource.RLIMIT_AS, (vmem, vmem))
+        if "FSIZE" in self.limits:
+            fsize = self.limits["FSIZE"]
+            resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+
+    @property
+    def alive(self):
+        """
+        Is the worker process still running?
+        """
+        return self.process.poll() is None
+
+    def run(self, code, globals_dict, python_path=None, extra_files=None):
+        """
+        Run `code` with `globals_dict` in the worker, as codejail's `safe_exec` would.
+
+        Returns a pair: whether the job breached a resource limit (or otherwise left the worker
+        unusable), and the exception message if the job failed, else None. If the job
+        succeeded, the resulting globals are in `globals_dict`.
+        """
+        self.executions += 1
+        jobdir = tempfile.mkdtemp(prefix="job-", dir=self.homedir)
+        try:
+            os.chmod(jobdir, 0775)
+            # A world-writable subdir to use for temp files.
+            tmptmp = os.path.join(jobdir, "tmp")
+            os.mkdir(tmptmp)
+            os.chmod(tmptmp, 0777)
+
+            extra_names = set()
+            for name, contents in extra_files or ():
+                extra_names.add(name)
+                with open(os.path.join(jobdir, name), "wb") as extra_file:
+                    extra_file.write(contents)
+            sandbox_path = []
+            for pydir in python_path or ():
+                pybase = os.path.basename(pydir)
+                sandbox_path.append(pybase)
+                if pybase not in extra_names:
+                    _copy_into(pydir, jobdir)
+
+            token = uuid.uuid4().hex
+            job = json.dumps({
+                'token': token,
+                'dir': jobdir,
+                'python_path': sandbox_path,
+                'code': code,
+                'globals': json_safe(globals_dict),
+            })
+            return self._send(token, job, globals_dict)
+        finally:
+            shutil.rmtree(jobdir, ignore_errors=True)
+
+    def _send(self, token, job, globals_dict):
+        """
+        Send the job to the worker and wait for its result (see `run`).
+        """
+        realtime = self.limits.get("REALTIME") or 0
+        deadline = time.time() + realtime + WORKER_GRACE_TIME
+        try:
+            self.process.stdin.write(job + "\n")
+            self.process.stdin.flush()
+
+            # Only the worker writes to its stdout (see pool_worker.py), so anything but the end
+            # of this job means it's broken.
+            line = self._read_line(deadline)
+            try:
+                end = json.loads(line) if line else None
+            except ValueError:
+                end = None
+            if not isinstance(end, dict) or end.get('end') != token:
+                self.kill()
+                return True, "Couldn't execute jailed code: the sandbox worker died"
+            output = self._read_bytes(end['length'], deadline)
+            if output is None:
+                self.kill()
+                return True, "Couldn't execute jailed code: the sandbox worker died"
+        except (IOError, OSError):
+            self.kill()
+            return True, "Couldn't execute jailed code: the sandbox worker died"
+
+        if end['signal'] is not None:
+            return True, "Couldn't execute jailed code: killed by signal {}".format(end['signal'])
+        try:
+            result = json.loads(output) if output else None
+        except ValueError:
+            result = None
+        if not isinstance(result, dict):
+            return True, "Couldn't execute jailed code: exited with status {}".format(end['exit'])
+        if 'error' in result:
+            return result.get('breach', False), "Couldn't execute jailed code: {}".format(result['error'])
+        globals_dict.update(result.get('globals', {}))
+        return False, None
+
+    def _read_line(self, deadline):
+        """
+        Read a line from the worker, or '' if it closes its stdout or doesn't finish the line
+        before `deadline`.
+        """
+        if not self._fill(deadline, lambda: "\n" in self._buffer):
+            return ""
+        line, self._buffer = self._buffer.split("\n", 1)
+        return line + "\n"
+
+    def _read_bytes(self, length, deadline):
+        """
+        Read `length` bytes from the worker, or None if it closes its stdout or doesn't write
+        them before `deadline`.
+        """
+        if not self._fill(deadline, lambda: len(self._buffer) >= length):
+            return None
+        data, self._buffer = self._buffer[:length], self._buffer[length:]
+        return data
+
+    def _fill(self, deadline, done):
+        """
+        Read from the worker into the buffer until `done()`. Returns False if the worker closes
+        its stdout first, or `done()` is still false at `deadline`.
+        """
+        while not done():
+            timeout = deadline - time.time()
+            if timeout <= 0 or not select.select([self._stdout], [], [], timeout)[0]:
+                return False
+            chunk = os.read(self._stdout, 65536)
+            if not chunk:
+                return False
+            self._buffer += chunk
+        return True
+
+    def kill(self):
+        """
+        Kill the worker process.
+        """
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Stop the worker and clean up after it.
+        """
+        if self.alive:
+            try:
+                # the worker exits when its stdin is closed
+                self.process.stdin.close()
+            except IOError:
+                pass
+            deadline = time.time() + WORKER_GRACE_TIME
+            while self.alive and time.time() < deadline:
+                time.sleep(0.01)
+            if self.alive:
+                self.kill()
+        self.process.wait()
+        shutil.rmtree(self.homedir, ignore_errors=True)
+
+
+class WorkerPool(object):
+    """
+    A pool of up to `size` workers, each of which runs up to `max_executions` jobs.
+
+    Workers are started when they're first needed. The pool is per process: a process forked
+    from the one which started the workers starts its own. A job which can't get a worker
+    within `acquire_timeout` seconds fails.
+    """
+    def __init__(self, size, max_executions=DEFAULT_MAX_EXECUTIONS, preload=None,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.size = size
+        self.max_executions = max_executions
+        self.preload = DEFAULT_PRELOAD if preload is None else preload
+        self.acquire_timeout = acquire_timeout
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+        self._idle = []
+        self._busy = 0
+
+    def _acquire(self):
+        """
+        Return an idle worker, starting one if there's none and the pool isn't full. Raises
+        SafeExecException if none is free within `acquire_timeout` seconds.
+        """
+        deadline = time.time() + self.acquire_timeout
+        with self._condition:
+            if self._pid != os.getpid():
+                # the workers belong to the process we were forked from
+                self._pid = os.getpid()
+                self._idle = []
+                self._busy = 0
+            while not self._idle and self._busy >= self.size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    raise SafeExecException("Couldn't execute jailed code: no sandbox worker was free")
+                self._condition.wait(timeout)
+            self._busy += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Worker(self.preload)
+        except Exception:
+            with self._condition:
+                self._busy -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker, recycle):
+        """
+        Return `worker` to the pool, or stop it if `recycle` or it's used up.
+        """
+        recycle = recycle or worker.executions >= self.max_executions or not worker.alive
+        with self._condition:
+            if self._pid == os.getpid():
+                self._busy -= 1
+                if not recycle:
+                    self._idle.append(worker)
+                self._condition.notify()
+        if recycle:
+            worker.close()
+
+    def safe_exec(self, code, globals_dict, python_path=None, extra_files=None, slug=None):
+        """
+        Execute code in one of the pool's workers. A drop-in replacement for codejail's
+        `safe_exec`: the resulting globals are put into `globals_dict`, and failures raise
+        `SafeExecException`.
+        """
+        worker = self._acquire()
+        recycle = True
+        try:
+            recycle, emsg = worker.run(code, globals_dict, python_path=python_path, extra_files=extra_files)
+        finally:
+            self._release(worker, recycle)
+        if emsg:
+            if recycle:
+                log.warning("Sandbox worker recycled after job %s: %s", slug, emsg)
+            raise SafeExecException(emsg)
+
+    def close(self):
+        """
+        Stop the idle workers.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+_pool = None
+
+
+def configure(size, max_executions=DEFAULT_MAX_EXECUTIONS, preload=None, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+    """
+    Run sandboxed code in a pool of `size` warm workers (or not at all, if `size` is 0).
+    """
+    global _pool  # pylint: disable=global-statement
+    if _pool is not None:
+        _pool.close()
+    _pool = WorkerPool(size, max_executions, preload, acquire_timeout) if size else None
+
+
+def get_pool():
+    """
+    Return the configured `WorkerPool`, or None if there's none.
+    """
+    return _pool
@@ -0,0 +1,91 @@
+"""Tests of the caching of parsed capa problems."""
+
+import textwrap
+import unittest
+
+from mock import patch
+
+from . import test_capa_system, new_loncapa_problem
+from capa.capa_problem import ParsedProblem
+from capa.safe_exec import safe_exec
+
+
+class ParsedProblemTest(unittest.TestCase):
+    """Tests that problems are parsed once, and that each problem gets its own tree."""
+
+    def setUp(self):
+        super(ParsedProblemTest, self).setUp()
+        self.system = test_capa_system()
+        ParsedProblem._cache.clear()  # pylint: disable=protected-access
+        self.xml_str = textwrap.dedent("""
+            <problem>
+            <multiplechoiceresponse>
+              <choicegroup type="MultipleChoice" shuffle="true">
+                <choice correct="false">Apple</choice>
+                <choice correct="false">Banana</choice>
+                <choice correct="false">Chocolate</choice>
+                <choice correct ="true">Donut</choice>
+              </choicegroup>
+            </multiplechoiceresponse>
+            <solution><p>Donut</p></solution>
+            </problem>
+        """)
+
+    def test_parsed_once(self):
+        with patch.object(ParsedProblem, '_assign_ids', wraps=ParsedProblem._assign_ids) as assign_ids:
+            first = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=0)
+            second = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=1)
+        self.assertEqual(assign_ids.call_count, 1)
+        self.assertIsNot(first.tree, second.tree)
+        self.assertEqual(first.get_question_answers(), second.get_question_answers())
+        self.assertEqual(first.tree.find('.//solution').get('id'), '1_solution_1')
+
+    def test_trees_independent(self):
+        # shuffling 4 things with seed of 0 yields: B A C D
+        first = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=0)
+        self.assertEqual(first.responders.values()[0].unmask_order(), ['choice_1', 'choice_0', 'choice_2', 'choice_3'])
+        # the cached tree isn't shuffled
+        second = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=1)
+        self.assertNotEqual(
+            [choice.text for choice in first.tree.iter('choice')],
+            [choice.text for choice in second.tree.iter('choice')],
+        )
+        third = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=0)
+        self.assertEqual(first.get_html(), third.get_html())
+
+    def test_ids(self):
+        problem = new_loncapa_problem(self.xml_str, capa_system=self.system, seed=0)
+        other = ParsedProblem.get(self.xml_str, 'other', lambda tree: None)
+        self.assertEqual(problem.tree.find('.//choicegroup').get('id'), '1_2_1')
+        self.assertEqual(other.tree.find('.//choicegroup').get('id'), 'other_2_1')
+
+    def test_includes_not_cached(self):
+        self.system.filestore.setcontents('test_parsed_include.xml', '<test>Test include</test>')
+        self.addCleanup(self.system.filestore.remove, 'test_parsed_include.xml')
+        xml_str = "<problem><include file='test_parsed_include.xml'/></problem>"
+        new_loncapa_problem(xml_str, capa_system=self.system)
+
+        self.system.filestore.setcontents('test_parsed_include.xml', '<test>Changed include</test>')
+        problem = new_loncapa_problem(xml_str, capa_system=self.system)
+        self.assertEqual(problem.tree.find('.//test').text, 'Changed include')
+
+    def test_context_cached(self):
+        xml_str = textwrap.dedent("""
+            <problem>
+            <script type="loncapa/python">
+            value = random.randint(0, 1000)
+            </script>
+            </problem>
+        """)
+        with patch('capa.capa_problem.safe_exec', wraps=safe_exec) as mock_safe_exec:
+            first = new_loncapa_problem(xml_str, capa_system=self.system, seed=0)
+            value = first.context['value']
+            first.context['value'] = 'changed'
+            second = new_loncapa_problem(xml_str, capa_system=self.system, seed=0)
+            self.assertEqual(mock_safe_exec.call_count, 1)
+            self.assertEqual(second.context['value'], value)
+
+            new_loncapa_problem(xml_str, capa_system=self.system, seed=1)
+            self.system.anonymous_student_id = 'other'
+            new_loncapa_problem(xml_str, capa_system=self.system, seed=0)
+        self.assertEqual(mock_safe_exec.call_count, 3)
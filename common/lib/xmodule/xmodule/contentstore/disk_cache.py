@@ -0,0 +1,286 @@
+"""
+A cache of the bytes of large assets on local disk.
+
+Assets too large for memcache would otherwise be read from GridFS on every request. This cache keeps
+copies of them in a directory, bounded in total size, evicting the least recently used copies first.
+
+Each copy is named by the asset's key and the md5 of its bytes, so a copy made on one host can't be
+served once the asset is saved with other bytes on another host: the new md5 names a new copy, and the
+stale one is evicted in time.
+
+Copies are made in the background, by one thread of one process at a time, so that the requests which
+miss the cache don't wait for the whole asset to be copied.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# How long a copy being made by another process may take, before it's made again
+FILL_TIMEOUT = 60 * 60
+# How often the sizes of the copies are counted again, to take in the copies made by other processes
+RESCAN_INTERVAL = 5 * 60
+
+
+class AssetDiskCache(object):
+    """
+    Keeps copies of the bytes of assets in `directory`, evicting the least recently used ones
+    once they take more than `max_size` bytes. Only assets of at least `min_asset_size` bytes
+    are meant to be cached here; smaller ones are cached in memcache.
+
+    If `sendfile_header` is given (e.g. 'X-Sendfile', or 'X-Accel-Redirect' for nginx), the
+    content server lets the web server send the cached copies, by returning that header with
+    the copy's location: `sendfile_root` (by default, `directory`) joined with the copy's path
+    relative to `directory`.
+    """
+
+    def __init__(self, directory, max_size=10 * 1024 * 1024 * 1024, min_asset_size=1024 * 1024,
+                 sendfile_header=None, sendfile_root=None):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.min_asset_size = min_asset_size
+        self.sendfile_header = sendfile_header
+        self.sendfile_root = sendfile_root if sendfile_root is not None else self.directory
+        self._lock = threading.Lock()
+        # the threads making copies in the background, by asset key and content digest
+        self._fills = {}
+        # the last use and size of each copy, by path, and their total size: None until they're counted
+        self._copies = None
+        self._total_size = 0
+        self._counted_at = 0
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Another process made it first
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def _asset_directory(self, key):
+        """
+        Returns the directory holding the copies of the asset with the given key.
+        """
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def path(self, key, content_digest):
+        """
+        Returns the path of the copy of the asset with the given key and bytes.
+        """
+        return os.path.join(self._asset_directory(key), content_digest)
+
+    def sendfile_location(self, path):
+        """
+        Returns the location to send in the `sendfile_header` for the copy at `path`.
+        """
+        relative_path = os.path.relpath(path, self.directory)
+        return self.sendfile_root.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+
+    def open(self, key, content_digest):
+        """
+        Returns the copy of the asset with the given key and bytes, opened for reading,
+        or None if there's no such copy.
+        """
+        path = self.path(key, content_digest)
+        try:
+            cached_file = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            # mark the copy as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._record(path, os.fstat(cached_file.fileno()).st_size)
+        return cached_file
+
+    def put(self, key, content_digest, source_file):
+        """
+        Copy the bytes of the asset with the given key from `source_file`, and return the
+        copy opened for reading.
+        """
+        asset_directory = self._asset_directory(key)
+        try:
+            os.makedirs(asset_directory)
+        except OSError:
+            if not os.path.isdir(asset_directory):
+                raise
+
+        # Write to a temporary file first, so that no one reads a partial copy
+        fd, temp_path = tempfile.mkstemp(dir=asset_directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                shutil.copyfileobj(source_file, temp_file)
+            path = self.path(key, content_digest)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        cached_file = open(path, 'rb')
+        self._record(path, os.fstat(cached_file.fileno()).st_size)
+        self.evict()
+        return cached_file
+
+    def fill(self, key, content_digest, open_source):
+        """
+        Make the copy of the asset with the given key and bytes in a background thread, from the file
+        returned by `open_source`, unless this process or another one is already making it.
+        """
+        fill_key = (key, content_digest)
+        with self._lock:
+            if fill_key in self._fills:
+                return
+            marker = self._claim_fill(key, content_digest)
+            if marker is None:
+                return
+            thread = threading.Thread(target=self._fill, args=(fill_key, marker, open_source))
+            thread.daemon = True
+            self._fills[fill_key] = thread
+        thread.start()
+
+    def _claim_fill(self, key, content_digest):
+        """
+        Create the marker file which tells the other processes that the copy of the asset with the given
+        key and bytes is being made, and return its path; or return None if another process is making it.
+        """
+        asset_directory = self._asset_directory(key)
+        try:
+            os.makedirs(asset_directory)
+        except OSError:
+            if not os.path.isdir(asset_directory):
+                raise
+
+        # Starts with a '.', so it isn't taken for a copy
+        marker = os.path.join(asset_directory, '.{}.filling'.format(content_digest))
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+            try:
+                if os.stat(marker).st_mtime > time.time() - FILL_TIMEOUT:
+                    return None
+            except OSError:
+                # The other process just finished
+                return None
+            # The other process died before it finished, so take over from it
+            os.utime(marker, None)
+        return marker
+
+    def _fill(self, fill_key, marker, open_source):
+        """
+        Make the copy of the asset with the given (key, content digest), then remove the marker of the fill.
+        """
+        key, content_digest = fill_key
+        try:
+            source_file = open_source()
+            try:
+                self.put(key, content_digest, source_file).close()
+            finally:
+                source_file.close()
+        except Exception:  # pylint: disable=broad-except
+            log.exception(u"Couldn't copy %s to the asset disk cache", key)
+        finally:
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+            with self._lock:
+                del self._fills[fill_key]
+
+    def wait_for_fills(self):
+        """
+        Wait for the copies this process is making in the background to be made.
+        """
+        while True:
+            with self._lock:
+                threads = self._fills.values()
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+
+    def delete(self, key):
+        """
+        Delete all the copies of the asset with the given key.
+        """
+        asset_directory = self._asset_directory(key)
+        shutil.rmtree(asset_directory, ignore_errors=True)
+        with self._lock:
+            if self._copies is not None:
+                for path in self._copies.keys():
+                    if os.path.dirname(path) == asset_directory:
+                        self._total_size -= self._copies.pop(path)[1]
+
+    def _record(self, path, size):
+        """
+        Record that the copy at `path`, of `size` bytes, was just used.
+        """
+        with self._lock:
+            if self._copies is None:
+                # It will be counted with all the others
+                return
+            previous = self._copies.get(path)
+            self._total_size += size - (previous[1] if previous is not None else 0)
+            self._copies[path] = (time.time(), size)
+
+    def _count_copies(self):
+        """
+        Return the last use and size of each copy in the directory, by path.
+        """
+        copies = {}
+        for asset_directory, __, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith('.'):
+                    # being written
+                    continue
+                path = os.path.join(asset_directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                copies[path] = (stat.st_mtime, stat.st_size)
+        return copies
+
+    def evict(self):
+        """
+        Delete the least recently used copies until all of them take at most `max_size` bytes.
+
+        The copies' sizes are kept in memory, so the directory is only walked when they add up to more
+        than `max_size`, or every RESCAN_INTERVAL to count the copies made by other processes.
+        """
+        with self._lock:
+            if (
+                    self._copies is not None and self._total_size <= self.max_size and
+                    time.time() < self._counted_at + RESCAN_INTERVAL
+            ):
+                return
+
+        counted_at = time.time()
+        copies = self._count_copies()
+        total_size = sum(size for __, size in copies.itervalues())
+        for path, (__, size) in sorted(copies.items(), key=lambda item: item[1]):
+            if total_size <= self.max_size:
+                break
+            try:
+                # Open copies stay readable until they're closed
+                os.remove(path)
+            except OSError:
+                # Another process evicted it first
+                pass
+            else:
+                log.debug(u"Evicted %s from the asset disk cache", path)
+            del copies[path]
+            total_size -= size
+
+        with self._lock:
+            self._copies = copies
+            self._total_size = total_size
+            self._counted_at = counted_at
@@ -1,29 +1,74 @@
+import collections
+import datetime
+import functools
+import hashlib
+import posixpath
+import Queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
 import pymongo
+from pymongo.errors import DuplicateKeyError
 import gridfs
-from gridfs.errors import NoFile
+from gridfs.errors import FileExists, NoFile
 
 from xmodule.contentstore.content import XASSET_LOCATION_TAG
 
 import logging
 
 from .content import StaticContent, ContentStore, StaticContentStream
+from .disk_cache import AssetDiskCache
 from xmodule.exceptions import NotFoundError
-from fs.osfs import OSFS
 import os
 import json
+from bson.objectid import ObjectId
 from bson.son import SON
 from opaque_keys.edx.keys import AssetKey
 from xmodule.modulestore.django import ASSET_IGNORE_REGEX
 
 
+# Uploads bigger than this are spooled to disk while they're hashed
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+# How many times to try storing some content which is being stored concurrently
+STORE_CONTENT_ATTEMPTS = 5
+# Chunks of content which aren't registered this long after they were started were left by failed writes
+ORPHANED_CONTENT_AGE = datetime.timedelta(days=1)
+# How many assets to read from GridFS at once while a course's assets are exported
+EXPORT_WORKERS = 4
+# While a course's assets are streamed, assets no bigger than this are read ahead in memory
+READ_AHEAD_MAX_SIZE = 1024 * 1024
+
+
 class MongoContentStore(ContentStore):
+    """
+    Stores assets in GridFS.
+
+    The bytes of each asset are stored once per distinct content, in the `<bucket>.content` GridFS bucket,
+    with the sha1 of the bytes as their `content_hash`. Each course's assets are entries in `<bucket>.files`,
+    which hold the assets' metadata and name the content they refer to in `content_hash`. The content counts
+    the entries which refer to it in `references`, and is deleted when no entry refers to it anymore. So
+    copying a course's assets only copies their entries, and saving the same bytes again doesn't store
+    anything new.
+
+    Each content is written under a GridFS _id of its own, and only then registered under its hash by the
+    unique index on `content_hash`, so a write which fails partway, or which loses a race to store the same
+    bytes, leaves no chunks which get in the way of storing them later.
+
+    Assets saved before their content was stored this way have no `content_hash`, and keep their bytes in
+    `<bucket>.chunks`.
+    """
 
     # pylint: disable=W0613
-    def __init__(self, host, db, port=27017, user=None, password=None, bucket='fs', collection=None, **kwargs):
+    def __init__(self, host, db, port=27017, user=None, password=None, bucket='fs', collection=None,
+                 disk_cache=None, **kwargs):
         """
         Establish the connection with the mongo backend and connect to the collections
 
         :param collection: ignores but provided for consistency w/ other doc_store_config patterns
+        :param disk_cache: the options of an :class:`.AssetDiskCache` to stream large assets from, if any
         """
         logging.debug('Using MongoDB for static content serving at host={0} port={1} db={2}'.format(host, port, db))
         _db = pymongo.database.Database(
@@ -42,6 +87,14 @@ class MongoContentStore(ContentStore):
         self.fs = gridfs.GridFS(_db, bucket)
 
         self.fs_files = _db[bucket + ".files"]  # the underlying collection GridFS uses
+        self.fs_chunks = _db[bucket + ".chunks"]
+
+        content_bucket = bucket + ".content"
+        self.content_fs = gridfs.GridFS(_db, content_bucket)
+        self.content_files = _db[content_bucket + ".files"]
+        self.content_chunks = _db[content_bucket + ".chunks"]
+
+        self.disk_cache = AssetDiskCache(**disk_cache) if disk_cache is not None else None
 
     def close_connections(self):
         """
@@ -59,86 +112,289 @@ class MongoContentStore(ContentStore):
 
     def save(self, content):
         content_id, content_son = self.asset_db_key(content.location)
-
-        # The way to version files in gridFS is to not use the file id as the _id but just as the filename.
-        # Then you can upload as many versions as you like and access by date or version. Because we use
-        # the location as the _id, we must delete before adding (there's no replace method in gridFS)
-        self.delete(content_id)  # delete is a noop if the entry doesn't exist; so, don't waste time checking
+        content_hash, data = _hash_data(content.data)
 
         thumbnail_location = content.thumbnail_location.to_deprecated_list_repr() if content.thumbnail_location else None
-        with self.fs.new_file(_id=content_id, filename=unicode(content.location), content_type=content.content_type,
-                              displayname=content.name, content_son=content_son,
-                              thumbnail_location=thumbnail_location,
-                              import_path=content.import_path,
-                              # getattr b/c caching may mean some pickled instances don't have attr
-                              locked=getattr(content, 'locked', False)) as fp:
-            if hasattr(content.data, '__iter__'):
-                for chunk in content.data:
-                    fp.write(chunk)
-            else:
-                fp.write(content.data)
+        entry = {
+            'filename': unicode(content.location),
+            'contentType': content.content_type,
+            'displayname': content.name,
+            'content_son': content_son,
+            'thumbnail_location': thumbnail_location,
+            'import_path': content.import_path,
+            # getattr b/c caching may mean some pickled instances don't have attr
+            'locked': getattr(content, 'locked', False),
+        }
 
+        try:
+            previous = self.fs_files.find_one({'_id': content_id}, fields=['content_hash'])
+            if previous is not None and previous.get('content_hash') == content_hash:
+                # The same bytes are already stored, so only the metadata may have changed
+                self.fs_files.update({'_id': content_id}, {'$set': entry})
+                if self.content_files.find_one({'content_hash': content_hash}, fields=['_id']) is None:
+                    # Store the bytes again, in case they were lost
+                    self._acquire_content(content_hash, data)
+            else:
+                self._save_entry(content_id, entry, self._acquire_content(content_hash, data))
+        finally:
+            if hasattr(data, 'close'):
+                data.close()
         return content
 
+    def _acquire_content(self, content_hash, data=None):
+        """
+        Count a new reference to the content with the given hash, storing `data` as that content if it
+        isn't stored already. Returns the GridFS file document of the content.
+
+        The reference is counted before the entry which makes it is saved, so that the content can't be
+        deleted in between; if the entry isn't saved, the reference must be released.
+
+        Raises NotFoundError if the content isn't stored and no `data` is given.
+        """
+        attempts = STORE_CONTENT_ATTEMPTS
+        while True:
+            content_file = self.content_files.find_and_modify(
+                {'content_hash': content_hash}, {'$inc': {'references': 1}}, new=True
+            )
+            if content_file is not None:
+                return content_file
+            if data is None:
+                raise NotFoundError(content_hash)
+
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            grid_file = self.content_fs.new_file(content_hash=content_hash, references=1)
+            try:
+                grid_file.write(data)
+                grid_file.close()
+            except (FileExists, DuplicateKeyError):
+                # The same content was stored concurrently, so drop this copy, and refer to that one
+                self.content_fs.delete(grid_file._id)
+                attempts -= 1
+                if attempts == 0:
+                    raise
+            except Exception:
+                self.content_fs.delete(grid_file._id)
+                raise
+            else:
+                return self.content_files.find_one({'_id': grid_file._id})
+
+    def _save_entry(self, content_id, entry, content_file):
+        """
+        Save the entry of the asset with the given database key, referring to the given content, whose
+        reference is already counted, in place of its previous entry (if any). Releases the content the
+        previous entry referred to.
+        """
+        entry.update({
+            '_id': content_id,
+            'content_hash': content_file['content_hash'],
+            'length': content_file['length'],
+            'chunkSize': content_file['chunkSize'],
+            'md5': content_file['md5'],
+            'uploadDate': datetime.datetime.utcnow(),
+        })
+
+        # Replace the previous entry atomically, so that concurrent saves release each entry once
+        previous = self.fs_files.find_and_modify({'_id': content_id}, entry, upsert=True, fields=['content_hash'])
+        self._uncache(content_id)
+        self._release_entry(content_id, previous)
+
+    def _release_entry(self, content_id, entry):
+        """
+        Release the bytes of the removed or replaced entry of the asset with the given database key.
+        """
+        if not entry:
+            return
+        if entry.get('content_hash') is None:
+            # The entry held its own bytes
+            self.fs_chunks.remove({'files_id': content_id})
+        else:
+            self._release_content(entry['content_hash'])
+
+    def _release_content(self, content_hash):
+        """
+        Release a reference to the content with the given hash, and delete the content if no asset entry
+        refers to it anymore.
+        """
+        content_file = self.content_files.find_and_modify(
+            {'content_hash': content_hash}, {'$inc': {'references': -1}}, new=True, fields=['references']
+        )
+        if content_file is None or content_file['references'] > 0:
+            return
+        references = self.fs_files.find({'content_hash': content_hash}).count()
+        if references:
+            # Some entries were saved without counting their references, so count them now
+            logging.warning('Content %s was referred to by %d uncounted asset entries', content_hash, references)
+            self.content_files.update({'_id': content_file['_id']}, {'$inc': {'references': references}})
+            return
+        # Only delete it if no reference was counted in the meantime
+        result = self.content_files.remove({'_id': content_file['_id'], 'references': {'$lte': 0}})
+        if result and result.get('n'):
+            self.content_chunks.remove({'files_id': content_file['_id']})
+
+    def remove_orphaned_content(self, older_than=ORPHANED_CONTENT_AGE):
+        """
+        Remove the chunks of content whose writes failed partway, more than `older_than` ago, and
+        return how many contents they were.
+        """
+        cutoff = ObjectId.from_datetime(datetime.datetime.utcnow() - older_than)
+        orphans = [
+            files_id for files_id in self.content_chunks.find(
+                {'files_id': {'$lt': cutoff}, 'n': 0}, fields=['files_id']
+            ).distinct('files_id')
+            if self.content_files.find_one({'_id': files_id}, fields=['_id']) is None
+        ]
+        for files_id in orphans:
+            self.content_chunks.remove({'files_id': files_id})
+        return len(orphans)
+
     def delete(self, location_or_id):
         if isinstance(location_or_id, AssetKey):
             location_or_id, _ = self.asset_db_key(location_or_id)
         # Deletes of non-existent files are considered successful
-        self.fs.delete(location_or_id)
+        entry = self.fs_files.find_and_modify({'_id': location_or_id}, remove=True, fields=['content_hash'])
+        self._uncache(location_or_id)
+        self._release_entry(location_or_id, entry)
+
+    @classmethod
+    def _disk_cache_key(cls, content_id):
+        """
+        Returns the key of the asset with the given database key in the disk cache.
+        """
+        if isinstance(content_id, basestring):
+            return content_id
+        # the database key may be an unordered dict
+        return u'/'.join(unicode(content_id.get(field_name)) for field_name in cls.ordered_key_fields + ['run'])
+
+    def _uncache(self, content_id):
+        """
+        Delete the disk cache's copies of the asset with the given database key.
+        """
+        if self.disk_cache is not None:
+            self.disk_cache.delete(self._disk_cache_key(content_id))
+
+    def _open(self, content_id, cached=False):
+        """
+        Return the entry of the asset with the given database key, and a GridOut of its bytes.
+
+        If `cached`, and the asset is large enough to be kept in the disk cache, return its copy
+        in the disk cache instead, if there's one. If there's none, it's made in the background,
+        while the GridOut is returned, so the caller doesn't wait for the whole asset to be copied.
+
+        Raises NoFile if there's no such asset.
+        """
+        entry = self.fs_files.find_one({'_id': content_id})
+        if entry is None:
+            raise NoFile(content_id)
+
+        if cached and self._is_disk_cached(entry):
+            key = self._disk_cache_key(content_id)
+            cached_file = self.disk_cache.open(key, entry['md5'])
+            if cached_file is not None:
+                return entry, cached_file
+            self.disk_cache.fill(key, entry['md5'], functools.partial(self._open_grid_file, content_id, entry))
+
+        return entry, self._open_grid_file(content_id, entry)
+
+    def _open_grid_file(self, content_id, entry):
+        """
+        Return a GridOut of the bytes of the asset with the given database key and entry.
+        """
+        if entry.get('content_hash') is None:
+            return self.fs.get(content_id)
+        return self.content_fs.get_last_version(content_hash=entry['content_hash'])
+
+    def _is_disk_cached(self, entry):
+        """
+        Returns whether the asset with the given entry is kept in the disk cache.
+        """
+        return (
+            self.disk_cache is not None and entry.get('md5') is not None and
+            entry['length'] >= self.disk_cache.min_asset_size
+        )
 
     def find(self, location, throw_on_not_found=True, as_stream=False):
         content_id, __ = self.asset_db_key(location)
 
         try:
-            if as_stream:
-                fp = self.fs.get(content_id)
-                thumbnail_location = getattr(fp, 'thumbnail_location', None)
-                if thumbnail_location:
-                    thumbnail_location = location.course_key.make_asset_key(
-                        'thumbnail',
-                        thumbnail_location[4]
-                    )
-                return StaticContentStream(
-                    location, fp.displayname, fp.content_type, fp, last_modified_at=fp.uploadDate,
-                    thumbnail_location=thumbnail_location,
-                    import_path=getattr(fp, 'import_path', None),
-                    length=fp.length, locked=getattr(fp, 'locked', False)
-                )
-            else:
-                with self.fs.get(content_id) as fp:
-                    thumbnail_location = getattr(fp, 'thumbnail_location', None)
-                    if thumbnail_location:
-                        thumbnail_location = location.course_key.make_asset_key(
-                            'thumbnail',
-                            thumbnail_location[4]
-                        )
-                    return StaticContent(
-                        location, fp.displayname, fp.content_type, fp.read(), last_modified_at=fp.uploadDate,
-                        thumbnail_location=thumbnail_location,
-                        import_path=getattr(fp, 'import_path', None),
-                        length=fp.length, locked=getattr(fp, 'locked', False)
-                    )
+            entry, fp = self._open(content_id, cached=as_stream)
         except NoFile:
             if throw_on_not_found:
                 raise NotFoundError(content_id)
             else:
                 return None
+        return self._make_content(location, entry, fp, as_stream)
 
-    def export(self, location, output_directory):
-        content = self.find(location)
-
-        if content.import_path is not None:
-            output_directory = output_directory + '/' + os.path.dirname(content.import_path)
-
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory)
+    def _make_content(self, location, entry, fp, as_stream):
+        """
+        Returns the content of the asset at `location` with the given entry, reading its bytes from `fp`:
+        a StaticContentStream of `fp` if `as_stream`, otherwise a StaticContent of all of its bytes.
+        """
+        thumbnail_location = entry.get('thumbnail_location', None)
+        if thumbnail_location:
+            thumbnail_location = location.course_key.make_asset_key(
+                'thumbnail',
+                thumbnail_location[4]
+            )
+        if as_stream:
+            return StaticContentStream(
+                location, entry['displayname'], entry['contentType'], fp, last_modified_at=entry['uploadDate'],
+                thumbnail_location=thumbnail_location,
+                import_path=entry.get('import_path', None),
+                length=entry['length'], locked=entry.get('locked', False),
+                content_digest=entry.get('md5'),
+                local_path=fp.name if isinstance(fp, file) else None
+            )
+        else:
+            with fp:
+                return StaticContent(
+                    location, entry['displayname'], entry['contentType'], fp.read(),
+                    last_modified_at=entry['uploadDate'],
+                    thumbnail_location=thumbnail_location,
+                    import_path=entry.get('import_path', None),
+                    length=entry['length'], locked=entry.get('locked', False),
+                    content_digest=entry.get('md5')
+                )
 
-        disk_fs = OSFS(output_directory)
+    def export(self, location, output_directory):
+        content_id, __ = self.asset_db_key(location)
+        entry = self.fs_files.find_one({'_id': content_id})
+        if entry is None:
+            raise NotFoundError(content_id)
+        self._export_entry(entry, output_directory)
 
-        with disk_fs.open(content.name, 'wb') as asset_file:
-            asset_file.write(content.data)
+    @staticmethod
+    def _export_path(entry):
+        """
+        Returns the path, relative to the course's static directory, which the asset with the given entry
+        is exported to.
+        """
+        import_path = entry.get('import_path')
+        if import_path is None:
+            return entry['displayname']
+        return posixpath.join(posixpath.dirname(import_path), entry['displayname']).lstrip('/')
 
-    def export_all_for_course(self, course_key, output_directory, assets_policy_file):
+    def _export_entry(self, entry, output_directory):
+        """
+        Write the bytes of the asset with the given entry to its export path in output_directory.
+        """
+        file_path = os.path.join(output_directory, self._export_path(entry))
+        directory = os.path.dirname(file_path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another worker made it first
+                if not os.path.isdir(directory):
+                    raise
+
+        # Copy the bytes a GridFS chunk at a time, rather than reading them all in memory
+        with self._open_grid_file(entry['_id'], entry) as grid_file:
+            with open(file_path, 'wb') as asset_file:
+                shutil.copyfileobj(grid_file, asset_file, grid_file.chunk_size)
+
+    def export_all_for_course(self, course_key, output_directory, assets_policy_file, export_files=True,
+                              workers=EXPORT_WORKERS):
         """
         Export all of this course's assets to the output_directory. Export all of the assets'
         attributes to the policy file.
@@ -148,27 +404,50 @@ class MongoContentStore(ContentStore):
             output_directory: the directory under which to put all the asset files
             assets_policy_file: the filename for the policy file which should be in the same
                 directory as the other policy files.
+            export_files: whether to export the asset files, or only the policy file (e.g. when the
+                files are streamed with `stream_all_for_course` instead)
+            workers: how many asset files to export at once
         """
         policy = {}
         assets, __ = self.get_all_content_for_course(course_key)
 
         for asset in assets:
-            # TODO: On 6/19/14, I had to put a try/except around this
-            # to export a course. The course failed on JSON files in
-            # the /static/ directory placed in it with an import.
-            #
-            # If this hasn't been looked at in a while, remove this comment.
-            #
-            # When debugging course exports, this might be a good place
-            # to look. -- pmitros
-            self.export(asset['asset_key'], output_directory)
             for attr, value in asset.iteritems():
-                if attr not in ['_id', 'md5', 'uploadDate', 'length', 'chunkSize', 'asset_key']:
+                if attr not in ['_id', 'md5', 'uploadDate', 'length', 'chunkSize', 'asset_key', 'content_hash']:
                     policy.setdefault(asset['asset_key'].name, {})[attr] = value
 
+        if export_files:
+            export_entry = functools.partial(self._export_entry, output_directory=output_directory)
+            for __ in _map_concurrently(export_entry, assets, workers):
+                pass
+
         with open(assets_policy_file, 'w') as f:
             json.dump(policy, f, sort_keys=True, indent=4)
 
+    def stream_all_for_course(self, course_key, workers=EXPORT_WORKERS):
+        """
+        Yield the content of each of this course's assets, along with the path, relative to the course's
+        static directory, which `export_all_for_course` would export it to.
+
+        Up to `workers` assets are read at once, ahead of the one yielded. Assets of at most
+        READ_AHEAD_MAX_SIZE bytes are read in memory and yielded as StaticContent; bigger ones are
+        yielded as StaticContentStream, which the caller must close; those read ahead but never
+        yielded are closed when the caller closes the generator.
+        """
+        assets, __ = self.get_all_content_for_course(course_key)
+        return _map_concurrently(self._read_for_export, assets, workers, discard=_close_read_ahead)
+
+    def _read_for_export(self, entry):
+        """
+        Returns the export path and the content of the asset with the given entry, read by
+        `stream_all_for_course`.
+        """
+        as_stream = entry['length'] > READ_AHEAD_MAX_SIZE
+        content = self._make_content(
+            entry['asset_key'], entry, self._open_grid_file(entry['_id'], entry), as_stream
+        )
+        return self._export_path(entry), content
+
     def get_all_content_thumbnails_for_course(self, course_key):
         return self._get_all_content_for_course(course_key, get_thumbnails=True)[0]
 
@@ -192,7 +471,7 @@ class MongoContentStore(ContentStore):
             items = self.fs_files.find(query)
             assets_to_delete = assets_to_delete + items.count()
             for asset in items:
-                self.fs.delete(asset[prefix])
+                self.delete(self.make_id_son(asset))
 
             self.fs_files.remove(query)
         return assets_to_delete
@@ -263,7 +542,7 @@ class MongoContentStore(ContentStore):
         :param location:  a c4x asset location
         """
         for attr in attr_dict.iterkeys():
-            if attr in ['_id', 'md5', 'uploadDate', 'length']:
+            if attr in ['_id', 'md5', 'uploadDate', 'length', 'content_hash']:
                 raise AttributeError("{} is a protected attribute.".format(attr))
         asset_db_key, __ = self.asset_db_key(location)
         # catch upsert error and raise NotFoundError if asset doesn't exist
@@ -291,14 +570,19 @@ class MongoContentStore(ContentStore):
         """
         See :meth:`.ContentStore.copy_all_course_assets`
 
-        This implementation fairly expensively copies all of the data
+        This implementation copies the assets' entries, which refer to the same stored content as the
+        source assets. Only the bytes of source assets which were saved before content was stored by
+        its hash are copied, as that content.
         """
         source_query = query_for_course(source_course_key)
-        # it'd be great to figure out how to do all of this on the db server and not pull the bits over
         for asset in self.fs_files.find(source_query):
             asset_key = self.make_id_son(asset)
-            # don't convert from string until fs access
-            source_content = self.fs.get(asset_key)
+            if asset.get('content_hash') is not None:
+                content_file = self._acquire_content(asset['content_hash'])
+            else:
+                # don't convert from string until fs access
+                with self.fs.get(asset_key) as source_content:
+                    content_file = self._acquire_content(*_hash_data(source_content.read()))
             if isinstance(asset_key, basestring):
                 asset_key = AssetKey.from_string(asset_key)
                 __, asset_key = self.asset_db_key(asset_key)
@@ -314,29 +598,31 @@ class MongoContentStore(ContentStore):
                     dest_course_key.make_asset_key(asset_key['category'], asset_key['name']).for_branch(None)
                 )
 
-            self.fs.put(
-                source_content.read(),
-                _id=asset_id, filename=asset['filename'], content_type=asset['contentType'],
-                displayname=asset['displayname'], content_son=asset_key,
+            entry = {
+                'filename': asset['filename'],
+                'contentType': asset['contentType'],
+                'displayname': asset['displayname'],
+                'content_son': asset_key,
                 # thumbnail is not technically correct but will be functionally correct as the code
                 # only looks at the name which is not course relative.
-                thumbnail_location=asset['thumbnail_location'],
-                import_path=asset['import_path'],
+                'thumbnail_location': asset['thumbnail_location'],
+                'import_path': asset['import_path'],
                 # getattr b/c caching may mean some pickled instances don't have attr
-                locked=asset.get('locked', False)
-            )
+                'locked': asset.get('locked', False),
+            }
+            self._save_entry(asset_id, entry, content_file)
 
     def delete_all_course_assets(self, course_key):
         """
-        Delete all assets identified via this course_key. Dangerous operation which may remove assets
-        referenced by other runs or other courses.
+        Delete all assets identified via this course_key. The content of the assets is only removed
+        once no other run or course refers to it.
         :param course_key:
         """
         course_query = query_for_course(course_key)
         matching_assets = self.fs_files.find(course_query)
         for asset in matching_assets:
             asset_key = self.make_id_son(asset)
-            self.fs.delete(asset_key)
+            self.delete(asset_key)
 
     # codifying the original order which pymongo used for the dicts coming out of location_to_dict
     # stability of order is more important than sanity of order as any changes to order make things
@@ -404,6 +690,117 @@ class MongoContentStore(ContentStore):
             [('content_son.org', pymongo.ASCENDING), ('content_son.course', pymongo.ASCENDING), ('display_name', pymongo.ASCENDING)],
             sparse=True
         )
+        # Needed to check that no asset refers to some content before it's deleted
+        self.fs_files.create_index('content_hash', sparse=True)
+        # Registers each content under its hash, once it's written
+        self.content_files.create_index('content_hash', unique=True, sparse=True)
+
+
+def _hash_data(data):
+    """
+    Return the sha1 hex digest of the data of a StaticContent, and the data in a form which
+    GridFS can write: either a string, or a file which is rewound before it's written.
+    """
+    digest = hashlib.sha1()
+    if hasattr(data, '__iter__'):
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        for chunk in data:
+            digest.update(chunk)
+            spooled.write(chunk)
+        return digest.hexdigest(), spooled
+    if hasattr(data, 'read'):
+        data = data.read()
+    digest.update(data)
+    return digest.hexdigest(), data
+
+
+class _Call(object):
+    """
+    A call of a function, made by a worker thread of `_map_concurrently`, which keeps its result or
+    exception until it's asked for.
+    """
+    def __init__(self, function, argument):
+        self.function = function
+        self.argument = argument
+        self.result = None
+        self.exc_info = None
+        self.done = threading.Event()
+
+    def run(self):
+        """
+        Make the call.
+        """
+        try:
+            self.result = self.function(self.argument)
+        except Exception:  # pylint: disable=broad-except
+            self.exc_info = sys.exc_info()
+        finally:
+            self.done.set()
+
+    def get(self):
+        """
+        Wait for the call to be made, and return its result, or raise its exception.
+        """
+        self.done.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+def _make_calls(calls):
+    """
+    Make the calls taken from the `calls` queue, until it gives None.
+    """
+    while True:
+        call = calls.get()
+        if call is None:
+            return
+        call.run()
+
+
+def _map_concurrently(function, arguments, workers, discard=None):
+    """
+    Yield the result of calling `function` with each of `arguments`, in order. A pool of `workers`
+    threads makes the calls, up to `workers` of them ahead of the result yielded.
+
+    If the caller stops before it gets all the results, `discard` is called with each of the results
+    that were computed ahead but never yielded, e.g. to close them.
+
+    pymongo's connections are shared by the threads making the calls.
+    """
+    calls = Queue.Queue()
+    threads = []
+    pending = collections.deque()
+    try:
+        for argument in arguments:
+            if len(pending) >= workers:
+                yield pending.popleft().get()
+            call = _Call(function, argument)
+            calls.put(call)
+            pending.append(call)
+            if len(threads) < workers:
+                thread = threading.Thread(target=_make_calls, args=(calls,))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        for __ in threads:
+            calls.put(None)
+        for call in pending:
+            call.done.wait()
+            if discard is not None and call.exc_info is None:
+                discard(call.result)
+
+
+def _close_read_ahead(result):
+    """
+    Close the content of an asset read ahead by `stream_all_for_course`, if it's a stream.
+    """
+    __, content = result
+    if isinstance(content, StaticContentStream):
+        content.close()
 
 
 def query_for_course(course_key, category=None):
@@ -906,6 +906,11 @@ class CourseDescriptor(CourseFields, SequenceDescriptor):
                 "section_descriptor" : The section descriptor
                 "xmoduledescriptors" : An array of xmoduledescriptors that
                     could possibly be in the section, for any student
+                "has_dynamic_children" : Whether any block in the section has
+                    children that depend on the student (see
+                    `has_dynamic_children`)
+                "latest_start" : The latest start date of the blocks in the
+                    section, or None if none has one
 
         all_descriptors - This contains a list of all xmodules that can
             effect grading a student. This is used to efficiently fetch
@@ -930,10 +935,14 @@ class CourseDescriptor(CourseFields, SequenceDescriptor):
                     xmoduledescriptors = list(yield_descriptor_descendents(s))
                     xmoduledescriptors.append(s)
 
+                    starts = [child.start for child in xmoduledescriptors if child.start is not None]
+
                     # The xmoduledescriptors included here are only the ones that have scores.
                     section_description = {
                         'section_descriptor': s,
-                        'xmoduledescriptors': filter(lambda child: child.has_score, xmoduledescriptors)
+                        'xmoduledescriptors': filter(lambda child: child.has_score, xmoduledescriptors),
+                        'has_dynamic_children': any(child.has_dynamic_children() for child in xmoduledescriptors),
+                        'latest_start': max(starts) if starts else None,
                     }
 
                     section_format = s.format if s.format is not None else ''
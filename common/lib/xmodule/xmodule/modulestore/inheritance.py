@@ -2,6 +2,7 @@
 Support for inheritance of fields down an XBlock hierarchy.
 """
 
+import copy
 from datetime import datetime
 from pytz import UTC
 
@@ -201,42 +202,91 @@ def own_metadata(module):
 class InheritingFieldData(KvsFieldData):
     """A `FieldData` implementation that can inherit value from parents to children."""
 
-    def __init__(self, inheritable_names, **kwargs):
+    def __init__(self, inheritable_names, inherited_settings=None, **kwargs):
         """
         `inheritable_names` is a list of names that can be inherited from
         parents.
 
+        `inherited_settings`, if given, is a dict of the (json) values the block
+        inherits for each inheritable name its ancestors set, computed ahead of
+        time (see `compute_inherited_settings`). The values are then looked up there
+        rather than by walking up the block's ancestors.
+
         """
         super(InheritingFieldData, self).__init__(**kwargs)
         self.inheritable_names = set(inheritable_names)
+        self.inherited_settings = inherited_settings
 
     def default(self, block, name):
         """
         The default for an inheritable name is found on a parent.
         """
         if name in self.inheritable_names:
-            # Walk up the content tree to find the first ancestor
-            # that this field is set on. Use the field from the current
-            # block so that if it has a different default than the root
-            # node of the tree, the block's default will be used.
-            field = block.fields[name]
-            ancestor = block.get_parent()
-            while ancestor is not None:
-                if field.is_set_on(ancestor):
-                    return field.read_json(ancestor)
-                else:
-                    ancestor = ancestor.get_parent()
+            if self.inherited_settings is not None:
+                if name in self.inherited_settings:
+                    value = self.inherited_settings[name]
+                    # the precomputed values are shared, so don't hand out mutable ones
+                    return copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+            else:
+                # Walk up the content tree to find the first ancestor
+                # that this field is set on. Use the field from the current
+                # block so that if it has a different default than the root
+                # node of the tree, the block's default will be used.
+                field = block.fields[name]
+                ancestor = block.get_parent()
+                while ancestor is not None:
+                    if field.is_set_on(ancestor):
+                        return field.read_json(ancestor)
+                    else:
+                        ancestor = ancestor.get_parent()
         return super(InheritingFieldData, self).default(block, name)
 
 
-def inheriting_field_data(kvs):
+def inheriting_field_data(kvs, inherited_settings=None):
     """Create an InheritanceFieldData that inherits the names in InheritanceMixin."""
     return InheritingFieldData(
         inheritable_names=InheritanceMixin.fields.keys(),
+        inherited_settings=inherited_settings,
         kvs=kvs,
     )
 
 
+def compute_inherited_settings(roots, get_children, get_settings, inheritable_names=None):
+    """
+    Compute, in one pass down the tree(s) under `roots`, the settings each block inherits.
+
+    Returns a dict mapping each block reached to a dict of the (json) values it inherits
+    from its nearest ancestor setting each inheritable name. Blocks inheriting the same
+    values share the same (read-only) dict. A block reached by more than one path inherits
+    along the first path found.
+
+    Arguments:
+        roots: the keys of the blocks at the top of the trees
+        get_children: function returning the keys of a block's children
+        get_settings: function returning the dict of a block's (json) settings
+        inheritable_names: the names to inherit (defaults to those of InheritanceMixin)
+    """
+    if inheritable_names is None:
+        inheritable_names = InheritanceMixin.fields.keys()
+
+    inherited_settings = {}
+    stack = [(root, {}) for root in roots]
+    while stack:
+        block_key, inheriting = stack.pop()
+        if block_key in inherited_settings:
+            continue
+        inherited_settings[block_key] = inheriting
+
+        settings = get_settings(block_key)
+        locally_set = [name for name in inheritable_names if name in settings]
+        if locally_set:
+            inheriting = dict(inheriting)
+            for name in locally_set:
+                inheriting[name] = settings[name]
+        stack.extend((child, inheriting) for child in get_children(block_key))
+    return inherited_settings
+
+
 class InheritanceKeyValueStore(KeyValueStore):
     """
     Common superclass for kvs's which know about inheritance of settings. Offers simple
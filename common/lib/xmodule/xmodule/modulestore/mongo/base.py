@@ -17,6 +17,7 @@ import sys
 import logging
 import copy
 import re
+import time
 from uuid import uuid4
 
 from bson.son import SON
@@ -38,6 +39,7 @@ from xmodule.modulestore.draft_and_published import ModuleStoreDraftAndPublished
 from opaque_keys.edx.locations import Location
 from xmodule.modulestore.exceptions import ItemNotFoundError, DuplicateCourseError, ReferentialIntegrityError
 from xmodule.modulestore.inheritance import InheritanceMixin, inherit_metadata, InheritanceKeyValueStore
+from xmodule.modulestore.mongo.inheritance_tree import MetadataInheritanceTree
 from xblock.core import XBlock
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
 from opaque_keys.edx.locator import CourseLocator
@@ -385,11 +387,14 @@ def as_published(location):
 
 class MongoBulkOpsRecord(BulkOpsRecord):
     """
-    Tracks whether there've been any writes per course and disables inheritance generation
+    Tracks whether there've been any writes per course and disables inheritance generation.
+    Also tracks the subtree edit info of the items updated, which is applied to their ancestors
+    when the bulk operation ends.
     """
     def __init__(self):
         super(MongoBulkOpsRecord, self).__init__()
         self.dirty = False
+        self.subtree_edits = {}
 
 
 class MongoBulkOpsMixin(BulkOperationsMixin):
@@ -404,12 +409,17 @@ class MongoBulkOpsMixin(BulkOperationsMixin):
         """
         # ensure it starts clean
         bulk_ops_record.dirty = False
+        bulk_ops_record.subtree_edits = {}
 
     def _end_outermost_bulk_operation(self, bulk_ops_record, course_id):
         """
+        Update the subtree edit info of the ancestors of the items updated during the bulk operation.
         Restart updating the meta-data inheritance cache for the given course.
         Refresh the meta-data inheritance cache now since it was temporarily disabled.
         """
+        if bulk_ops_record.subtree_edits:
+            self._update_edited_ancestors(bulk_ops_record.subtree_edits)
+            bulk_ops_record.subtree_edits = {}
         if bulk_ops_record.dirty:
             self.refresh_cached_metadata_inheritance_tree(course_id)
             bulk_ops_record.dirty = False  # brand spanking clean now
@@ -584,44 +594,91 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
                 additional_children = result.get('definition', {}).get('children', [])
                 total_children = existing_children + additional_children
                 # use set to get rid of duplicates. We don't care about order; so, it shouldn't matter.
-                results_by_url[location_url].setdefault('definition', {})['children'] = set(total_children)
+                results_by_url[location_url].setdefault('definition', {})['children'] = list(set(total_children))
             else:
                 results_by_url[location_url] = result
             if location.category == 'course':
                 root = location_url
 
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
+        # record each container's own inheritable metadata and children; the tree works out
+        # what each block inherits
+        tree = MetadataInheritanceTree(root)
+        for location_url, result in results_by_url.iteritems():
+            tree.set_block(
+                location_url,
+                result.get('metadata', {}),
+                result.get('definition', {}).get('children', []),
+            )
 
-        def _compute_inherited_metadata(url):
-            """
-            Helper method for computing inherited metadata for a specific location url
-            """
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
+        return tree
 
-        if root is not None:
-            _compute_inherited_metadata(root)
+    def _inheritance_version_key(self, course_id):
+        """
+        The metadata_inheritance_cache_subsystem key of the version of the course's inheritance.
+        """
+        return u'{}.version'.format(course_id)
 
-        return metadata_to_inherit
+    def _start_inheritance_version(self, course_id):
+        """
+        Start counting versions of the course's inheritance, if no other process has, and return
+        the current version.
+        """
+        # Starting from the time, rather than 0, keeps a counter that was evicted from the
+        # cache from counting back up to the version of a tree that's out of date.
+        version_key = self._inheritance_version_key(course_id)
+        self.metadata_inheritance_cache_subsystem.add(version_key, int(time.time() * 1000))
+        return self.metadata_inheritance_cache_subsystem.get(version_key)
+
+    def _get_inheritance_version(self, course_id):
+        """
+        Return the current version of the course's inheritance (see `_increment_inheritance_version`).
+        """
+        version = self.metadata_inheritance_cache_subsystem.get(self._inheritance_version_key(course_id))
+        if version is None:
+            version = self._start_inheritance_version(course_id)
+        return version
+
+    def _increment_inheritance_version(self, course_id):
+        """
+        Count a change to the course's inheritance, and return the new version.
+
+        The version is counted up after every change that the inheritance tree reflects.
+        Trees in the metadata_inheritance_cache_subsystem are stored with the version they
+        were built at, and are only used at that version, so that a tree written by a process
+        which raced with a change made by another is never taken for the current one.
+        """
+        try:
+            return self.metadata_inheritance_cache_subsystem.incr(self._inheritance_version_key(course_id))
+        except ValueError:
+            # nobody has counted versions since the counter was evicted
+            self._start_inheritance_version(course_id)
+            return self.metadata_inheritance_cache_subsystem.incr(self._inheritance_version_key(course_id))
+
+    def _get_shared_metadata_inheritance_tree(self, course_id):
+        """
+        Return a tuple `(tree, tree_version, version)` of the course's tree in the
+        metadata_inheritance_cache_subsystem (None if there isn't one), the version it was
+        built at, and the current version of the course's inheritance.
+        """
+        tree_key = unicode(course_id)
+        version_key = self._inheritance_version_key(course_id)
+        cached = self.metadata_inheritance_cache_subsystem.get_many([tree_key, version_key])
+        version = cached.get(version_key)
+        if version is None:
+            version = self._start_inheritance_version(course_id)
+        entry = cached.get(tree_key)
+        if not (isinstance(entry, tuple) and len(entry) == 2 and isinstance(entry[1], MetadataInheritanceTree)):
+            # not cached, or cached in an older format
+            return None, None, version
+        tree_version, tree = entry
+        return tree, tree_version, version
 
     def _get_cached_metadata_inheritance_tree(self, course_id, force_refresh=False):
         '''
         Compute the metadata inheritance for the course.
         '''
         tree = {}
+        version = None
 
         course_id = self.fill_in_run(course_id)
         if not force_refresh:
@@ -631,7 +688,9 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
 
             # then look in any caching subsystem (e.g. memcached)
             if self.metadata_inheritance_cache_subsystem is not None:
-                tree = self.metadata_inheritance_cache_subsystem.get(unicode(course_id), {})
+                shared_tree, tree_version, version = self._get_shared_metadata_inheritance_tree(course_id)
+                if shared_tree is not None and tree_version == version:
+                    tree = shared_tree
             else:
                 logging.warning(
                     'Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is \
@@ -639,16 +698,29 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
                 )
 
         if not tree:
+            # The version is read before computing, so that if the course changes meanwhile,
+            # the computed tree is stored as out of date.
+            if self.metadata_inheritance_cache_subsystem is not None and version is None:
+                version = self._get_inheritance_version(course_id)
+
             # if not in subsystem, or we are on force refresh, then we have to compute
             tree = self._compute_metadata_inheritance_tree(course_id)
 
             # now write out computed tree to caching subsystem (e.g. memcached), if available
             if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(unicode(course_id), tree)
+                self.metadata_inheritance_cache_subsystem.set(unicode(course_id), (version, tree))
 
         # now populate a request_cache, if available. NOTE, we are outside of the
         # scope of the above if: statement so that after a memcache hit, it'll get
         # put into the request_cache
+        self._set_request_cached_metadata_inheritance_tree(course_id, tree)
+
+        return tree
+
+    def _set_request_cached_metadata_inheritance_tree(self, course_id, tree):
+        """
+        Put the metadata inheritance tree for the course in the request cache, if available.
+        """
         if self.request_cache is not None:
             # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
             # defined
@@ -656,20 +728,64 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
                 self.request_cache.data['metadata_inheritance'] = {}
             self.request_cache.data['metadata_inheritance'][unicode(course_id)] = tree
 
+    def _update_cached_metadata_inheritance_tree(self, course_id, xblock, version=None):
+        """
+        Apply the change to xblock to the course's cached metadata inheritance tree without
+        recomputing it. Returns the updated tree, or None if it must be recomputed instead.
+
+        `version` is the version of the course's inheritance counted for the change (see
+        `_increment_inheritance_version`). The tree in the metadata_inheritance_cache_subsystem
+        is only updated if it was built at the version just before, since otherwise it may be
+        missing other changes.
+        """
+        course_id = self.fill_in_run(course_id)
+        if self.metadata_inheritance_cache_subsystem is None:
+            tree = self._get_cached_metadata_inheritance_tree(course_id)
+        else:
+            tree, tree_version, __ = self._get_shared_metadata_inheritance_tree(course_id)
+            if tree_version is None or tree_version != version - 1:
+                return None
+        if not tree:
+            return None
+
+        if xblock.has_children:
+            # only containers' own metadata and children are recorded in the tree
+            metadata = {
+                field_name: field.read_json(xblock)
+                for field_name, field in InheritanceMixin.fields.iteritems()
+                if field.is_set_on(xblock)
+            }
+            children = self._serialize_scope(xblock, Scope.children).get('children', [])
+            if not tree.update_block(unicode(as_published(xblock.location)), metadata, children):
+                return None
+
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(unicode(course_id), (version, tree))
+        self._set_request_cached_metadata_inheritance_tree(course_id, tree)
         return tree
 
-    def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None):
+    def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None, changed_xblock=None):
         """
         Refresh the cached metadata inheritance tree for the org/course combination
         for location
 
         If given a runtime, it replaces the cached_metadata in that runtime. NOTE: failure to provide
         a runtime may mean that some objects report old values for inherited data.
+
+        If given the changed_xblock which made the refresh necessary, the cached tree is
+        updated for just that change where possible, rather than recomputed.
         """
         course_id = course_id.for_branch(None)
         if not self._is_in_bulk_operation(course_id):
-            # below is done for side effects when runtime is None
-            cached_metadata = self._get_cached_metadata_inheritance_tree(course_id, force_refresh=True)
+            version = None
+            if self.metadata_inheritance_cache_subsystem is not None:
+                version = self._increment_inheritance_version(self.fill_in_run(course_id))
+            cached_metadata = None
+            if changed_xblock is not None:
+                cached_metadata = self._update_cached_metadata_inheritance_tree(course_id, changed_xblock, version)
+            if cached_metadata is None:
+                # below is done for side effects when runtime is None
+                cached_metadata = self._get_cached_metadata_inheritance_tree(course_id, force_refresh=True)
             if runtime:
                 runtime.cached_metadata = cached_metadata
 
@@ -1144,10 +1260,10 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
         '''
         return self.get_course(location.course_key, depth)
 
-    def _update_single_item(self, location, update, allow_not_found=False):
+    def _update_single_item(self, location, update, allow_not_found=False, ignore_not_found=False):
         """
         Set update on the specified item, and raises ItemNotFoundError
-        if the location doesn't exist
+        if the location doesn't exist (unless ignore_not_found)
         """
         bulk_record = self._get_bulk_ops_record(location.course_key)
         bulk_record.dirty = True
@@ -1160,7 +1276,7 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             upsert=allow_not_found,
             w=1,  # wait until primary commits
         )
-        if result['n'] == 0:
+        if result['n'] == 0 and not ignore_not_found:
             raise ItemNotFoundError(location)
 
     def _update_ancestors(self, location, update):
@@ -1172,6 +1288,28 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             self._update_single_item(parent, update)
             self._update_ancestors(parent, update)
 
+    def _update_edited_ancestors(self, subtree_edits):
+        """
+        Apply the subtree edit info deferred during a bulk operation to the ancestors of the
+        edited items. `subtree_edits` maps the location of each edited item to its ancestor
+        update (see `update_item`). Each ancestor is updated once, with the latest edit below it.
+        """
+        ancestor_updates = {}
+        for location, update in subtree_edits.iteritems():
+            parent = self._get_raw_parent_location(as_published(location), ModuleStoreEnum.RevisionOption.draft_preferred)
+            while parent:
+                previous = ancestor_updates.get(parent)
+                if previous is not None and previous['edit_info.subtree_edited_on'] >= update['edit_info.subtree_edited_on']:
+                    # so have all of its ancestors
+                    break
+                ancestor_updates[parent] = update
+                parent = self._get_raw_parent_location(
+                    as_published(parent), ModuleStoreEnum.RevisionOption.draft_preferred
+                )
+        for location, update in ancestor_updates.iteritems():
+            # the ancestor may have been deleted later in the bulk operation
+            self._update_single_item(location, update, ignore_not_found=True)
+
     def update_item(self, xblock, user_id, allow_not_found=False, force=False, isPublish=False,
                     is_publish_root=True):
         """
@@ -1214,21 +1352,25 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
 
             # update subtree edited info for ancestors
             # don't update the subtree info for descendants of the publish root for efficiency
-            if (
-                (not isPublish or (isPublish and is_publish_root)) and
-                not self._is_in_bulk_operation(xblock.location.course_key)
-            ):
+            if not isPublish or (isPublish and is_publish_root):
                 ancestor_payload = {
                     'edit_info.subtree_edited_on': now,
                     'edit_info.subtree_edited_by': user_id
                 }
-                self._update_ancestors(xblock.scope_ids.usage_id, ancestor_payload)
+                if self._is_in_bulk_operation(xblock.location.course_key):
+                    # applied once per ancestor when the bulk operation ends
+                    bulk_record = self._get_bulk_ops_record(xblock.location.course_key)
+                    bulk_record.subtree_edits[xblock.scope_ids.usage_id] = ancestor_payload
+                else:
+                    self._update_ancestors(xblock.scope_ids.usage_id, ancestor_payload)
 
             # update the edit info of the instantiated xblock
             xblock._edit_info = payload['edit_info']
 
             # recompute (and update) the metadata inheritance tree which is cached
-            self.refresh_cached_metadata_inheritance_tree(xblock.scope_ids.usage_id.course_key, xblock.runtime)
+            self.refresh_cached_metadata_inheritance_tree(
+                xblock.scope_ids.usage_id.course_key, xblock.runtime, changed_xblock=xblock
+            )
             # fire signal that we've written to DB
         except ItemNotFoundError:
             if not allow_not_found:
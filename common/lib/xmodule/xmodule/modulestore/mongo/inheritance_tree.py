@@ -0,0 +1,175 @@
+"""
+A compact representation of the settings inheritance of an old mongo course.
+"""
+
+
+class MetadataInheritanceTree(object):
+    """
+    Records, for each block in a course reachable from the course block, its parent and the
+    inheritable settings the block itself sets (only containers' settings are recorded, since
+    only they pass settings down). The settings each block inherits are resolved on demand and
+    memoized, so a course's tree stays small enough to cache as one item (e.g., in memcache):
+
+        * blocks are referred to by their position in a list of their location urls
+        * each distinct (setting name, value) pair is stored once, and blocks refer to it by position
+        * blocks which set no inheritable settings store nothing but their parent
+
+    Acts like the dict of location url to inherited settings dict it replaces: use :meth:`get`.
+    """
+    NO_PARENT = -1
+
+    def __init__(self, root_url=None):
+        self._urls = []
+        self._parents = []
+        self._overrides = {}
+        self._settings = []
+        self._root = None
+        self._init_derived()
+        if root_url is not None:
+            self._root = self._node(root_url)
+
+    def _init_derived(self):
+        """
+        Build the lookup tables which aren't pickled but derived from the pickled state.
+        """
+        self._url_index = {url: node for node, url in enumerate(self._urls)}
+        self._setting_index = {
+            self._setting_key(name, value): setting for setting, (name, value) in enumerate(self._settings)
+        }
+        self._resolved = {}
+
+    def __getstate__(self):
+        return {
+            'urls': self._urls,
+            'parents': self._parents,
+            'overrides': self._overrides,
+            'settings': self._settings,
+            'root': self._root,
+        }
+
+    def __setstate__(self, state):
+        self._urls = state['urls']
+        self._parents = state['parents']
+        self._overrides = state['overrides']
+        self._settings = state['settings']
+        self._root = state['root']
+        self._init_derived()
+
+    def __len__(self):
+        return len(self._urls)
+
+    @staticmethod
+    def _setting_key(name, value):
+        """
+        The key under which a (name, value) setting is interned. Equal keys imply equal settings.
+        """
+        return (name, type(value), repr(value))
+
+    def _node(self, url):
+        """
+        Return the position of the block at url, adding the block if it's not in the tree yet.
+        """
+        node = self._url_index.get(url)
+        if node is None:
+            node = self._url_index[url] = len(self._urls)
+            self._urls.append(url)
+            self._parents.append(self.NO_PARENT)
+        return node
+
+    def _intern(self, name, value):
+        """
+        Return the position of the (name, value) setting, adding it if it's not stored yet.
+        """
+        key = self._setting_key(name, value)
+        setting = self._setting_index.get(key)
+        if setting is None:
+            setting = self._setting_index[key] = len(self._settings)
+            self._settings.append((name, value))
+        return setting
+
+    def set_block(self, url, settings, children=(), replace_children=False):
+        """
+        Record the inheritable ``settings`` (a dict of json values) which the container block at
+        ``url`` sets, and its ``children`` (location urls).
+
+        Unless ``replace_children``, children which already have a parent keep it. Otherwise, the
+        children are moved under this block.
+        """
+        node = self._node(url)
+        if settings:
+            self._overrides[node] = tuple(sorted(self._intern(name, value) for name, value in settings.iteritems()))
+        else:
+            self._overrides.pop(node, None)
+
+        for child_url in children:
+            child = self._node(child_url)
+            if child != self._root and (replace_children or self._parents[child] == self.NO_PARENT):
+                self._parents[child] = node
+        self._resolved = {}
+
+    def update_block(self, url, settings, children=()):
+        """
+        Apply a change to the settings or children of the container block at ``url`` in place.
+
+        Returns False, leaving the tree unchanged, if the change can't be applied incrementally
+        (because it removes children from the block); the tree must then be recomputed.
+        """
+        node = self._url_index.get(url)
+        if node is not None:
+            child_nodes = set(self._url_index.get(child_url) for child_url in children)
+            for child, parent in enumerate(self._parents):
+                if parent == node and child not in child_nodes:
+                    return False
+        self.set_block(url, settings, children, replace_children=True)
+        return True
+
+    def get(self, url, default=None):
+        """
+        Return the dict of settings (json values) which the block at ``url`` inherits
+        (including those it sets itself, if it's a container), or ``default`` if the block
+        isn't in the course's tree. The dict is shared and must not be modified.
+        """
+        node = self._url_index.get(url)
+        if node is None:
+            return default
+        resolved = self._resolve(node)
+        return default if resolved is None else resolved
+
+    def _resolve(self, node):
+        """
+        Return the settings inherited by node, or None if node isn't under the root.
+        """
+        # find the nearest ancestor (or the node itself) which is already resolved or is the root
+        path = []
+        visited = set()
+        current = node
+        while current not in self._resolved and current != self._root:
+            if current == self.NO_PARENT or current in visited:
+                # not reachable from the root
+                return None
+            visited.add(current)
+            path.append(current)
+            current = self._parents[current]
+
+        if current in self._resolved:
+            inherited = self._resolved[current]
+        else:
+            inherited = self._resolved[current] = self._apply_overrides(current, {})
+
+        for current in reversed(path):
+            inherited = self._resolved[current] = self._apply_overrides(current, inherited)
+        return inherited
+
+    def _apply_overrides(self, node, inherited):
+        """
+        Return ``inherited`` updated with the settings node sets itself. Returns ``inherited``
+        itself if node sets none, so that blocks inheriting the same settings share one dict.
+        """
+        overrides = self._overrides.get(node)
+        if not overrides:
+            return inherited
+        inherited = dict(inherited)
+        for setting in overrides:
+            name, value = self._settings[setting]
+            inherited[name] = value
+        return inherited
@@ -74,6 +74,14 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
                 parent_map[child] = block_key
         return parent_map
 
+    @lazy
+    def _inherited_settings(self):
+        """
+        The settings each block in the structure inherits, or None if they must be found
+        by walking up each block's ancestors.
+        """
+        return self.modulestore.get_inherited_settings(self.course_entry)
+
     @contract(usage_key="BlockUsageLocator | BlockKey", course_entry_override="CourseEnvelope | None")
     def _load_item(self, usage_key, course_entry_override=None, **kwargs):
         """
@@ -200,7 +208,11 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
         )
 
         if InheritanceMixin in self.modulestore.xblock_mixins:
-            field_data = inheriting_field_data(kvs)
+            if self._inherited_settings is not None:
+                # blocks which aren't in the structure (e.g., new ones) have to walk their ancestors
+                field_data = inheriting_field_data(kvs, self._inherited_settings.get(block_key))
+            else:
+                field_data = inheriting_field_data(kvs)
         else:
             field_data = KvsFieldData(kvs)
 
@@ -3,12 +3,15 @@ Segregation of pymongo functions from the data modeling mechanisms for split mod
 """
 import re
 import pymongo
+import threading
 import time
 
 # Import this just to export it
 from pymongo.errors import DuplicateKeyError  # pylint: disable=unused-import
 
-from contracts import check
+from bson import BSON
+from collections import OrderedDict
+from contracts import new_contract, parse
 from functools import wraps
 from pymongo.errors import AutoReconnect
 from xmodule.exceptions import HeartbeatFailure
@@ -16,45 +19,84 @@ from xmodule.modulestore.split_mongo import BlockKey
 import datetime
 import pytz
 
+new_contract('BlockKey', BlockKey)
 
-def structure_from_mongo(structure):
+# The structure checks are parsed once here and applied with Contract.check, rather than with
+# contracts.check, which does nothing once contracts.disable_all() has been called (as the wsgi
+# entry points do to drop the cost of the @contract decorators).
+MONGO_ROOT_CONTRACT = parse('seq[2]')
+MONGO_BLOCKS_CONTRACT = parse('list(dict)')
+MONGO_CHILDREN_CONTRACT = parse('list(list[2])')
+ROOT_CONTRACT = parse('BlockKey')
+BLOCKS_CONTRACT = parse('dict(BlockKey: dict)')
+CHILDREN_CONTRACT = parse('list(BlockKey)')
+
+
+def validate_mongo_structure(structure):
+    """
+    Checks that a structure, as stored in mongo, has the expected shape (see
+    :func:`structure_from_mongo`). Raises a ContractNotRespected if it doesn't.
+    """
+    MONGO_ROOT_CONTRACT.check(structure['root'])
+    MONGO_BLOCKS_CONTRACT.check(structure['blocks'])
+    for block in structure['blocks']:
+        if 'children' in block['fields']:
+            MONGO_CHILDREN_CONTRACT.check(block['fields']['children'])
+
+
+def validate_structure(structure):
+    """
+    Checks that a decoded structure has the expected shape (see :func:`structure_to_mongo`).
+    Raises a ContractNotRespected if it doesn't.
+    """
+    ROOT_CONTRACT.check(structure['root'])
+    BLOCKS_CONTRACT.check(structure['blocks'])
+    for block in structure['blocks'].itervalues():
+        if 'children' in block['fields']:
+            CHILDREN_CONTRACT.check(block['fields']['children'])
+
+
+def structure_from_mongo(structure, validate=False):
     """
     Converts the 'blocks' key from a list [block_data] to a map
         {BlockKey: block_data}.
     Converts 'root' from [block_type, block_id] to BlockKey.
     Converts 'blocks.*.fields.children' from [[block_type, block_id]] to [BlockKey].
     N.B. Does not convert any other ReferenceFields (because we don't know which fields they are at this level).
+
+    Structures are validated when they're written (see :func:`structure_to_mongo`), so by default
+    this doesn't check them again; pass validate=True to check the stored shape first.
     """
-    check('seq[2]', structure['root'])
-    check('list(dict)', structure['blocks'])
-    for block in structure['blocks']:
-        if 'children' in block['fields']:
-            check('list(list[2])', block['fields']['children'])
+    if validate:
+        validate_mongo_structure(structure)
 
-    structure['root'] = BlockKey(*structure['root'])
+    # BlockKey._make skips the contract checked BlockKey constructor
+    make_key = BlockKey._make  # pylint: disable=protected-access
+    structure['root'] = make_key(structure['root'])
     new_blocks = {}
     for block in structure['blocks']:
-        if 'children' in block['fields']:
-            block['fields']['children'] = [BlockKey(*child) for child in block['fields']['children']]
-        new_blocks[BlockKey(block['block_type'], block.pop('block_id'))] = block
+        fields = block['fields']
+        if 'children' in fields:
+            fields['children'] = [make_key(child) for child in fields['children']]
+        new_blocks[make_key((block['block_type'], block.pop('block_id')))] = block
     structure['blocks'] = new_blocks
 
     return structure
 
 
-def structure_to_mongo(structure):
+def structure_to_mongo(structure, validate=True):
     """
     Converts the 'blocks' key from a map {BlockKey: block_data} to
         a list [block_data], inserting BlockKey.type as 'block_type'
         and BlockKey.id as 'block_id'.
     Doesn't convert 'root', since namedtuple's can be inserted
         directly into mongo.
+
+    Unless validate is False, first checks the structure's shape, so that only
+    valid structures get written.
     """
-    check('BlockKey', structure['root'])
-    check('dict(BlockKey: dict)', structure['blocks'])
-    for block in structure['blocks'].itervalues():
-        if 'children' in block['fields']:
-            check('list(BlockKey)', block['fields']['children'])
+    if validate:
+        validate_structure(structure)
 
     new_structure = dict(structure)
     new_structure['blocks'] = []
@@ -68,6 +110,128 @@ def structure_to_mongo(structure):
     return new_structure
 
 
+def _copy_document(document):
+    """
+    Copies a decoded structure or definition deeply enough that callers may change any part of
+    it without touching the cached original: every dict and list is copied, but immutable values
+    (strings, numbers, dates, ids and BlockKeys) are shared. This is much cheaper than
+    copy.deepcopy, which memoizes and dispatches on every value.
+    """
+    if isinstance(document, dict):
+        return type(document)(
+            (key, _copy_document(value)) for key, value in document.iteritems()
+        )
+    if isinstance(document, list):
+        return [_copy_document(value) for value in document]
+    return document
+
+
+def _document_size(document):
+    """
+    Returns the number of bytes the mongo document occupies when BSON encoded, which
+    is the measure :class:`DocumentCache` uses to bound its memory use.
+    """
+    return len(BSON.encode(document))
+
+
+class DocumentCache(object):
+    """
+    A bounded, thread-safe, least-recently-used cache of decoded split documents (structures
+    and definitions), keyed by ``(collection, _id)``.
+
+    Structures and definitions are never changed once written, so entries never need to be
+    invalidated; they are just evicted, least recently used first, once the total BSON size of
+    the cached documents exceeds ``max_size`` bytes. A ``max_size`` of 0 disables the cache.
+
+    If ``shared_cache`` (any object with django's cache ``get``/``set`` interface, such as
+    memcache) is given, the raw documents are also stored there, so that other processes can
+    skip reading them from mongo.
+
+    Cached documents are shared between threads and must never be mutated; :class:`MongoConnection`
+    only hands out copies of them.
+    """
+    def __init__(self, max_size=0, shared_cache=None):
+        self.max_size = max_size
+        self.shared_cache = shared_cache
+        self._documents = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def size(self):
+        """
+        The total BSON size of the cached documents.
+        """
+        return self._size
+
+    def get(self, key):
+        """
+        Return the decoded document cached under ``key``, or None, and mark it as most recently used.
+        """
+        with self._lock:
+            entry = self._documents.pop(key, None)
+            if entry is None:
+                return None
+            self._documents[key] = entry
+            return entry[0]
+
+    def put(self, key, document, size):
+        """
+        Cache the decoded ``document`` under ``key``, evicting the least recently used
+        documents as needed to keep the total size under ``max_size``.
+
+        Arguments:
+            size (int): the BSON size of the document (see :func:`_document_size`)
+        """
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._documents.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+
+            self._documents[key] = (document, size)
+            self._size += size
+
+            while self._size > self.max_size:
+                __, (__, evicted_size) = self._documents.popitem(last=False)
+                self._size -= evicted_size
+
+    def get_shared(self, key):
+        """
+        Return the raw (undecoded) document stored under ``key`` in the shared cache, if any.
+        """
+        if self.shared_cache is None:
+            return None
+        return self.shared_cache.get(self._shared_key(key))
+
+    def set_shared(self, key, document):
+        """
+        Store the raw (undecoded) ``document`` under ``key`` in the shared cache, if any.
+        """
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(key), document)
+
+    def clear(self):
+        """
+        Empty the in-process cache (the shared cache is left alone).
+        """
+        with self._lock:
+            self._documents.clear()
+            self._size = 0
+
+    @staticmethod
+    def _shared_key(key):
+        """
+        The key under which the document identified by ``key`` is stored in the shared cache.
+        """
+        return u'split.{}.{}'.format(*key)
+
+
 def autoretry_read(wait=0.1, retries=5):
     """
     Automatically retry a read-only method in the case of a pymongo
@@ -99,11 +263,19 @@ class MongoConnection(object):
     Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
     """
     def __init__(
-        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None, **kwargs
+        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None,
+        document_cache=None, validate_structures=False, **kwargs
     ):
         """
         Create & open the connection, authenticate, and provide pointers to the collections
+
+        :param document_cache: a :class:`DocumentCache` for the structures and definitions read
+            through this connection. If None, they aren't cached.
+        :param validate_structures: if True, also check the shape of every structure read from mongo
+            (structures are always checked when written). Intended for tests.
         """
+        self.validate_structures = validate_structures
+        self.document_cache = document_cache if document_cache is not None else DocumentCache()
         self.database = pymongo.database.Database(
             pymongo.MongoClient(
                 host=host,
@@ -138,12 +310,35 @@ class MongoConnection(object):
         else:
             raise HeartbeatFailure("Can't connect to {}".format(self.database.name))
 
+    def _cache_structure(self, structure, share=True):
+        """
+        Decode the raw mongo ``structure`` and add it to the document cache (and, if ``share``,
+        to the shared cache). Returns the decoded structure, which must not be mutated.
+        """
+        key = ('structures', structure['_id'])
+        size = _document_size(structure)
+        if share:
+            self.document_cache.set_shared(key, structure)
+        structure = structure_from_mongo(structure, self.validate_structures)
+        self.document_cache.put(key, structure, size)
+        return structure
+
     @autoretry_read()
     def get_structure(self, key):
         """
         Get the structure from the persistence mechanism whose id is the given key
         """
-        return structure_from_mongo(self.structures.find_one({'_id': key}))
+        structure = self.document_cache.get(('structures', key))
+        if structure is None:
+            shared = self.document_cache.get_shared(('structures', key))
+            if shared is not None:
+                structure = self._cache_structure(shared, share=False)
+            else:
+                found = self.structures.find_one({'_id': key})
+                if found is None:
+                    return None
+                structure = self._cache_structure(found)
+        return _copy_document(structure)
 
     @autoretry_read()
     def find_structures_by_id(self, ids):
@@ -153,7 +348,19 @@ class MongoConnection(object):
         Arguments:
             ids (list): A list of structure ids
         """
-        return [structure_from_mongo(structure) for structure in self.structures.find({'_id': {'$in': ids}})]
+        structures = []
+        missing_ids = []
+        for structure_id in ids:
+            structure = self.document_cache.get(('structures', structure_id))
+            if structure is None:
+                missing_ids.append(structure_id)
+            else:
+                structures.append(structure)
+        if missing_ids:
+            structures.extend(
+                self._cache_structure(structure) for structure in self.structures.find({'_id': {'$in': missing_ids}})
+            )
+        return [_copy_document(structure) for structure in structures]
 
     @autoretry_read()
     def find_structures_derived_from(self, ids):
@@ -163,7 +370,10 @@ class MongoConnection(object):
         Arguments:
             ids (list): A list of structure ids
         """
-        return [structure_from_mongo(structure) for structure in self.structures.find({'previous_version': {'$in': ids}})]
+        return [
+            structure_from_mongo(structure, self.validate_structures)
+            for structure in self.structures.find({'previous_version': {'$in': ids}})
+        ]
 
     @autoretry_read()
     def find_ancestor_structures(self, original_version, block_key):
@@ -174,7 +384,7 @@ class MongoConnection(object):
             original_version (str or ObjectID): The id of a structure
             block_key (BlockKey): The id of the block in question
         """
-        return [structure_from_mongo(structure) for structure in self.structures.find({
+        return [structure_from_mongo(structure, self.validate_structures) for structure in self.structures.find({
             'original_version': original_version,
             'blocks': {
                 '$elemMatch': {
@@ -189,7 +399,11 @@ class MongoConnection(object):
         """
         Insert a new structure into the database.
         """
-        self.structures.insert(structure_to_mongo(structure))
+        mongo_structure = structure_to_mongo(structure)
+        self.structures.insert(mongo_structure)
+        self.document_cache.put(
+            ('structures', structure['_id']), _copy_document(structure), _document_size(mongo_structure)
+        )
 
     @autoretry_read()
     def get_course_index(self, key, ignore_case=False):
@@ -267,25 +481,62 @@ class MongoConnection(object):
             'run': course_index['run'],
         })
 
+    def _cache_definition(self, definition, share=True):
+        """
+        Add the raw mongo ``definition`` to the document cache (and, if ``share``, to the
+        shared cache). Returns the cached definition, which must not be mutated.
+        """
+        key = ('definitions', definition['_id'])
+        if share:
+            self.document_cache.set_shared(key, definition)
+        self.document_cache.put(key, definition, _document_size(definition))
+        return definition
+
     @autoretry_read()
     def get_definition(self, key):
         """
         Get the definition from the persistence mechanism whose id is the given key
         """
-        return self.definitions.find_one({'_id': key})
+        definition = self.document_cache.get(('definitions', key))
+        if definition is None:
+            shared = self.document_cache.get_shared(('definitions', key))
+            if shared is not None:
+                definition = self._cache_definition(shared, share=False)
+            else:
+                found = self.definitions.find_one({'_id': key})
+                if found is None:
+                    return None
+                definition = self._cache_definition(found)
+        return _copy_document(definition)
 
     @autoretry_read()
     def get_definitions(self, definitions):
         """
         Retrieve all definitions listed in `definitions`.
         """
-        return self.definitions.find({'$in': {'_id': definitions}})
+        found = []
+        missing_ids = []
+        for definition_id in definitions:
+            definition = self.document_cache.get(('definitions', definition_id))
+            if definition is None:
+                missing_ids.append(definition_id)
+            else:
+                found.append(definition)
+        if missing_ids:
+            found.extend(
+                self._cache_definition(definition)
+                for definition in self.definitions.find({'_id': {'$in': missing_ids}})
+            )
+        return [_copy_document(definition) for definition in found]
 
     def insert_definition(self, definition):
         """
         Create the definition in the db
         """
         self.definitions.insert(definition)
+        self.document_cache.put(
+            ('definitions', definition['_id']), _copy_document(definition), _document_size(definition)
+        )
 
     def ensure_indexes(self):
         """
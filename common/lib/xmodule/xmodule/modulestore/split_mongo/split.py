@@ -75,8 +75,9 @@ from xmodule.modulestore import (
 
 from ..exceptions import ItemNotFoundError
 from .caching_descriptor_system import CachingDescriptorSystem
-from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, DuplicateKeyError
+from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, DocumentCache, DuplicateKeyError
 from xmodule.modulestore.split_mongo import BlockKey, CourseEnvelope
+from xmodule.modulestore.split_mongo.structure_index import StructureIndex
 from xmodule.error_module import ErrorDescriptor
 from collections import defaultdict
 from types import NoneType
@@ -569,19 +570,39 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
     # version) but those functions will have an optional arg for setting these.
     SEARCH_TARGET_DICT = ['wiki_slug']
 
+    # the default bound, in BSON bytes, on the structures and definitions cached in each process
+    DEFAULT_DOCUMENT_CACHE_SIZE = 64 * 1024 * 1024
+    # how many structure versions' get_items indexes to keep in each process
+    STRUCTURE_INDEX_CACHE_SIZE = 100
+
     def __init__(self, contentstore, doc_store_config, fs_root, render_template,
                  default_class=None,
                  error_tracker=null_error_tracker,
                  i18n_service=None, fs_service=None,
-                 services=None, **kwargs):
+                 services=None, document_cache_size=DEFAULT_DOCUMENT_CACHE_SIZE,
+                 share_document_cache=False, validate_structures=False, **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param document_cache_size: the bound, in BSON bytes, on the structures and definitions this
+            store keeps decoded in memory (shared by all threads). 0 disables the cache.
+        :param share_document_cache: if True, also store the structures and definitions in the
+            metadata_inheritance_cache_subsystem (e.g., memcache) so other processes needn't read them from mongo.
+        :param validate_structures: if True, check the shape of structures as they're read as well as
+            when they're written. Costly for large courses, so only intended for tests.
         """
 
         super(SplitMongoModuleStore, self).__init__(contentstore, **kwargs)
 
-        self.db_connection = MongoConnection(**doc_store_config)
+        document_cache = DocumentCache(
+            document_cache_size,
+            self.metadata_inheritance_cache_subsystem if share_document_cache else None
+        )
+        self.db_connection = MongoConnection(
+            document_cache=document_cache, validate_structures=validate_structures, **doc_store_config
+        )
         self.db = self.db_connection.database
+        # each index is counted with size 1, so this bounds the number of indexes kept
+        self.structure_indexes = DocumentCache(self.STRUCTURE_INDEX_CACHE_SIZE)
 
         # Code review question: How should I expire entries?
         # _add_cache could use a lru mechanism to control the cache size?
@@ -926,51 +947,106 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             return []
 
         course = self._lookup_course(course_locator)
-        items = []
+        blocks = course.structure['blocks']
+        structure_index = self._get_structure_index(course)
         qualifiers = qualifiers.copy() if qualifiers else {}  # copy the qualifiers (destructively manipulated here)
 
-        def _block_matches_all(block_json):
-            """
-            Check that the block matches all the criteria
-            """
-            # do the checks which don't require loading any additional data
-            if (
-                self._block_matches(block_json, qualifiers) and
-                self._block_matches(block_json.get('fields', {}), settings)
-            ):
-                if content:
-                    definition_block = self.get_definition(course_locator, block_json['definition'])
-                    return self._block_matches(definition_block.get('fields', {}), content)
-                else:
-                    return True
-
         if settings is None:
             settings = {}
-        if 'name' in qualifiers:
-            # odd case where we don't search just confirm
-            block_name = qualifiers.pop('name')
-            block_ids = []
-            for block_id, block in course.structure['blocks'].iteritems():
-                if block_name == block_id.id and _block_matches_all(block):
-                    block_ids.append(block_id)
-
-            return self._load_items(course, block_ids, lazy=True, **kwargs)
-
         if 'category' in qualifiers:
             qualifiers['block_type'] = qualifiers.pop('category')
 
         # don't expect caller to know that children are in fields
         if 'children' in qualifiers:
             settings['children'] = qualifiers.pop('children')
-        for block_id, value in course.structure['blocks'].iteritems():
-            if _block_matches_all(value):
-                items.append(block_id)
 
+        def _matching_block_keys(candidates):
+            """
+            Return the candidates which match all the criteria, loading the definitions of
+            the remaining candidates all at once if there are content criteria
+            """
+            # do the checks which don't require loading any additional data
+            matches = [
+                block_key for block_key in candidates
+                if self._block_matches(blocks[block_key], qualifiers) and
+                self._block_matches(blocks[block_key].get('fields', {}), settings)
+            ]
+            if content and matches:
+                definitions = {
+                    definition['_id']: definition
+                    for definition in self.get_definitions(
+                        course_locator, [blocks[block_key]['definition'] for block_key in matches]
+                    )
+                }
+                matches = [
+                    block_key for block_key in matches
+                    if self._block_matches(
+                        definitions.get(blocks[block_key]['definition'], {}).get('fields', {}), content
+                    )
+                ]
+            return matches
+
+        if 'name' in qualifiers:
+            # odd case where we don't search just confirm
+            block_ids = _matching_block_keys(structure_index.with_name(blocks, qualifiers.pop('name')))
+            return self._load_items(course, block_ids, lazy=True, **kwargs)
+
+        # narrow the search to the smallest set of candidates the indexes can find
+        candidate_lists = []
+        if 'block_type' in qualifiers:
+            candidate_lists.append(structure_index.with_type(blocks, qualifiers['block_type']))
+        candidate_lists.extend(
+            structure_index.with_field(blocks, field_name, criteria) for field_name, criteria in settings.iteritems()
+        )
+        candidate_lists = [candidates for candidates in candidate_lists if candidates is not None]
+        if candidate_lists:
+            candidates = min(candidate_lists, key=len)
+        else:
+            candidates = blocks.keys()
+
+        items = _matching_block_keys(candidates)
         if len(items) > 0:
             return self._load_items(course, items, 0, lazy=True, **kwargs)
         else:
             return []
 
+    def _get_structure_index(self, course_entry):
+        """
+        Return the :class:`.StructureIndex` for the structure in ``course_entry``, reusing the
+        index built for the same structure version if there is one.
+        """
+        version_guid = course_entry.structure['_id']
+        if self._is_structure_being_edited(course_entry.course_key, version_guid):
+            # the index would go stale
+            return StructureIndex()
+
+        structure_index = self.structure_indexes.get(version_guid)
+        if structure_index is None:
+            structure_index = StructureIndex()
+            self.structure_indexes.put(version_guid, structure_index, 1)
+        return structure_index
+
+    def _is_structure_being_edited(self, course_key, version_guid):
+        """
+        Is the structure version ``version_guid`` still being edited in place by an active bulk
+        operation (and so, unlike all other structure versions, subject to change)?
+        """
+        bulk_write_record = self._get_bulk_ops_record(course_key)
+        return bulk_write_record.active and version_guid in (
+            bulk_write_record.structures.viewkeys() - bulk_write_record.structures_in_db
+        )
+
+    def get_inherited_settings(self, course_entry):
+        """
+        Return a dict mapping the key of each block in the structure in ``course_entry`` to the
+        dict of (json) settings values it inherits from its ancestors. The map is computed once per
+        structure version. Returns None if the structure may still change (so inherited values
+        must be looked up on the blocks' ancestors).
+        """
+        if self._is_structure_being_edited(course_entry.course_key, course_entry.structure['_id']):
+            return None
+        return self._get_structure_index(course_entry).inherited_settings(course_entry.structure['blocks'])
+
     def get_parent_location(self, locator, **kwargs):
         '''
         Return the location (Locators w/ block_ids) for the parent of this location in this
@@ -0,0 +1,130 @@
+"""
+Secondary indexes over the blocks of a split structure, used to answer get_items queries
+without scanning every block, and the settings each block inherits.
+"""
+import re
+
+from xmodule.modulestore.inheritance import compute_inherited_settings
+
+
+def _is_indexable(criteria):
+    """
+    Can ``criteria`` be looked up in an index? (i.e., is it matched by equality, as
+    opposed to being a regex or a function, and is it hashable)
+    """
+    if isinstance(criteria, re._pattern_type) or callable(criteria):  # pylint: disable=protected-access
+        return False
+    try:
+        hash(criteria)
+    except TypeError:
+        return False
+    return True
+
+
+class StructureIndex(object):
+    """
+    Lookup tables from block type, block id, and settings field values to the keys of the
+    blocks in one version of a structure. As structure versions never change, an index can be
+    reused for as long as its version is.
+
+    The tables are built the first time they're needed. Lookups return candidate block keys:
+    every matching block is among them, but callers must still check each candidate against
+    their criteria (e.g., a list field matches any of its elements). A lookup returns None if
+    the index can't narrow the search at all.
+    """
+    def __init__(self):
+        self._by_type = None
+        self._by_name = None
+        self._by_field = {}
+        self._inherited_settings = None
+
+    def _build_key_indexes(self, blocks):
+        """
+        Index the blocks' keys by type and by id.
+        """
+        by_type = {}
+        by_name = {}
+        for block_key in blocks:
+            by_type.setdefault(block_key.type, []).append(block_key)
+            by_name.setdefault(block_key.id, []).append(block_key)
+        self._by_name = by_name
+        self._by_type = by_type
+
+    def with_type(self, blocks, criteria):
+        """
+        Return the keys of the blocks in ``blocks`` whose type may match ``criteria``.
+        """
+        if not _is_indexable(criteria):
+            return None
+        if self._by_type is None:
+            self._build_key_indexes(blocks)
+        return self._by_type.get(criteria, [])
+
+    def with_name(self, blocks, name):
+        """
+        Return the keys of the blocks in ``blocks`` whose id is ``name``.
+        """
+        if self._by_name is None:
+            self._build_key_indexes(blocks)
+        return self._by_name.get(name, [])
+
+    def with_field(self, blocks, field_name, criteria):
+        """
+        Return the keys of the blocks in ``blocks`` whose ``field_name`` setting may
+        match ``criteria``.
+        """
+        field_index = self._by_field.get(field_name)
+        if field_index is None:
+            field_index = self._by_field[field_name] = self._build_field_index(blocks, field_name)
+        by_value, unindexed, is_set = field_index
+
+        if not _is_indexable(criteria):
+            # any block which has the field set may match
+            return is_set
+        return by_value.get(criteria, []) + unindexed
+
+    @staticmethod
+    def _build_field_index(blocks, field_name):
+        """
+        Index ``blocks`` by the value of their ``field_name`` setting. List values are indexed
+        under each of their elements. Returns a tuple of the index, the keys of the blocks whose
+        values can't be indexed, and the keys of all the blocks which have the field set.
+        """
+        by_value = {}
+        unindexed = []
+        is_set = []
+        for block_key, block in blocks.iteritems():
+            fields = block.get('fields', {})
+            if field_name not in fields:
+                continue
+            is_set.append(block_key)
+            value = fields[field_name]
+            values = value if isinstance(value, list) else [value]
+            try:
+                for element in set(values):
+                    by_value.setdefault(element, []).append(block_key)
+            except TypeError:
+                unindexed.append(block_key)
+        return by_value, unindexed, is_set
+
+    def inherited_settings(self, blocks):
+        """
+        Return a dict mapping the key of each block in ``blocks`` to the dict of (json) settings
+        values it inherits from its ancestors (see :func:`compute_inherited_settings`).
+        """
+        if self._inherited_settings is None:
+            def get_children(block_key):
+                """
+                The children of the block which are in the structure.
+                """
+                return [child for child in blocks[block_key]['fields'].get('children', []) if child in blocks]
+
+            children = set()
+            for block in blocks.itervalues():
+                children.update(block['fields'].get('children', []))
+            self._inherited_settings = compute_inherited_settings(
+                [block_key for block_key in blocks if block_key not in children],
+                get_children,
+                lambda block_key: blocks[block_key]['fields'],
+            )
+        return self._inherited_settings
@@ -97,6 +97,7 @@ def split_mongo_store_config(data_dir):
         'default_class': 'xmodule.raw_module.RawDescriptor',
         'fs_root': data_dir,
         'render_template': 'edxmako.shortcuts.render_to_string',
+        'validate_structures': True,
     }
 
     store = {
@@ -2,6 +2,7 @@
  Test contentstore.mongo functionality
 """
 import logging
+import os
 from uuid import uuid4
 import unittest
 import mimetypes
@@ -12,10 +13,12 @@ import shutil
 from opaque_keys.edx.locator import CourseLocator, AssetLocator
 from opaque_keys.edx.keys import AssetKey
 from xmodule.tests import DATA_DIR
+from xmodule.contentstore.disk_cache import AssetDiskCache
 from xmodule.contentstore.mongo import MongoContentStore
-from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from xmodule.exceptions import NotFoundError
 import ddt
+from mock import patch
 from __builtin__ import delattr
 from xmodule.modulestore.tests.mongo_connection import MONGO_PORT_NUM, MONGO_HOST
 
@@ -146,6 +149,58 @@ class TestContentstore(unittest.TestCase):
         finally:
             shutil.rmtree(root_dir)
 
+    @ddt.data(True, False)
+    def test_export_policy_only(self, deprecated):
+        """
+        Test export of the policy file without the asset files
+        """
+        self.set_up_assets(deprecated)
+        root_dir = path.path(mkdtemp())
+        self.addCleanup(shutil.rmtree, root_dir)
+        self.contentstore.export_all_for_course(
+            self.course1_key, root_dir / "static",
+            path.path(root_dir / "policy.json"),
+            export_files=False,
+        )
+        self.assertTrue(path.path(root_dir / "policy.json").isfile())
+        self.assertFalse(path.path(root_dir / "static").exists())
+
+    @ddt.data(True, False)
+    def test_stream_all_for_course(self, deprecated):
+        """
+        Test streaming the assets of a course, with the biggest ones read as streams
+        """
+        self.set_up_assets(deprecated)
+        sizes = [len(self.contentstore.find(self.course1_key.make_asset_key('asset', filename)).data)
+                 for filename in self.course1_files]
+        with patch('xmodule.contentstore.mongo.READ_AHEAD_MAX_SIZE', sorted(sizes)[0]):
+            streamed = {}
+            for export_path, content in self.contentstore.stream_all_for_course(self.course1_key, workers=2):
+                if isinstance(content, StaticContentStream):
+                    streamed[export_path] = ''.join(content.stream_data())
+                    content.close()
+                else:
+                    streamed[export_path] = content.data
+
+        self.assertEqual(sorted(streamed), sorted(self.course1_files))
+        for filename in self.course1_files:
+            asset_key = self.course1_key.make_asset_key('asset', filename)
+            self.assertEqual(streamed[filename], self.contentstore.find(asset_key).data)
+
+    @ddt.data(True, False)
+    def test_stream_all_for_course_closed(self, deprecated):
+        """
+        Test that the streams read ahead are closed when streaming the assets is cut short
+        """
+        self.set_up_assets(deprecated)
+        with patch('xmodule.contentstore.mongo.READ_AHEAD_MAX_SIZE', -1):
+            with patch.object(StaticContentStream, 'close', autospec=True) as close:
+                assets = self.contentstore.stream_all_for_course(self.course1_key, workers=2)
+                __, first = next(assets)
+                assets.close()
+        self.assertEqual(close.call_count, 1)
+        self.assertNotEqual(close.call_args[0][0], first)
+
     @ddt.data(True, False)
     def test_get_all_content(self, deprecated):
         """
@@ -209,3 +264,118 @@ class TestContentstore(unittest.TestCase):
         # ensure it didn't remove any from other course
         __, count = self.contentstore.get_all_content_for_course(self.course2_key)
         self.assertEqual(count, len(self.course2_files))
+
+    @ddt.data(True, False)
+    def test_copy_assets_shares_content(self, deprecated):
+        """
+        copy_all_course_assets copies the entries, not the content
+        """
+        self.set_up_assets(deprecated)
+        stored = self.contentstore.content_files.count()
+        dest_course = CourseLocator('test', 'destination', 'copy')
+        self.contentstore.copy_all_course_assets(self.course1_key, dest_course)
+        self.assertEqual(self.contentstore.content_files.count(), stored)
+
+        # the content is kept until no course refers to it
+        self.contentstore.delete_all_course_assets(self.course1_key)
+        for filename in self.course1_files:
+            dest_key = dest_course.make_asset_key('asset', filename)
+            self.assertIsNotNone(self.contentstore.find(dest_key).data)
+        self.contentstore.delete_all_course_assets(dest_course)
+        self.assertLess(self.contentstore.content_files.count(), stored)
+
+    @ddt.data(True, False)
+    def test_save_same_content(self, deprecated):
+        """
+        Saving the bytes an asset already has only updates its metadata
+        """
+        self.set_up_assets(deprecated)
+        asset_key = self.course1_key.make_asset_key('asset', self.course1_files[0])
+        source = self.contentstore.find(asset_key)
+        stored = self.contentstore.content_files.count()
+
+        self.save_asset(self.course1_files[0], asset_key, 'renamed', not source.locked)
+        saved = self.contentstore.find(asset_key)
+        self.assertEqual(saved.name, 'renamed')
+        self.assertEqual(saved.locked, not source.locked)
+        self.assertEqual(saved.last_modified_at, source.last_modified_at)
+        self.assertEqual(self.contentstore.content_files.count(), stored)
+
+        # and saving other bytes replaces its content
+        self.save_asset(self.course1_files[1], asset_key, 'replaced', False)
+        self.assertEqual(self.contentstore.find(asset_key).length, self.contentstore.find(
+            self.course1_key.make_asset_key('asset', self.course1_files[1])
+        ).length)
+
+    @ddt.data(True, False)
+    def test_save_after_failed_write(self, deprecated):
+        """
+        A write of some content which fails partway doesn't keep the content from being stored later
+        """
+        self.set_up_assets(deprecated)
+        asset_key = self.course1_key.make_asset_key('asset', 'new_file.txt')
+        content = StaticContent(asset_key, 'new_file.txt', 'text/plain', 'the bytes')
+        with patch('gridfs.grid_file.GridIn.close', side_effect=IOError):
+            with self.assertRaises(IOError):
+                self.contentstore.save(content)
+
+        self.contentstore.save(content)
+        self.assertEqual(self.contentstore.find(asset_key).data, 'the bytes')
+
+    @ddt.data(True, False)
+    def test_content_referred_to_while_released(self, deprecated):
+        """
+        Content which is referred to as its last asset is deleted isn't deleted
+        """
+        self.set_up_assets(deprecated)
+        asset_key = self.course1_key.make_asset_key('asset', self.course1_files[0])
+        data = self.contentstore.find(asset_key).data
+        content_hash = self.contentstore.get_attrs(asset_key)['content_hash']
+
+        # e.g. a copy of the course finds the content, and saves its entry once the asset is deleted
+        content_file = self.contentstore._acquire_content(content_hash)  # pylint: disable=protected-access
+        self.contentstore.delete(asset_key)
+        copy_key = self.course2_key.make_asset_key('asset', 'copy')
+        copy_id, copy_son = self.contentstore.asset_db_key(copy_key)
+        self.contentstore._save_entry(  # pylint: disable=protected-access
+            copy_id,
+            {
+                'filename': unicode(copy_key), 'contentType': 'text/plain', 'displayname': 'copy',
+                'content_son': copy_son, 'thumbnail_location': None, 'import_path': None, 'locked': False,
+            },
+            content_file
+        )
+        self.assertEqual(self.contentstore.find(copy_key).data, data)
+
+    @ddt.data(True, False)
+    def test_disk_cache(self, deprecated):
+        """
+        Large assets are streamed from the disk cache, which save and delete invalidate
+        """
+        self.set_up_assets(deprecated)
+        cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.contentstore.disk_cache = AssetDiskCache(cache_dir, min_asset_size=1)
+        asset_key = self.course1_key.make_asset_key('asset', self.course1_files[0])
+        data = self.contentstore.find(asset_key).data
+
+        # A miss is served from GridFS while the copy is made
+        content = self.contentstore.find(asset_key, as_stream=True)
+        self.assertIsNone(content.local_path)
+        self.assertEqual(''.join(content.stream_data()), data)
+        self.contentstore.disk_cache.wait_for_fills()
+
+        content = self.contentstore.find(asset_key, as_stream=True)
+        self.assertTrue(content.local_path.startswith(cache_dir))
+        self.assertEqual(''.join(content.stream_data()), data)
+        self.assertEqual(self.contentstore.find(asset_key, as_stream=True).local_path, content.local_path)
+
+        self.save_asset(self.course1_files[1], asset_key, self.course1_files[0], False)
+        self.assertFalse(os.path.exists(content.local_path))
+        content = self.contentstore.find(asset_key, as_stream=True)
+        self.assertNotEqual(''.join(content.stream_data()), data)
+        self.contentstore.disk_cache.wait_for_fills()
+        content = self.contentstore.find(asset_key, as_stream=True)
+
+        self.contentstore.delete(asset_key)
+        self.assertFalse(os.path.exists(content.local_path))
@@ -69,6 +69,37 @@ class MemoryCache(object):
         """
         self._data[key] = value
 
+    def get_many(self, keys):
+        """
+        Get the keys that are in the cache, as a dict.
+
+        Args:
+            keys: The keys to look up.
+        """
+        return {key: self._data[key] for key in keys if key in self._data}
+
+    def add(self, key, value):
+        """
+        Set a key in the cache, unless it's already set.
+
+        Args:
+            key: The key to set.
+            value: The value to set it to.
+        """
+        self._data.setdefault(key, value)
+
+    def incr(self, key):
+        """
+        Add one to the value of a key, and return the new value.
+
+        Args:
+            key: The key to increment. Raises a ValueError if it isn't set.
+        """
+        if key not in self._data:
+            raise ValueError("Key '{}' not found".format(key))
+        self._data[key] += 1
+        return self._data[key]
+
 
 class MongoModulestoreBuilder(object):
     """
@@ -1463,6 +1463,31 @@ class TestMixedModuleStore(CourseComparisonTest):
         # Verify that others have unchanged edit info
         check_node(sibling.location, None, after_create, self.user_id, None, after_create, self.user_id)
 
+    @ddt.data('draft', 'split')
+    def test_update_edit_info_ancestors_in_bulk_operation(self, default_ms):
+        """
+        Tests that ancestors' subtree_edited_on and subtree_edited_by are updated by edits made in a bulk operation
+        """
+        self.initdb(default_ms)
+
+        test_course = self.store.create_course('testx', 'GreekHero', 'test_run', self.user_id)
+        component = self.store.create_child(self.user_id, test_course.location, 'vertical', block_id='test_vertical')
+        child = self.store.create_child(self.user_id, component.location, 'html', block_id='test_html')
+
+        after_create = datetime.datetime.now(UTC)
+        editing_user = self.user_id - 2
+        with self.store.bulk_operations(test_course.id):
+            child = self.store.get_item(child.location)
+            child.display_name = 'Changed Display Name'
+            self.store.update_item(child, editing_user)
+        after_edit = datetime.datetime.now(UTC)
+
+        for location in [test_course.location, component.location]:
+            node = self.store.get_item(location)
+            self.assertLess(after_create, node.subtree_edited_on)
+            self.assertLess(node.subtree_edited_on, after_edit)
+            self.assertEqual(node.subtree_edited_by, editing_user)
+
     @ddt.data('draft', 'split')
     def test_update_edit_info(self, default_ms):
         """
@@ -8,6 +8,8 @@ from path import path
 import pymongo
 import logging
 import shutil
+from StringIO import StringIO
+import tarfile
 from tempfile import mkdtemp
 from uuid import uuid4
 from datetime import datetime
@@ -27,7 +29,7 @@ from xmodule.modulestore.mongo import MongoKeyValueStore
 from xmodule.modulestore.draft import DraftModuleStore
 from opaque_keys.edx.locations import SlashSeparatedCourseKey, AssetLocation
 from opaque_keys.edx.keys import UsageKey
-from xmodule.modulestore.xml_exporter import export_to_xml
+from xmodule.modulestore.xml_exporter import export_to_xml, export_to_tar_gz_stream
 from xmodule.modulestore.xml_importer import import_from_xml, perform_xlint
 from xmodule.contentstore.mongo import MongoContentStore
 
@@ -491,6 +493,34 @@ class TestMongoModuleStore(unittest.TestCase):
         finally:
             shutil.rmtree(root_dir)
 
+    def test_export_to_tar_gz_stream(self):
+        """
+        Make sure that the streamed tar.gz holds the same files as the exported course,
+        with the static files streamed from the contentstore
+        """
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        root_dir = path(mkdtemp())
+        self.addCleanup(shutil.rmtree, root_dir)
+        export_to_xml(self.draft_store, self.content_store, course_key, root_dir / 'full', 'test_export')
+        export_to_xml(
+            self.draft_store, self.content_store, course_key, root_dir / 'streamed', 'test_export',
+            export_static_files=False
+        )
+        assert_false(path(root_dir / 'streamed/test_export/static/just_a_test.jpg').exists())
+
+        tar_gz = ''.join(export_to_tar_gz_stream(self.content_store, course_key, root_dir / 'streamed', 'test_export'))
+        with tarfile.open(fileobj=StringIO(tar_gz), mode='r:gz') as tar_file:
+            tar_file.extractall(root_dir / 'extracted')
+        exported_files = sorted(
+            exported_file.relpath(root_dir / 'full') for exported_file in (root_dir / 'full').walkfiles()
+        )
+        extracted_files = sorted(
+            extracted_file.relpath(root_dir / 'extracted') for extracted_file in (root_dir / 'extracted').walkfiles()
+        )
+        assert_equals(exported_files, extracted_files)
+        for exported_file in exported_files:
+            assert_equals((root_dir / 'full' / exported_file).bytes(), (root_dir / 'extracted' / exported_file).bytes())
+
     def test_course_without_image(self):
         """
         Make sure we elegantly passover our code when there isn't a static
@@ -0,0 +1,132 @@
+"""
+Tests of the compact metadata inheritance tree used by the old mongo modulestore.
+"""
+import pickle
+import unittest
+
+from mock import Mock
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
+
+from xmodule.modulestore.mongo.base import MongoModuleStore
+from xmodule.modulestore.mongo.inheritance_tree import MetadataInheritanceTree
+from xmodule.modulestore.tests.test_cross_modulestore_import_export import MemoryCache
+
+COURSE = u'i4x://org/course/course/run'
+CHAPTER = u'i4x://org/course/chapter/chapter'
+SEQUENTIAL = u'i4x://org/course/sequential/sequential'
+OTHER_SEQUENTIAL = u'i4x://org/course/sequential/other'
+PROBLEM = u'i4x://org/course/problem/problem'
+
+
+class TestMetadataInheritanceTree(unittest.TestCase):
+    """
+    Tests of MetadataInheritanceTree.
+    """
+    def setUp(self):
+        super(TestMetadataInheritanceTree, self).setUp()
+        self.tree = MetadataInheritanceTree(COURSE)
+        # containers can be added in any order
+        self.tree.set_block(SEQUENTIAL, {'graceperiod': '1 day'}, [PROBLEM])
+        self.tree.set_block(CHAPTER, {}, [SEQUENTIAL, OTHER_SEQUENTIAL])
+        self.tree.set_block(COURSE, {'due': '2014-01-01', 'graceperiod': '2 days'}, [CHAPTER])
+
+    def test_inherited(self):
+        course_settings = {'due': '2014-01-01', 'graceperiod': '2 days'}
+        self.assertEqual(self.tree.get(COURSE), course_settings)
+        self.assertEqual(self.tree.get(CHAPTER), course_settings)
+        self.assertEqual(self.tree.get(OTHER_SEQUENTIAL), course_settings)
+        self.assertEqual(self.tree.get(SEQUENTIAL), {'due': '2014-01-01', 'graceperiod': '1 day'})
+        self.assertEqual(self.tree.get(PROBLEM), {'due': '2014-01-01', 'graceperiod': '1 day'})
+
+    def test_shares_dicts(self):
+        self.assertIs(self.tree.get(CHAPTER), self.tree.get(OTHER_SEQUENTIAL))
+        self.assertIs(self.tree.get(SEQUENTIAL), self.tree.get(PROBLEM))
+
+    def test_not_in_tree(self):
+        self.assertEqual(self.tree.get(u'i4x://org/course/html/missing', {}), {})
+        orphan = u'i4x://org/course/vertical/orphan'
+        self.tree.set_block(orphan, {'due': 'never'}, [])
+        self.assertIsNone(self.tree.get(orphan))
+
+    def test_interns_settings(self):
+        self.tree.set_block(OTHER_SEQUENTIAL, {'graceperiod': '1 day'}, [])
+        self.assertEqual(len(self.tree._settings), 3)  # pylint: disable=protected-access
+
+    def test_pickle(self):
+        self.tree.get(PROBLEM)
+        tree = pickle.loads(pickle.dumps(self.tree, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(len(tree), 5)
+        self.assertEqual(tree.get(PROBLEM), {'due': '2014-01-01', 'graceperiod': '1 day'})
+        tree.set_block(OTHER_SEQUENTIAL, {'graceperiod': '1 day'}, [])
+        self.assertEqual(len(tree._settings), 3)  # pylint: disable=protected-access
+
+    def test_update_settings(self):
+        self.assertTrue(self.tree.update_block(CHAPTER, {'due': '2015-01-01'}, [SEQUENTIAL, OTHER_SEQUENTIAL]))
+        self.assertEqual(self.tree.get(OTHER_SEQUENTIAL), {'due': '2015-01-01', 'graceperiod': '2 days'})
+        self.assertEqual(self.tree.get(PROBLEM), {'due': '2015-01-01', 'graceperiod': '1 day'})
+
+    def test_update_adds_children(self):
+        new_problem = u'i4x://org/course/problem/new'
+        self.assertTrue(self.tree.update_block(OTHER_SEQUENTIAL, {'graceperiod': '3 days'}, [new_problem]))
+        self.assertEqual(self.tree.get(new_problem), {'due': '2014-01-01', 'graceperiod': '3 days'})
+
+    def test_update_moves_children(self):
+        self.assertTrue(self.tree.update_block(OTHER_SEQUENTIAL, {}, [PROBLEM]))
+        self.assertEqual(self.tree.get(PROBLEM), {'due': '2014-01-01', 'graceperiod': '2 days'})
+
+    def test_update_removing_children(self):
+        self.assertFalse(self.tree.update_block(CHAPTER, {'due': '2015-01-01'}, [SEQUENTIAL]))
+        self.assertEqual(self.tree.get(CHAPTER), {'due': '2014-01-01', 'graceperiod': '2 days'})
+
+
+class TestSharedInheritanceTree(unittest.TestCase):
+    """
+    Tests that a tree in the metadata_inheritance_cache_subsystem is only used at the
+    version of the course's inheritance it was built at.
+    """
+    def setUp(self):
+        super(TestSharedInheritanceTree, self).setUp()
+        self.cache = MemoryCache()
+        self.course_id = SlashSeparatedCourseKey('org', 'course', 'run')
+        self.computed = 0
+
+    def _compute(self, course_id):  # pylint: disable=unused-argument
+        """Stands in for computing the tree from mongo."""
+        self.computed += 1
+        tree = MetadataInheritanceTree(COURSE)
+        tree.set_block(COURSE, {}, [CHAPTER])
+        return tree
+
+    def _store(self):
+        """
+        A MongoModuleStore, without a database, sharing the test's cache as another process's would.
+        """
+        store = MongoModuleStore.__new__(MongoModuleStore)
+        store.metadata_inheritance_cache_subsystem = self.cache
+        store.request_cache = None
+        store.fill_in_run = lambda course_id: course_id
+        store._is_in_bulk_operation = lambda course_id: False  # pylint: disable=protected-access
+        store._compute_metadata_inheritance_tree = self._compute  # pylint: disable=protected-access
+        return store
+
+    def test_update_at_next_version(self):
+        store = self._store()
+        store._get_cached_metadata_inheritance_tree(self.course_id)  # pylint: disable=protected-access
+        store.refresh_cached_metadata_inheritance_tree(self.course_id, changed_xblock=Mock(has_children=False))
+        self._store()._get_cached_metadata_inheritance_tree(self.course_id)  # pylint: disable=protected-access
+        self.assertEqual(self.computed, 1)
+
+    def test_concurrent_change_recomputes(self):
+        store = self._store()
+        store._get_cached_metadata_inheritance_tree(self.course_id)  # pylint: disable=protected-access
+        # a change by another process, which hasn't updated the tree yet
+        self._store()._increment_inheritance_version(self.course_id)  # pylint: disable=protected-access
+        store.refresh_cached_metadata_inheritance_tree(self.course_id, changed_xblock=Mock(has_children=False))
+        self.assertEqual(self.computed, 2)
+
+    def test_out_of_date_tree_not_used(self):
+        store = self._store()
+        store._get_cached_metadata_inheritance_tree(self.course_id)  # pylint: disable=protected-access
+        store._increment_inheritance_version(self.course_id)  # pylint: disable=protected-access
+        self._store()._get_cached_metadata_inheritance_tree(self.course_id)  # pylint: disable=protected-access
+        self.assertEqual(self.computed, 2)
@@ -0,0 +1,254 @@
+"""
+Tests of the split modulestore's process-wide cache of structures and definitions,
+and of the structure decoding it caches.
+"""
+import contracts
+import unittest
+from bson.objectid import ObjectId
+from contracts import ContractNotRespected
+from mock import MagicMock, patch
+
+from xmodule.modulestore.split_mongo import BlockKey
+from xmodule.modulestore.split_mongo.mongo_connection import (
+    DocumentCache, MongoConnection, structure_from_mongo, structure_to_mongo
+)
+
+
+class TestDocumentCache(unittest.TestCase):
+    """
+    Tests of the bounded LRU behavior of DocumentCache.
+    """
+    def test_get_missing(self):
+        self.assertIsNone(DocumentCache(100).get(('structures', 'missing')))
+
+    def test_disabled(self):
+        cache = DocumentCache(0)
+        cache.put(('structures', 'a'), {'a': 1}, 10)
+        self.assertIsNone(cache.get(('structures', 'a')))
+        self.assertEqual(cache.size, 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = DocumentCache(30)
+        cache.put('a', 'doc a', 10)
+        cache.put('b', 'doc b', 10)
+        cache.put('c', 'doc c', 10)
+        # touch 'a' so that 'b' is the least recently used
+        self.assertEqual(cache.get('a'), 'doc a')
+        cache.put('d', 'doc d', 10)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'doc a')
+        self.assertEqual(cache.get('c'), 'doc c')
+        self.assertEqual(cache.get('d'), 'doc d')
+        self.assertEqual(cache.size, 30)
+        self.assertEqual(len(cache), 3)
+
+    def test_oversized_document_not_cached(self):
+        cache = DocumentCache(30)
+        cache.put('a', 'doc a', 10)
+        cache.put('big', 'big doc', 31)
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual(cache.get('a'), 'doc a')
+
+    def test_replace_entry(self):
+        cache = DocumentCache(30)
+        cache.put('a', 'doc a', 10)
+        cache.put('a', 'new doc a', 20)
+        self.assertEqual(cache.get('a'), 'new doc a')
+        self.assertEqual(cache.size, 20)
+
+    def test_shared_cache(self):
+        shared = MagicMock(name='shared_cache')
+        shared.get.return_value = None
+        cache = DocumentCache(30, shared)
+        cache.set_shared(('structures', 'a'), 'doc a')
+        shared.set.assert_called_once_with(u'split.structures.a', 'doc a')
+        self.assertIsNone(cache.get_shared(('structures', 'b')))
+        shared.get.assert_called_once_with(u'split.structures.b')
+
+
+@patch('pymongo.MongoClient', MagicMock(name='MongoClient'))
+class TestMongoConnectionCaching(unittest.TestCase):
+    """
+    Tests that MongoConnection serves structures and definitions from its DocumentCache.
+    """
+    def setUp(self):
+        super(TestMongoConnectionCaching, self).setUp()
+        self.connection = MongoConnection(
+            'db', 'collection', 'host', document_cache=DocumentCache(1024 * 1024)
+        )
+        self.connection.structures = MagicMock(name='structures')
+        self.connection.definitions = MagicMock(name='definitions')
+        self.structure_id = ObjectId()
+
+    def _mongo_structure(self):
+        """
+        A structure as stored in mongo.
+        """
+        return {
+            '_id': self.structure_id,
+            'root': ['course', 'course'],
+            'blocks': [{
+                'block_type': 'course',
+                'block_id': 'course',
+                'definition': ObjectId(),
+                'fields': {'children': [['chapter', 'chapter']], 'display_name': 'Course'},
+                'edit_info': {},
+            }, {
+                'block_type': 'chapter',
+                'block_id': 'chapter',
+                'definition': ObjectId(),
+                'fields': {},
+                'edit_info': {},
+            }],
+        }
+
+    def test_structure_read_once(self):
+        self.connection.structures.find_one.return_value = self._mongo_structure()
+
+        first = self.connection.get_structure(self.structure_id)
+        second = self.connection.get_structure(self.structure_id)
+
+        self.assertEqual(self.connection.structures.find_one.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first['root'], BlockKey('course', 'course'))
+
+    def test_structure_copies(self):
+        self.connection.structures.find_one.return_value = self._mongo_structure()
+        course_key = BlockKey('course', 'course')
+
+        first = self.connection.get_structure(self.structure_id)
+        first['blocks'][course_key]['fields']['display_name'] = 'Changed'
+        first['blocks'][course_key]['edit_info']['_subtree_edited_on'] = 'now'
+        first['blocks'][course_key]['definition_loaded'] = True
+
+        second = self.connection.get_structure(self.structure_id)
+        self.assertEqual(second['blocks'][course_key]['fields']['display_name'], 'Course')
+        self.assertNotIn('_subtree_edited_on', second['blocks'][course_key]['edit_info'])
+        self.assertNotIn('definition_loaded', second['blocks'][course_key])
+
+    def test_structure_nested_values_copied(self):
+        self.connection.structures.find_one.return_value = self._mongo_structure()
+        course_key = BlockKey('course', 'course')
+
+        first = self.connection.get_structure(self.structure_id)
+        first['blocks'][course_key]['fields']['children'].append(BlockKey('chapter', 'other'))
+        first['blocks'][course_key]['fields']['grading'] = {'cutoffs': {'Pass': 0.5}}
+
+        second = self.connection.get_structure(self.structure_id)
+        second['blocks'][course_key]['fields'].setdefault('grading', {'cutoffs': {}})['cutoffs']['Pass'] = 0.9
+        self.assertEqual(first['blocks'][course_key]['fields']['grading'], {'cutoffs': {'Pass': 0.5}})
+        self.assertEqual(
+            self.connection.get_structure(self.structure_id)['blocks'][course_key]['fields']['children'],
+            [BlockKey('chapter', 'chapter')]
+        )
+
+    def test_missing_structure(self):
+        self.connection.structures.find_one.return_value = None
+        self.assertIsNone(self.connection.get_structure(self.structure_id))
+        self.assertEqual(len(self.connection.document_cache), 0)
+
+    def test_inserted_structure_cached(self):
+        self.connection.structures.find_one.return_value = self._mongo_structure()
+        structure = self.connection.get_structure(self.structure_id)
+        structure['_id'] = ObjectId()
+        self.connection.insert_structure(structure)
+
+        self.assertEqual(self.connection.get_structure(structure['_id']), structure)
+        self.assertEqual(self.connection.structures.find_one.call_count, 1)
+
+        # later changes to the inserted structure's nested values must not reach the cache
+        course_key = BlockKey('course', 'course')
+        structure['blocks'][course_key]['fields']['children'].append(BlockKey('chapter', 'other'))
+        structure['blocks'][course_key]['edit_info']['edited_by'] = 'someone'
+        cached = self.connection.get_structure(structure['_id'])
+        self.assertEqual(cached['blocks'][course_key]['fields']['children'], [BlockKey('chapter', 'chapter')])
+        self.assertNotIn('edited_by', cached['blocks'][course_key]['edit_info'])
+
+    def test_find_structures_by_id_reads_only_missing(self):
+        self.connection.structures.find_one.return_value = self._mongo_structure()
+        self.connection.get_structure(self.structure_id)
+        other_id = ObjectId()
+        other_structure = self._mongo_structure()
+        other_structure['_id'] = other_id
+        self.connection.structures.find.return_value = [other_structure]
+
+        structures = self.connection.find_structures_by_id([self.structure_id, other_id])
+
+        self.connection.structures.find.assert_called_once_with({'_id': {'$in': [other_id]}})
+        self.assertEqual(set(structure['_id'] for structure in structures), {self.structure_id, other_id})
+
+    def test_definitions(self):
+        definition_id = ObjectId()
+        definition = {'_id': definition_id, 'block_type': 'html', 'fields': {'data': 'x'}, 'edit_info': {}}
+        self.connection.definitions.find_one.return_value = dict(definition)
+
+        first = self.connection.get_definition(definition_id)
+        first['fields']['data'] = 'changed'
+        self.assertEqual(self.connection.get_definition(definition_id), definition)
+        self.assertEqual(self.connection.get_definitions([definition_id]), [definition])
+        self.assertEqual(self.connection.definitions.find_one.call_count, 1)
+        self.assertFalse(self.connection.definitions.find.called)
+
+
+class TestStructureValidation(unittest.TestCase):
+    """
+    Structures are always validated when written, but only validated on read when asked to.
+    """
+    def _mongo_structure(self):
+        """
+        A structure as stored in mongo, with a malformed child reference.
+        """
+        return {
+            '_id': ObjectId(),
+            'root': ['course', 'course'],
+            'blocks': [{
+                'block_type': 'course',
+                'block_id': 'course',
+                'fields': {'children': [['chapter']]},
+                'edit_info': {},
+            }],
+        }
+
+    def test_read_validation(self):
+        with self.assertRaises(ContractNotRespected):
+            structure_from_mongo(self._mongo_structure(), validate=True)
+
+    def test_unchecked_read(self):
+        structure = structure_from_mongo({
+            '_id': ObjectId(),
+            'root': ['course', 'course'],
+            'blocks': [{
+                'block_type': 'course',
+                'block_id': 'course',
+                'fields': {'children': [['chapter', 'chapter']]},
+                'edit_info': {},
+            }],
+        })
+        course_key = BlockKey('course', 'course')
+        self.assertEqual(structure['root'], course_key)
+        self.assertIsInstance(structure['root'], BlockKey)
+        self.assertEqual(structure['blocks'][course_key]['fields']['children'], [BlockKey('chapter', 'chapter')])
+        self.assertIsInstance(structure['blocks'][course_key]['fields']['children'][0], BlockKey)
+
+    def _structure(self):
+        """
+        A decoded structure with a child reference that isn't a BlockKey.
+        """
+        return {
+            '_id': ObjectId(),
+            'root': BlockKey('course', 'course'),
+            'blocks': {
+                BlockKey('course', 'course'): {'fields': {'children': [('chapter', 'chapter')]}, 'edit_info': {}},
+            },
+        }
+
+    def test_write_validation(self):
+        with self.assertRaises(ContractNotRespected):
+            structure_to_mongo(self._structure())
+
+    def test_write_validation_with_contracts_disabled(self):
+        contracts.disable_all()
+        self.addCleanup(contracts.enable_all)
+        with self.assertRaises(ContractNotRespected):
+            structure_to_mongo(self._structure())
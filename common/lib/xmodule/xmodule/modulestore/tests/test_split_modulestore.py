@@ -49,7 +49,8 @@ class SplitModuleTest(unittest.TestCase):
     modulestore_options = {
         'default_class': 'xmodule.raw_module.RawDescriptor',
         'fs_root': '',
-        'xblock_mixins': (InheritanceMixin, XModuleMixin, EditInfoMixin)
+        'xblock_mixins': (InheritanceMixin, XModuleMixin, EditInfoMixin),
+        'validate_structures': True,
     }
 
     MODULESTORE = {
@@ -910,6 +911,17 @@ class SplitModuleItemTests(SplitModuleTest):
             settings={'display_name': re.compile(r'Hera')},
         )
         self.assertEqual(len(matches), 2)
+        matches = modulestore().get_items(locator, settings={'display_name': 'Hercules'})
+        self.assertEqual([match.location.block_id for match in matches], ['chapter1'])
+        matches = modulestore().get_items(locator, qualifiers={'name': 'problem1', 'category': 'problem'})
+        self.assertEqual([match.location.block_id for match in matches], ['problem1'])
+        matches = modulestore().get_items(locator, qualifiers={'name': 'problem1', 'category': 'chapter'})
+        self.assertEqual(len(matches), 0)
+        matches = modulestore().get_items(
+            locator,
+            qualifiers={'children': BlockKey('problem', 'problem3_2')},
+        )
+        self.assertEqual([match.location.block_id for match in matches], ['chapter3'])
 
     def test_get_parents(self):
         '''
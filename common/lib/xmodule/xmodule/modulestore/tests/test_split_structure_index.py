@@ -0,0 +1,61 @@
+"""
+Tests of the get_items indexes over split structures.
+"""
+import re
+import unittest
+
+from xmodule.modulestore.split_mongo import BlockKey
+from xmodule.modulestore.split_mongo.structure_index import StructureIndex
+
+
+class TestStructureIndex(unittest.TestCase):
+    """
+    Tests of StructureIndex lookups.
+    """
+    def setUp(self):
+        super(TestStructureIndex, self).setUp()
+        self.course = BlockKey('course', 'course')
+        self.chapter = BlockKey('chapter', 'chapter')
+        self.discussion_a = BlockKey('discussion', 'a')
+        self.discussion_b = BlockKey('discussion', 'b')
+        self.blocks = {
+            self.course: {'fields': {'children': [self.chapter], 'display_name': 'Course'}},
+            self.chapter: {'fields': {'children': [self.discussion_a, self.discussion_b]}},
+            self.discussion_a: {'fields': {'discussion_category': 'Week 1', 'xml_attributes': {'a': 1}}},
+            self.discussion_b: {'fields': {'discussion_category': 'Week 2', 'xml_attributes': {'b': 2}}},
+        }
+        self.index = StructureIndex()
+
+    def test_with_type(self):
+        self.assertItemsEqual(
+            self.index.with_type(self.blocks, 'discussion'), [self.discussion_a, self.discussion_b]
+        )
+        self.assertEqual(self.index.with_type(self.blocks, 'problem'), [])
+        self.assertIsNone(self.index.with_type(self.blocks, re.compile('disc')))
+
+    def test_with_name(self):
+        self.assertEqual(self.index.with_name(self.blocks, 'a'), [self.discussion_a])
+        self.assertEqual(self.index.with_name(self.blocks, 'nope'), [])
+
+    def test_with_field_value(self):
+        self.assertEqual(self.index.with_field(self.blocks, 'discussion_category', 'Week 2'), [self.discussion_b])
+        self.assertEqual(self.index.with_field(self.blocks, 'discussion_category', 'Week 3'), [])
+
+    def test_with_list_field(self):
+        self.assertEqual(self.index.with_field(self.blocks, 'children', self.discussion_b), [self.chapter])
+
+    def test_with_field_criteria_not_indexable(self):
+        self.assertItemsEqual(
+            self.index.with_field(self.blocks, 'discussion_category', re.compile('Week')),
+            [self.discussion_a, self.discussion_b]
+        )
+        self.assertItemsEqual(
+            self.index.with_field(self.blocks, 'children', lambda child: True),
+            [self.course, self.chapter]
+        )
+
+    def test_with_field_value_not_indexable(self):
+        # unhashable values can't be indexed, so they're always candidates
+        self.assertItemsEqual(
+            self.index.with_field(self.blocks, 'xml_attributes', 'a'), [self.discussion_a, self.discussion_b]
+        )
@@ -2,10 +2,15 @@
 Methods for exporting course data to XML
 """
 
+import calendar
 import logging
 import lxml.etree
+import struct
+import tarfile
+import time
+import zlib
 from xblock.fields import Scope, Reference, ReferenceList, ReferenceValueDict
-from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from xmodule.exceptions import NotFoundError
 from xmodule.modulestore import EdxJSONEncoder, ModuleStoreEnum
 from xmodule.modulestore.inheritance import own_metadata
@@ -25,8 +30,13 @@ EXPORT_VERSION_KEY = "export_format"
 
 DEFAULT_CONTENT_FIELDS = ['metadata', 'data']
 
+# How many bytes of the exported files to read at once while they're streamed into a tar.gz
+TAR_READ_SIZE = 64 * 1024
+# The zlib compression level of the streamed tar.gz: faster than gzip's default of 9, for nearly the same size
+TAR_GZ_COMPRESS_LEVEL = 6
 
-def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
+
+def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir, export_static_files=True):
     """
     Export all modules from `modulestore` and content from `contentstore` as xml to `root_dir`.
 
@@ -35,6 +45,8 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
     `course_key`: The `CourseKey` of the `CourseModuleDescriptor` to export
     `root_dir`: The directory to write the exported xml to
     `course_dir`: The name of the directory inside `root_dir` to write the course content to
+    `export_static_files`: Whether to write the course's static files, or only their policy, e.g. to
+        stream them with `export_to_tar_gz_stream` instead
     """
 
     with modulestore.bulk_operations(course_key):
@@ -63,6 +75,7 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
                 course_key,
                 root_dir + '/' + course_dir + '/static/',
                 root_dir + '/' + course_dir + '/policies/assets.json',
+                export_files=export_static_files,
             )
 
             # If we are using the default course image, export it to the
@@ -141,6 +154,116 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
                             draft_vertical.add_xml_to_node(node)
 
 
+def export_to_tar_gz_stream(contentstore, course_key, root_dir, course_dir):
+    """
+    Yield the bytes of a tar.gz of the course exported to `root_dir`/`course_dir` by `export_to_xml`
+    with `export_static_files=False`, with the course's static files streamed from `contentstore` into
+    its static directory, so that they're never written to disk.
+
+    The tar.gz has the same members as `tar_file.add(root_dir / course_dir, arcname=course_dir)` would
+    add once the static files are exported, and is yielded as it's compressed.
+    """
+    return _gzip_stream(_tar_stream(_tar_members(contentstore, course_key, root_dir, course_dir)))
+
+
+def _tar_members(contentstore, course_key, root_dir, course_dir):
+    """
+    Yield a `TarInfo` and an iterator over the bytes of each member of the tar.gz of the exported course.
+    """
+    course_root = os.path.join(root_dir, course_dir)
+    for dirpath, dirnames, filenames in os.walk(course_root):
+        dirnames.sort()
+        for name in [''] + sorted(filenames):
+            file_path = os.path.join(dirpath, name) if name else dirpath
+            tarinfo = tarfile.TarInfo(os.path.relpath(file_path, root_dir).replace(os.sep, '/'))
+            stat = os.stat(file_path)
+            tarinfo.mtime = int(stat.st_mtime)
+            tarinfo.mode = stat.st_mode & 0777
+            if name:
+                tarinfo.size = stat.st_size
+                yield tarinfo, _read_file(file_path)
+            else:
+                tarinfo.type = tarfile.DIRTYPE
+                yield tarinfo, iter([])
+
+    if contentstore:
+        assets = contentstore.stream_all_for_course(course_key)
+        try:
+            for export_path, content in assets:
+                tarinfo = tarfile.TarInfo(u'{}/static/{}'.format(course_dir, export_path))
+                tarinfo.size = content.length
+                tarinfo.mode = 0644
+                if content.last_modified_at is not None:
+                    tarinfo.mtime = calendar.timegm(content.last_modified_at.utctimetuple())
+                if isinstance(content, StaticContentStream):
+                    try:
+                        yield tarinfo, content.stream_data()
+                    finally:
+                        content.close()
+                else:
+                    yield tarinfo, iter([content.data])
+        finally:
+            # closes the assets read ahead, if the export is cut short
+            assets.close()
+
+
+def _read_file(file_path):
+    """
+    Yield the bytes of the file at `file_path`.
+    """
+    with open(file_path, 'rb') as exported_file:
+        while True:
+            chunk = exported_file.read(TAR_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _tar_stream(members):
+    """
+    Yield the bytes of an uncompressed tar of `members`, pairs of a `TarInfo` and an iterator over
+    the member's bytes.
+    """
+    written = 0
+    for tarinfo, chunks in members:
+        header = tarinfo.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'strict')
+        yield header
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+        if size != tarinfo.size:
+            raise IOError(u'{} changed size while it was exported'.format(tarinfo.name))
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            yield tarfile.NUL * padding
+        written += len(header) + size + padding
+
+    # The end of the archive is two empty blocks, padded to a whole record
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield tarfile.NUL * end
+
+
+def _gzip_stream(chunks):
+    """
+    Yield the bytes of the gzip of the given chunks of bytes, as they're compressed.
+    """
+    # header: magic, deflate, no flags, mtime, no extra flags, unknown OS
+    yield '\037\213\010\000' + struct.pack('<L', long(time.time())) + '\000\377'
+    compressor = zlib.compressobj(TAR_GZ_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, 0)
+    crc = zlib.crc32('')
+    size = 0
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+    yield struct.pack('<LL', crc & 0xffffffffL, size & 0xffffffffL)
+
+
 def adapt_references(subtree, destination_course_key, export_fs):
     """
     Map every reference in the subtree into destination_course_key and set it back into the xblock fields
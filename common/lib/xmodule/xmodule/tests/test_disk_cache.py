@@ -0,0 +1,143 @@
+"""
+Tests for the disk cache of large assets.
+"""
+import os
+import shutil
+import StringIO
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from xmodule.contentstore import disk_cache
+from xmodule.contentstore.disk_cache import AssetDiskCache
+
+
+class AssetDiskCacheTest(unittest.TestCase):
+    """
+    Tests of AssetDiskCache.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = AssetDiskCache(self.directory, max_size=25)
+
+    def put(self, key, content_digest, data):
+        """
+        Put `data` in the cache, and return what's read back from the copy.
+        """
+        with self.cache.put(key, content_digest, StringIO.StringIO(data)) as cached_file:
+            return cached_file.read()
+
+    def age(self, key, content_digest, seconds):
+        """
+        Make the copy look `seconds` older.
+        """
+        path = self.cache.path(key, content_digest)
+        mtime = os.stat(path).st_mtime - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_put_and_open(self):
+        self.assertIsNone(self.cache.open(u'asset', 'digest'))
+        self.assertEqual(self.put(u'asset', 'digest', 'the bytes'), 'the bytes')
+        with self.cache.open(u'asset', 'digest') as cached_file:
+            self.assertEqual(cached_file.read(), 'the bytes')
+        # copies are per content
+        self.assertIsNone(self.cache.open(u'asset', 'other digest'))
+
+    def test_delete(self):
+        self.put(u'asset', 'digest', 'the bytes')
+        self.put(u'asset', 'other digest', 'other bytes')
+        self.put(u'other asset', 'digest', 'the bytes')
+        self.cache.delete(u'asset')
+        self.assertIsNone(self.cache.open(u'asset', 'digest'))
+        self.assertIsNone(self.cache.open(u'asset', 'other digest'))
+        self.assertIsNotNone(self.cache.open(u'other asset', 'digest'))
+        # deleting what isn't cached is a noop
+        self.cache.delete(u'asset')
+
+    def test_least_recently_used_evicted(self):
+        self.put(u'first', 'digest', 'x' * 10)
+        self.age(u'first', 'digest', 30)
+        self.put(u'second', 'digest', 'x' * 10)
+        self.age(u'second', 'digest', 20)
+        # using the first makes the second the least recently used
+        self.cache.open(u'first', 'digest').close()
+
+        self.put(u'third', 'digest', 'x' * 10)
+        self.assertIsNotNone(self.cache.open(u'first', 'digest'))
+        self.assertIsNone(self.cache.open(u'second', 'digest'))
+        self.assertIsNotNone(self.cache.open(u'third', 'digest'))
+
+    def test_fill(self):
+        started = threading.Event()
+        release = threading.Event()
+        sources = []
+
+        def open_source():
+            """
+            Open the bytes of the asset, once the test lets it.
+            """
+            sources.append(None)
+            started.set()
+            release.wait()
+            return StringIO.StringIO('the bytes')
+
+        self.cache.fill(u'asset', 'digest', open_source)
+        started.wait()
+        # The copy is being made once
+        self.cache.fill(u'asset', 'digest', open_source)
+        self.assertIsNone(self.cache.open(u'asset', 'digest'))
+        release.set()
+        self.cache.wait_for_fills()
+
+        self.assertEqual(len(sources), 1)
+        with self.cache.open(u'asset', 'digest') as cached_file:
+            self.assertEqual(cached_file.read(), 'the bytes')
+
+    def test_fill_by_another_process(self):
+        other_process_cache = AssetDiskCache(self.directory)
+        with patch.object(other_process_cache, '_fill'):
+            other_process_cache.fill(u'asset', 'digest', lambda: StringIO.StringIO('the bytes'))
+
+        self.cache.fill(u'asset', 'digest', lambda: StringIO.StringIO('the bytes'))
+        self.cache.wait_for_fills()
+        self.assertIsNone(self.cache.open(u'asset', 'digest'))
+
+        # Unless the other process seems to have died
+        with patch.object(disk_cache, 'FILL_TIMEOUT', -1):
+            self.cache.fill(u'asset', 'digest', lambda: StringIO.StringIO('the bytes'))
+            self.cache.wait_for_fills()
+        self.assertIsNotNone(self.cache.open(u'asset', 'digest'))
+
+    def test_sizes_indexed(self):  # pylint: disable=protected-access
+        self.put(u'first', 'digest', 'x' * 10)
+        with patch.object(self.cache, '_count_copies', wraps=self.cache._count_copies) as count_copies:
+            self.put(u'second', 'digest', 'x' * 10)
+            self.assertFalse(count_copies.called)
+
+            # Walks to evict, once the copies take too much space
+            self.put(u'third', 'digest', 'x' * 10)
+            self.assertEqual(count_copies.call_count, 1)
+        self.assertEqual(
+            len([copy for copy in [u'first', u'second', u'third'] if self.cache.open(copy, 'digest') is not None]),
+            2
+        )
+
+        # Deleted copies no longer count
+        self.cache.delete(u'second')
+        self.cache.delete(u'third')
+        with patch.object(self.cache, '_count_copies', wraps=self.cache._count_copies) as count_copies:
+            self.put(u'fourth', 'digest', 'x' * 10)
+            self.assertFalse(count_copies.called)
+
+    def test_sendfile_location(self):
+        path = self.cache.path(u'asset', 'digest')
+        self.assertEqual(self.cache.sendfile_location(path), path)
+
+        cache = AssetDiskCache(self.directory, sendfile_header='X-Accel-Redirect', sendfile_root='/cached_assets/')
+        self.assertEqual(
+            cache.sendfile_location(path),
+            '/cached_assets/' + os.path.relpath(path, self.directory)
+        )
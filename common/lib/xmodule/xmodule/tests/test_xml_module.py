@@ -11,7 +11,9 @@ from xblock.fields import Scope, String, Dict, Boolean, Integer, Float, Any, Lis
 from xblock.runtime import KvsFieldData, DictKeyValueStore
 
 from xmodule.fields import Date, Timedelta, RelativeTime
-from xmodule.modulestore.inheritance import InheritanceKeyValueStore, InheritanceMixin, InheritingFieldData
+from xmodule.modulestore.inheritance import (
+    InheritanceKeyValueStore, InheritanceMixin, InheritingFieldData, compute_inherited_settings
+)
 from xmodule.xml_module import XmlDescriptor, serialize_field, deserialize_field
 from xmodule.course_module import CourseDescriptor
 from xmodule.seq_module import SequenceDescriptor
@@ -131,6 +133,57 @@ class InheritingFieldDataTest(unittest.TestCase):
         child.parent = "parent"
         self.assertEqual(child.not_inherited, "nothing")
 
+    def test_precomputed_inherited_settings(self):
+        # Precomputed inherited settings are used instead of walking up the ancestors.
+        parent = self.get_a_block(usage_id="parent")
+        parent.inherited = "Changed!"
+        self.field_data = InheritingFieldData(
+            inheritable_names=['inherited'],
+            inherited_settings={'inherited': "Precomputed"},
+            kvs=DictKeyValueStore({}),
+        )
+        child = self.get_a_block(usage_id="child")
+        child.parent = "parent"
+        self.assertEqual(child.inherited, "Precomputed")
+        self.assertEqual(child.not_inherited, "nothing")
+
+    def test_precomputed_nothing_inherited(self):
+        self.field_data = InheritingFieldData(
+            inheritable_names=['inherited'],
+            inherited_settings={},
+            kvs=DictKeyValueStore({}),
+        )
+        block = self.get_a_block()
+        self.assertEqual(block.inherited, "the default")
+
+
+class ComputeInheritedSettingsTest(unittest.TestCase):
+    """Tests of compute_inherited_settings."""
+
+    def test_compute_inherited_settings(self):
+        children = {
+            'course': ['chapter', 'other_chapter'],
+            'chapter': ['sequential'],
+            'other_chapter': [],
+            'sequential': [],
+            'orphan': [],
+        }
+        settings = {
+            'course': {'due': 'course due', 'graceperiod': 'course grace'},
+            'chapter': {'due': 'chapter due', 'display_name': 'Chapter'},
+            'other_chapter': {},
+            'sequential': {},
+            'orphan': {'due': 'orphan due'},
+        }
+        inherited = compute_inherited_settings(
+            ['course', 'orphan'], children.get, settings.get, inheritable_names=['due', 'graceperiod']
+        )
+        self.assertEqual(inherited['course'], {})
+        self.assertEqual(inherited['orphan'], {})
+        self.assertEqual(inherited['chapter'], {'due': 'course due', 'graceperiod': 'course grace'})
+        self.assertEqual(inherited['other_chapter'], {'due': 'course due', 'graceperiod': 'course grace'})
+        self.assertEqual(inherited['sequential'], {'due': 'chapter due', 'graceperiod': 'course grace'})
+
 
 
 class EditableMetadataFieldsTest(unittest.TestCase):
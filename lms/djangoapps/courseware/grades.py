@@ -1,6 +1,7 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 from collections import defaultdict
+from datetime import datetime
 import json
 import random
 import logging
@@ -9,6 +10,7 @@ from contextlib import contextmanager
 from django.conf import settings
 from django.db import transaction
 from django.test.client import RequestFactory
+from pytz import UTC
 
 import dogstats_wrapper as dog_stats_api
 
@@ -20,7 +22,7 @@ from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
-from .models import StudentModule
+from .models import StudentModule, StudentSubsectionScore
 from .module_render import get_module_for_descriptor
 from submissions import api as sub_api  # installed from the edx-submissions repository
 from opaque_keys import InvalidKeyError
@@ -140,6 +142,112 @@ def answer_distributions(course_key):
 
     return answer_counts
 
+
+class StudentModuleCache(object):
+    """
+    All of the StudentModule rows for one student in one course, fetched
+    together and indexed by usage key.
+
+    Grading a student touches every scored problem in the course, so looking
+    each StudentModule up individually costs one query per section and one
+    more per problem. Building one of these up front lets `_grade`,
+    `_progress_summary` and `get_score` answer from memory instead.
+    """
+    def __init__(self, course_key, student):
+        self.course_key = course_key
+        self._modules = {}
+        if student.is_authenticated():
+            student_modules = StudentModule.objects.filter(
+                student=student,
+                course_id=course_key,
+            )
+            for student_module in student_modules.iterator():
+                usage_key = student_module.module_state_key.map_into_course(course_key)
+                self._modules[usage_key] = student_module
+
+    def get(self, usage_key):
+        """
+        Return the StudentModule for `usage_key`, or None if the student
+        has no state for it.
+        """
+        return self._modules.get(usage_key.map_into_course(self.course_key))
+
+    def has_any(self, usage_keys):
+        """
+        Return True if the student has state for any of `usage_keys`.
+        """
+        return any(self.get(usage_key) is not None for usage_key in usage_keys)
+
+    def student_modules(self):
+        """
+        Return all of the student's StudentModules in the course.
+        """
+        return self._modules.values()
+
+
+def _module_creator(student, request, course, student_module_cache):
+    """
+    Return a function that creates the XModule for a descriptor while grading
+    `student`.
+
+    The modules' user state comes from `student_module_cache`, and their other
+    student data is fetched once for all of the course's graded descriptors,
+    so creating a module doesn't query the database for them.
+    """
+    student_modules = student_module_cache.student_modules()
+    field_data_cache = FieldDataCache(
+        course.grading_context['all_descriptors'], course.id, student, student_modules=student_modules
+    )
+    cached_locations = set(descriptor.location for descriptor in field_data_cache.descriptors)
+
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        if descriptor.location in cached_locations:
+            descriptor_field_data_cache = field_data_cache
+        else:
+            # e.g. a child chosen by a module with dynamic children
+            with manual_transaction():
+                descriptor_field_data_cache = FieldDataCache(
+                    [descriptor], course.id, student, student_modules=student_modules
+                )
+        # TODO: We need the request to pass into here. If we could forego that, our arguments
+        # would be simpler
+        return get_module_for_descriptor(student, request, descriptor, descriptor_field_data_cache, course.id)
+
+    return create_module
+
+
+def _content_version(descriptor):
+    """
+    Return a string identifying the version of the content in the subtree of
+    `descriptor`, or an empty string if its modulestore doesn't track edits
+    (as the XML modulestore doesn't), in which case its scores can't be
+    persisted.
+    """
+    get_subtree_edited_on = getattr(descriptor.runtime, 'get_subtree_edited_on', None)
+    if get_subtree_edited_on is None:
+        return u''
+    edited_on = get_subtree_edited_on(descriptor)
+    return unicode(edited_on) if edited_on is not None else u''
+
+
+def _record_subsections(course):
+    """
+    Record which graded subsection each scored block of `course` is in, so that
+    `StudentSubsectionScore.invalidate` can find it without walking up the
+    course tree. This is done once per course descriptor.
+    """
+    if getattr(course, '_subsections_recorded', False):
+        return
+    subsections = {}
+    for sections in course.grading_context['graded_sections'].itervalues():
+        for section in sections:
+            for descriptor in section['xmoduledescriptors']:
+                subsections[descriptor.location] = section['section_descriptor'].location
+    StudentSubsectionScore.record_subsections(course.id, subsections)
+    setattr(course, '_subsections_recorded', True)
+
+
 @transaction.commit_manually
 def grade(student, request, course, keep_raw_scores=False):
     """
@@ -181,6 +289,18 @@ def _grade(student, request, course, keep_raw_scores):
         course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id)
     )
 
+    # Subsection scores persisted by earlier grade computations. These aren't
+    # used when raw scores are requested, since they don't record the
+    # individual problem scores, but are still read so that the scores
+    # computed instead can be saved (see StudentSubsectionScore.save_score).
+    with manual_transaction():
+        persisted_scores = StudentSubsectionScore.scores_for(student, course.id)
+    now = datetime.now(UTC)
+
+    # Only needed for subsections without a usable persisted score
+    student_module_cache = None
+    create_module = None
+
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
@@ -193,67 +313,92 @@ def _grade(student, request, course, keep_raw_scores):
             # some problems have state that is updated independently of interaction
             # with the LMS, so they need to always be scored. (E.g. foldit.,
             # combinedopenended)
-            should_grade_section = any(
+            always_recalculate = any(
                 descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']
             )
 
             # If there are no problems that always have to be regraded, check to
             # see if any of our locations are in the scores from the submissions
             # API. If scores exist, we have to calculate grades for this section.
-            if not should_grade_section:
-                should_grade_section = any(
-                    descriptor.location.to_deprecated_string() in submissions_scores
-                    for descriptor in section['xmoduledescriptors']
-                )
-
-            if not should_grade_section:
-                with manual_transaction():
-                    should_grade_section = StudentModule.objects.filter(
-                        student=student,
-                        module_state_key__in=[
-                            descriptor.location for descriptor in section['xmoduledescriptors']
-                        ]
-                    ).exists()
-
-            # If we haven't seen a single problem in the section, we don't have
-            # to grade it at all! We can assume 0%
-            if should_grade_section:
-                scores = []
+            has_submissions_scores = any(
+                descriptor.location.to_deprecated_string() in submissions_scores
+                for descriptor in section['xmoduledescriptors']
+            )
 
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
+            # Scores that can change without a grade event being published in the
+            # LMS have to be recomputed every time, and so do those of sections
+            # whose problems depend on the student's group or on whether they
+            # have been released yet, which the content version doesn't capture.
+            unreleased = section['latest_start'] is not None and section['latest_start'] > now
+            persist_score = not (
+                always_recalculate or has_submissions_scores or settings.GENERATE_PROFILE_SCORES or
+                section['has_dynamic_children'] or unreleased
+            )
+            content_version = _content_version(section_descriptor) if persist_score else u''
+            persist_score = persist_score and bool(content_version)
+            persisted_score = persisted_scores.get(section_descriptor.location)
+            generation = persisted_score.generation if persisted_score is not None else None
+
+            if (
+                    persist_score and not keep_raw_scores and persisted_score is not None and
+                    persisted_score.is_valid and persisted_score.content_version == content_version
+            ):
+                graded_total = Score(persisted_score.earned_graded, persisted_score.possible_graded, True, section_name)
+            else:
+                if student_module_cache is None:
+                    # Scores are invalidated by subsection, so the subsections
+                    # must be recorded before the StudentModules are read.
+                    _record_subsections(course)
                     with manual_transaction():
-                        field_data_cache = FieldDataCache([descriptor], course.id, student)
-                    return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
+                        student_module_cache = StudentModuleCache(course.id, student)
+                        create_module = _module_creator(student, request, course, student_module_cache)
 
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+                should_grade_section = always_recalculate or has_submissions_scores
 
-                    (correct, total) = get_score(
-                        course.id, student, module_descriptor, create_module, scores_cache=submissions_scores
+                if not should_grade_section:
+                    should_grade_section = student_module_cache.has_any(
+                        descriptor.location for descriptor in section['xmoduledescriptors']
                     )
-                    if correct is None and total is None:
-                        continue
-
-                    if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
-                        if total > 1:
-                            correct = random.randrange(max(total - 2, 1), total + 1)
-                        else:
-                            correct = total
 
-                    graded = module_descriptor.graded
-                    if not total > 0:
-                        #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
-                        graded = False
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
-
-                _, graded_total = graders.aggregate_scores(scores, section_name)
-                if keep_raw_scores:
-                    raw_scores += scores
-            else:
-                graded_total = Score(0.0, 1.0, True, section_name)
+                # If we haven't seen a single problem in the section, we don't have
+                # to grade it at all! We can assume 0%
+                if should_grade_section:
+                    scores = []
+
+                    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+
+                        (correct, total) = get_score(
+                            course.id, student, module_descriptor, create_module, scores_cache=submissions_scores,
+                            student_module_cache=student_module_cache
+                        )
+                        if correct is None and total is None:
+                            continue
+
+                        if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
+                            if total > 1:
+                                correct = random.randrange(max(total - 2, 1), total + 1)
+                            else:
+                                correct = total
+
+                        graded = module_descriptor.graded
+                        if not total > 0:
+                            #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
+                            graded = False
+
+                        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+                    all_total, graded_total = graders.aggregate_scores(scores, section_name)
+                    if keep_raw_scores:
+                        raw_scores += scores
+
+                    if persist_score:
+                        with manual_transaction():
+                            StudentSubsectionScore.save_score(
+                                student, course.id, section_descriptor.location, generation, content_version,
+                                all_total, graded_total
+                            )
+                else:
+                    graded_total = Score(0.0, 1.0, True, section_name)
 
             #Add the graded total to totaled_scores
             if graded_total.possible > 0:
@@ -348,6 +493,9 @@ def _progress_summary(student, request, course):
 
     submissions_scores = sub_api.get_scores(course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id))
 
+    with manual_transaction():
+        student_module_cache = StudentModuleCache(course.id, student)
+
     chapters = []
     # Don't include chapters that aren't displayable (e.g. due to error)
     for chapter_module in course_module.get_display_items():
@@ -371,7 +519,8 @@ def _progress_summary(student, request, course):
                 for module_descriptor in yield_dynamic_descriptor_descendents(section_module, module_creator):
                     course_id = course.id
                     (correct, total) = get_score(
-                        course_id, student, module_descriptor, module_creator, scores_cache=submissions_scores
+                        course_id, student, module_descriptor, module_creator, scores_cache=submissions_scores,
+                        student_module_cache=student_module_cache
                     )
                     if correct is None and total is None:
                         continue
@@ -403,7 +552,7 @@ def _progress_summary(student, request, course):
     return chapters
 
 
-def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None):
+def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None, student_module_cache=None):
     """
     Return the score for a user on a problem, as a tuple (correct, total).
     e.g. (5,7) if you got 5 out of 7 points.
@@ -417,6 +566,9 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
            Can return None if user doesn't have access, or if something else went wrong.
     scores_cache: A dict of location names to (earned, possible) point tuples.
            If an entry is found in this cache, it takes precedence.
+    student_module_cache: A StudentModuleCache for this user and course. If
+           given, the StudentModule for the problem is read from it instead of
+           being queried from the database.
     """
     scores_cache = scores_cache or {}
 
@@ -443,14 +595,17 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
         # These are not problems, and do not have a score
         return (None, None)
 
-    try:
-        student_module = StudentModule.objects.get(
-            student=user,
-            course_id=course_id,
-            module_state_key=problem_descriptor.location
-        )
-    except StudentModule.DoesNotExist:
-        student_module = None
+    if student_module_cache is not None:
+        student_module = student_module_cache.get(problem_descriptor.location)
+    else:
+        try:
+            student_module = StudentModule.objects.get(
+                student=user,
+                course_id=course_id,
+                module_state_key=problem_descriptor.location
+            )
+        except StudentModule.DoesNotExist:
+            student_module = None
 
     if student_module is not None and student_module.max_grade is not None:
         correct = student_module.grade if student_module.grade is not None else 0
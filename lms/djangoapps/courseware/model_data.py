@@ -2,6 +2,7 @@
 Classes to provide the LMS runtime data storage to XBlocks
 """
 
+import copy
 import json
 from collections import defaultdict
 from itertools import chain
@@ -46,7 +47,7 @@ class FieldDataCache(object):
     A cache of django model objects needed to supply the data
     for a module and its decendants
     """
-    def __init__(self, descriptors, course_id, user, select_for_update=False):
+    def __init__(self, descriptors, course_id, user, select_for_update=False, student_modules=None):
         '''
         Find any courseware.models objects that are needed by any descriptor
         in descriptors. Attempts to minimize the number of queries to the database.
@@ -58,10 +59,17 @@ class FieldDataCache(object):
         course_id: The id of the current course
         user: The user for which to cache data
         select_for_update: True if rows should be locked until end of transaction
+        student_modules: The user's StudentModules in this course, if they have
+            already been fetched. The user_state of any descriptor is then looked
+            up among them, instead of being queried for.
         '''
         self.cache = {}
+        # maps StudentModules to a tuple of the state json they were last
+        # decoded from and the decoded state dict
+        self._user_states = {}
         self.descriptors = descriptors
         self.select_for_update = select_for_update
+        self.student_modules = student_modules
 
         assert isinstance(course_id, CourseKey)
         self.course_id = course_id
@@ -145,6 +153,8 @@ class FieldDataCache(object):
         Queries the database for all of the fields in the specified scope
         """
         if scope == Scope.user_state:
+            if self.student_modules is not None:
+                return self.student_modules
             return self._chunked_query(
                 StudentModule,
                 'module_state_key__in',
@@ -272,6 +282,27 @@ class FieldDataCache(object):
         self.cache[cache_key] = field_object
         return field_object
 
+    def user_state(self, student_module):
+        '''
+        Return the decoded state dict of `student_module`. The state json is only
+        decoded again if it has been replaced since it was last decoded, so reading
+        many fields of a module decodes its state once.
+
+        The dict is shared: modify it only with `set_user_state`.
+        '''
+        raw_state, state = self._user_states.get(student_module, (None, None))
+        if raw_state is not student_module.state:
+            state = json.loads(student_module.state)
+            self._user_states[student_module] = (student_module.state, state)
+        return state
+
+    def set_user_state(self, student_module, state):
+        '''
+        Serialize the (modified) `state` dict into `student_module`, without saving it.
+        '''
+        student_module.state = json.dumps(state)
+        self._user_states[student_module] = (student_module.state, state)
+
 
 class DjangoKeyValueStore(KeyValueStore):
     """
@@ -310,7 +341,11 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            value = self._field_data_cache.user_state(field_object)[key.field_name]
+            # the decoded state is shared, so don't hand out its mutable values
+            if isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)
+            return value
         else:
             return json.loads(field_object.value)
 
@@ -331,6 +366,9 @@ class DjangoKeyValueStore(KeyValueStore):
         saved_fields = []
         # field_objects maps a field_object to a list of associated fields
         field_objects = dict()
+        # user_states maps a StudentModule to its modified state, which is
+        # serialized once, however many of its fields are set
+        user_states = dict()
         for field in kv_dict:
             # Check field for validity
             if field.scope not in self._allowed_scopes:
@@ -338,21 +376,24 @@ class DjangoKeyValueStore(KeyValueStore):
 
             # If the field is valid and isn't already in the dictionary, add it.
             field_object = self._field_data_cache.find_or_create(field)
-            if field_object not in field_objects.keys():
+            if field_object not in field_objects:
                 field_objects[field_object] = []
             # Update the list of associated fields
             field_objects[field_object].append(field)
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
             if field.scope == Scope.user_state:
-                state = json.loads(field_object.state)
-                state[field.field_name] = kv_dict[field]
-                field_object.state = json.dumps(state)
+                if field_object not in user_states:
+                    user_states[field_object] = self._field_data_cache.user_state(field_object)
+                user_states[field_object][field.field_name] = copy.deepcopy(kv_dict[field])
             else:
             # The remaining scopes save fields on different rows, so
             # we don't have to worry about conflicts
                 field_object.value = json.dumps(kv_dict[field])
 
+        for field_object, state in user_states.iteritems():
+            self._field_data_cache.set_user_state(field_object, state)
+
         for field_object in field_objects:
             try:
                 # Save the field object that we made above
@@ -373,9 +414,9 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
+            state = self._field_data_cache.user_state(field_object)
             del state[key.field_name]
-            field_object.state = json.dumps(state)
+            self._field_data_cache.set_user_state(field_object, state)
             field_object.save()
         else:
             field_object.delete()
@@ -389,6 +430,6 @@ class DjangoKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in self._field_data_cache.user_state(field_object)
         else:
             return True
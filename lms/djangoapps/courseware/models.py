@@ -14,9 +14,12 @@ ASSUMPTIONS: modules have unique IDs, even across different module_types
 """
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 from xmodule_django.models import CourseKeyField, LocationKeyField
 
@@ -259,3 +262,162 @@ class OfflineComputedGradeLog(models.Model):
 
     def __unicode__(self):
         return "[OCGLog] %s: %s" % (self.course_id.to_deprecated_string(), self.created)  # pylint: disable=no-member
+
+
+# How long the course structure recorded by StudentSubsectionScore.record_subsections is kept
+SUBSECTIONS_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+class StudentSubsectionScore(models.Model):
+    """
+    The score a student earned on one graded subsection of a course, as
+    aggregated by `xmodule.graders.aggregate_scores`.
+
+    Rows are written by `courseware.grades` after it computes a subsection's
+    score from StudentModules, and are invalidated whenever the score of a
+    problem inside the subsection changes, so that the next grade computation
+    recomputes only that subsection. `content_version` records the version of
+    the subsection's content the score was computed against; rows with a
+    different version are ignored, and invalidated rows have none.
+
+    `generation` is incremented by each invalidation. A score is only saved if
+    the generation hasn't changed since the StudentModules it was computed
+    from were read, so a score computed before a problem's score changed can't
+    overwrite the invalidation.
+    """
+    user = models.ForeignKey(User, db_index=True)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    usage_key = LocationKeyField(max_length=255, db_index=True)
+
+    content_version = models.CharField(max_length=255, blank=True, default='')
+    generation = models.IntegerField(default=0)
+
+    # Totals over every scored problem in the subsection
+    earned_all = models.FloatField()
+    possible_all = models.FloatField()
+    # Totals over the graded problems only; these are what the grader sees
+    earned_graded = models.FloatField()
+    possible_graded = models.FloatField()
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('user', 'course_id', 'usage_key'),)
+
+    @classmethod
+    def scores_for(cls, user, course_id):
+        """
+        Return a dict mapping subsection usage keys to the persisted scores of
+        `user` in `course_id`, including invalidated ones (see `is_valid`).
+        """
+        return {
+            score.usage_key.map_into_course(course_id): score
+            for score in cls.objects.filter(user=user, course_id=course_id)
+        }
+
+    @classmethod
+    def save_score(cls, user, course_id, usage_key, generation, content_version, all_total, graded_total):
+        """
+        Persist the `all_total` and `graded_total` Scores computed for the
+        subsection `usage_key`, unless its persisted score has changed since it
+        was read. `generation` is the generation of the persisted score that
+        was read before the StudentModules were, or None if there was none.
+
+        Returns whether the score was saved.
+        """
+        values = {
+            'content_version': content_version,
+            'earned_all': all_total.earned,
+            'possible_all': all_total.possible,
+            'earned_graded': graded_total.earned,
+            'possible_graded': graded_total.possible,
+        }
+        if generation is not None:
+            return bool(cls.objects.filter(
+                user=user, course_id=course_id, usage_key=usage_key, generation=generation
+            ).update(modified=timezone.now(), **values))
+        # If another computation saved the score first, or the score was
+        # invalidated since it was read, the row exists now.
+        return cls._create(user_id=user.id, course_id=course_id, usage_key=usage_key, **values)
+
+    @classmethod
+    def _create(cls, **values):
+        """
+        Create a row with `values`, and return True, or return False if the
+        row already exists.
+        """
+        sid = transaction.savepoint()
+        try:
+            cls.objects.create(**values)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            return False
+        transaction.savepoint_commit(sid)
+        return True
+
+    @property
+    def is_valid(self):
+        """
+        Whether this score can be used: it hasn't been invalidated since it
+        was saved.
+        """
+        return bool(self.content_version)
+
+    @classmethod
+    def record_subsections(cls, course_id, subsections):
+        """
+        Record the course structure `invalidate` needs: `subsections` maps the
+        usage key of each scored block in a graded subsection of `course_id`
+        to the usage key of that subsection.
+        """
+        cache.set(cls._subsections_cache_key(course_id), subsections, SUBSECTIONS_CACHE_TIMEOUT)
+
+    @classmethod
+    def invalidate(cls, user_id, course_id, usage_key):
+        """
+        Invalidate the persisted score of the subsection containing
+        `usage_key`, because the score of that problem has changed.
+        """
+        scores = cls.objects.filter(user__id=user_id, course_id=course_id)
+        invalidated = {'content_version': '', 'generation': F('generation') + 1}
+        subsections = cache.get(cls._subsections_cache_key(course_id))
+        if subsections is None:
+            # We can't tell which subsection holds the problem, so none of
+            # this student's persisted scores can be trusted.
+            scores.update(**invalidated)
+            return
+        subsection = subsections.get(usage_key.map_into_course(course_id))
+        if subsection is None:
+            return
+        if scores.filter(usage_key=subsection).update(**invalidated):
+            return
+        # Leave an invalidated row, so that a computation which read the
+        # StudentModules before this change can't save its score.
+        created = cls._create(
+            user_id=user_id, course_id=course_id, usage_key=subsection, content_version='', generation=1,
+            earned_all=0, possible_all=0, earned_graded=0, possible_graded=0,
+        )
+        if not created:
+            scores.filter(usage_key=subsection).update(**invalidated)
+
+    @staticmethod
+    def _subsections_cache_key(course_id):
+        """
+        Return the cache key of the subsections recorded for `course_id`.
+        """
+        return u'courseware.subsections.{}'.format(course_id)
+
+    def __unicode__(self):
+        return "[StudentSubsectionScore] %s: %s %s = %s/%s" % (
+            self.user, self.course_id, self.usage_key, self.earned_graded, self.possible_graded
+        )
+
+
+@receiver(post_delete, sender=StudentModule)
+def invalidate_subsection_scores(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Discard persisted subsection scores that included the deleted state.
+    """
+    if instance.max_grade is not None:
+        StudentSubsectionScore.invalidate(instance.student_id, instance.course_id, instance.module_state_key)
@@ -1,17 +1,26 @@
 """
 Test grade calculation.
 """
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
 from django.http import Http404
+from django.test.client import RequestFactory
 from django.test.utils import override_settings
 from mock import patch
+from pytz import UTC
 
+from courseware.tests.factories import StudentModuleFactory
 from courseware.tests.modulestore_config import TEST_DATA_MIXED_MODULESTORE
 from student.tests.factories import UserFactory
-from xmodule.modulestore.tests.factories import CourseFactory
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
 
-from courseware.grades import grade, iterate_grades_for
+from courseware.grades import grade, iterate_grades_for, StudentModuleCache
+from courseware.models import StudentSubsectionScore
+from xmodule.graders import Score
+from xmodule.modulestore.django import modulestore
 
 
 def _grade_with_errors(student, request, course, keep_raw_scores=False):
@@ -121,3 +130,204 @@ class TestGradeIteration(ModuleStoreTestCase):
                 students_to_errors[student] = err_msg
 
         return students_to_gradesets, students_to_errors
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestStudentModuleCache(ModuleStoreTestCase):
+    """
+    Test the per-student StudentModule index used while grading.
+    """
+    def setUp(self):
+        self.course = CourseFactory.create()
+        chapter = ItemFactory.create(parent=self.course, category='chapter')
+        self.problem = ItemFactory.create(parent=chapter, category='problem')
+        self.other_problem = ItemFactory.create(parent=chapter, category='problem')
+        self.student = UserFactory.create()
+        self.student_module = StudentModuleFactory.create(
+            student=self.student,
+            course_id=self.course.id,
+            module_state_key=self.problem.location,
+            grade=1,
+            max_grade=2,
+        )
+        # State for another student must not leak into the index
+        StudentModuleFactory.create(
+            course_id=self.course.id,
+            module_state_key=self.other_problem.location,
+        )
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            cache = StudentModuleCache(self.course.id, self.student)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(self.problem.location), self.student_module)
+            self.assertIsNone(cache.get(self.other_problem.location))
+
+    def test_has_any(self):
+        cache = StudentModuleCache(self.course.id, self.student)
+        self.assertTrue(cache.has_any([self.other_problem.location, self.problem.location]))
+        self.assertFalse(cache.has_any([self.other_problem.location]))
+        self.assertFalse(cache.has_any([]))
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestPersistedSubsectionScores(ModuleStoreTestCase):
+    """
+    Test that subsection scores are persisted and reused across grade computations.
+    """
+    def setUp(self):
+        course = CourseFactory.create()
+        chapter = ItemFactory.create(parent=course, category='chapter')
+        self.sequence = ItemFactory.create(
+            parent=chapter, category='sequential', metadata={'graded': True, 'format': 'Homework'}
+        )
+        self.problem = ItemFactory.create(parent=self.sequence, category='problem')
+        self.course = modulestore().get_course(course.id)
+
+        self.student = UserFactory.create()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.student
+        self.request.session = {}
+        self.student_module = StudentModuleFactory.create(
+            student=self.student,
+            course_id=self.course.id,
+            module_state_key=self.problem.location,
+            grade=1,
+            max_grade=2,
+        )
+
+    def _persisted_score(self, sequence=None):
+        """Return the valid persisted score of the test subsection (or `sequence`), if any."""
+        location = (sequence or self.sequence).location
+        score = StudentSubsectionScore.scores_for(self.student, self.course.id).get(location)
+        return score if score is not None and score.is_valid else None
+
+    def test_score_is_persisted(self):
+        self.assertIsNone(self._persisted_score())
+        first_grade = grade(self.student, self.request, self.course)
+
+        persisted_score = self._persisted_score()
+        self.assertEqual((persisted_score.earned_graded, persisted_score.possible_graded), (1, 2))
+
+        # The persisted score is used without touching StudentModule again
+        with patch('courseware.grades.StudentModuleCache') as mock_cache:
+            second_grade = grade(self.student, self.request, self.course)
+        self.assertFalse(mock_cache.called)
+        self.assertEqual(first_grade['percent'], second_grade['percent'])
+
+    def test_score_change_invalidates(self):
+        first_grade = grade(self.student, self.request, self.course)
+        StudentSubsectionScore.invalidate(self.student.id, self.course.id, self.problem.location)
+        self.assertIsNone(self._persisted_score())
+
+        self.student_module.grade = 2
+        self.student_module.save()
+        second_grade = grade(self.student, self.request, self.course)
+        self.assertGreater(second_grade['percent'], first_grade['percent'])
+        self.assertEqual(self._persisted_score().earned_graded, 2)
+
+    def test_deleted_state_invalidates(self):
+        grade(self.student, self.request, self.course)
+        self.student_module.delete()
+        self.assertIsNone(self._persisted_score())
+
+    def test_raw_scores_ignore_persisted(self):
+        grade(self.student, self.request, self.course)
+        grade_summary = grade(self.student, self.request, self.course, keep_raw_scores=True)
+        self.assertEqual(len(grade_summary['raw_scores']), 1)
+
+    def test_submissions_scores_ignore_persisted(self):
+        first_grade = grade(self.student, self.request, self.course)
+        submissions_scores = {self.problem.location.to_deprecated_string(): (2, 2)}
+        with patch('courseware.grades.sub_api.get_scores', return_value=submissions_scores):
+            second_grade = grade(self.student, self.request, self.course)
+        self.assertGreater(second_grade['percent'], first_grade['percent'])
+
+    def test_invalidate_other_block(self):
+        grade(self.student, self.request, self.course)
+        StudentSubsectionScore.invalidate(self.student.id, self.course.id, self.course.location)
+        self.assertIsNotNone(self._persisted_score())
+
+    def test_invalidate_without_recorded_subsections(self):
+        grade(self.student, self.request, self.course)
+        cache.clear()
+        StudentSubsectionScore.invalidate(self.student.id, self.course.id, self.course.location)
+        self.assertIsNone(self._persisted_score())
+
+    def _invalidate_before_save(self):
+        """
+        Patch save_score to invalidate the problem's subsection before saving,
+        as a new score for the problem committed while grading would.
+        """
+        save_score = StudentSubsectionScore.save_score
+
+        def invalidate_and_save(*args):
+            """Invalidate the score, then save."""
+            StudentSubsectionScore.invalidate(self.student.id, self.course.id, self.problem.location)
+            return save_score(*args)
+
+        return patch.object(StudentSubsectionScore, 'save_score', side_effect=invalidate_and_save)
+
+    def test_stale_score_not_saved(self):
+        with self._invalidate_before_save():
+            grade(self.student, self.request, self.course)
+        self.assertIsNone(self._persisted_score())
+
+    def test_stale_score_not_saved_over_invalidated(self):
+        grade(self.student, self.request, self.course)
+        StudentSubsectionScore.invalidate(self.student.id, self.course.id, self.problem.location)
+        with self._invalidate_before_save():
+            grade(self.student, self.request, self.course)
+        self.assertIsNone(self._persisted_score())
+
+        grade(self.student, self.request, self.course)
+        self.assertIsNotNone(self._persisted_score())
+
+    def test_concurrent_saves(self):
+        score = Score(1, 2, True, 'Homework')
+        args = (self.student, self.course.id, self.sequence.location, None, u'version', score, score)
+        self.assertTrue(StudentSubsectionScore.save_score(*args))
+        # the row another computation saved first is kept
+        self.assertFalse(StudentSubsectionScore.save_score(*args))
+        self.assertIsNotNone(self._persisted_score())
+
+    def test_unreleased_not_persisted(self):
+        sequence = ItemFactory.create(
+            parent=self.sequence.get_parent(), category='sequential', metadata={'graded': True, 'format': 'Homework'}
+        )
+        ItemFactory.create(
+            parent=sequence, category='problem', metadata={'start': datetime.now(UTC) + timedelta(days=1)}
+        )
+        course = modulestore().get_course(self.course.id)
+        grade(self.student, self.request, course)
+        self.assertIsNotNone(self._persisted_score())
+        self.assertIsNone(self._persisted_score(sequence))
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestXmlCourseScoresNotPersisted(ModuleStoreTestCase):
+    """
+    Test that subsection scores aren't persisted for XML courses, whose
+    modulestore doesn't track content versions.
+    """
+    def test_scores_not_persisted(self):
+        course = modulestore().get_course(SlashSeparatedCourseKey('edX', 'graded', '2012_Fall'))
+        student = UserFactory.create()
+        request = RequestFactory().get('/')
+        request.user = student
+        request.session = {}
+        StudentModuleFactory.create(
+            student=student,
+            course_id=course.id,
+            module_state_key=course.id.make_usage_key('problem', 'H2P1'),
+            grade=1,
+            max_grade=2,
+        )
+        first_grade = grade(student, request, course)
+        self.assertGreater(first_grade['percent'], 0)
+        self.assertFalse(StudentSubsectionScore.objects.filter(user=student).exists())
+
+        with patch('courseware.grades.StudentModuleCache', wraps=StudentModuleCache) as mock_cache:
+            second_grade = grade(student, request, course)
+        self.assertTrue(mock_cache.called)
+        self.assertEqual(first_grade['percent'], second_grade['percent'])
@@ -175,6 +175,60 @@ class TestStudentModuleStorage(OtherUserFailureTestMixin, TestCase):
                 self.kvs.set_many(kv_dict)
         self.assertEquals(len(exception_context.exception.saved_field_names), 0)
 
+    def test_state_decoded_once(self):
+        "Test that reading many fields of a StudentModule decodes its state once"
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEquals('a_value', self.kvs.get(user_state_key('a_field')))
+            self.assertEquals('b_value', self.kvs.get(user_state_key('b_field')))
+            self.assertTrue(self.kvs.has(user_state_key('a_field')))
+        self.assertEquals(mock_loads.call_count, 1)
+
+    def test_set_many_serializes_once(self):
+        "Test that setting many fields of a StudentModule serializes and saves it once"
+        kv_dict = self.construct_kv_dict()
+        save = StudentModule.save
+        with patch('courseware.model_data.json.dumps', wraps=json.dumps) as mock_dumps:
+            with patch.object(StudentModule, 'save', autospec=True, side_effect=save) as mock_save:
+                self.kvs.set_many(kv_dict)
+        self.assertEquals(mock_dumps.call_count, 1)
+        self.assertEquals(mock_save.call_count, 1)
+        self.assertEquals(
+            {'a_field': 'a_value', 'b_field': 'b_value', 'field_a': 'new value', 'field_b': 'newer value'},
+            json.loads(StudentModule.objects.all()[0].state)
+        )
+
+    def test_get_mutable_value(self):
+        "Test that mutating a value read from a StudentModule doesn't change the stored state"
+        self.kvs.set(user_state_key('a_field'), ['a_value'])
+        self.kvs.get(user_state_key('a_field')).append('unsaved')
+        self.assertEquals(['a_value'], self.kvs.get(user_state_key('a_field')))
+
+    def test_state_replaced(self):
+        "Test that replacing the state of a cached StudentModule is noticed"
+        student_module = self.field_data_cache.find(user_state_key('a_field'))
+        self.kvs.get(user_state_key('a_field'))
+        student_module.state = json.dumps({'a_field': 'replaced'})
+        self.assertEquals('replaced', self.kvs.get(user_state_key('a_field')))
+
+
+class TestPrefetchedStudentModules(TestCase):
+    """Tests for user_state storage via StudentModules that were already fetched"""
+    def setUp(self):
+        self.student_module = StudentModuleFactory(state=json.dumps({'a_field': 'a_value'}))
+        self.user = self.student_module.student
+        self.assertEqual(self.user.id, 1)   # check our assumption hard-coded in the key functions above.
+
+    def test_get_existing_field(self):
+        "Test that fields are read from the prefetched StudentModules without querying for them"
+        with self.assertNumQueries(0):
+            field_data_cache = FieldDataCache(
+                [mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user,
+                student_modules=[self.student_module]
+            )
+            kvs = DjangoKeyValueStore(field_data_cache)
+            self.assertEquals('a_value', kvs.get(user_state_key('a_field')))
+        self.assertIs(self.student_module, field_data_cache.find(user_state_key('a_field')))
+
 
 class TestMissingStudentModule(TestCase):
     def setUp(self):
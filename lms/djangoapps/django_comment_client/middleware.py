@@ -1,4 +1,5 @@
 from lms.lib.comment_client import CommentClientRequestError
+from lms.lib.comment_client.utils import start_coalescing_requests, stop_coalescing_requests
 from django_comment_client.utils import JsonError
 import json
 import logging
@@ -22,3 +23,19 @@ class AjaxExceptionMiddleware(object):
             except ValueError:
                 return JsonError(exception.message, exception.status_code)
         return None
+
+
+class CoalescedRequestsMiddleware(object):
+    """
+    Middleware that makes identical GET requests to the comments service,
+    during a request, share a single response.
+    """
+    def process_request(self, request):
+        start_coalescing_requests()
+
+    def process_response(self, request, response):
+        stop_coalescing_requests()
+        return response
+
+    def process_exception(self, request, exception):
+        stop_coalescing_requests()
@@ -4,27 +4,61 @@ Module for checking permissions with the comment_client backend
 
 import logging
 from types import NoneType
-from django.core import cache
+from crum import get_current_request
 from lms.lib.comment_client import Thread
 from opaque_keys.edx.keys import CourseKey
+from request_cache.middleware import RequestCache
 
-CACHE = cache.get_cache('default')
-CACHE_LIFESPAN = 60
+from django_comment_common.models import FORUM_ROLE_STUDENT
+from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.exceptions import ItemNotFoundError
 
 
 def cached_has_permission(user, permission, course_id=None):
     """
-    Call has_permission if it's not cached. A change in a user's role or
-    a role's permissions will only become effective after CACHE_LIFESPAN seconds.
+    Check whether the user has the permission in the course. All the user's
+    permissions in the course are loaded together, once per request.
     """
     assert isinstance(course_id, (NoneType, CourseKey))
-    key = u"permission_{user_id:d}_{course_id}_{permission}".format(
-        user_id=user.id, course_id=course_id, permission=permission)
-    val = CACHE.get(key, None)
-    if val not in [True, False]:
-        val = has_permission(user, permission, course_id=course_id)
-        CACHE.set(key, val, CACHE_LIFESPAN)
-    return val
+    return permission in _get_permissions(user, course_id)
+
+
+def _get_permissions(user, course_id):
+    """
+    Returns the names of the permissions the user has in the course, from the
+    request cache if they've been loaded during this request.
+
+    Outside of a request (in a Celery task or a management command) nothing
+    clears the request cache, so the permissions are loaded every time, lest
+    a role revoked since be honored for the life of the process.
+    """
+    request_cache = getattr(RequestCache.get_request_cache(), 'data', None)
+    if request_cache is None or get_current_request() is None:
+        return _load_permissions(user, course_id)
+    permissions_cache = request_cache.setdefault('django_comment_client.permissions', {})
+    key = (user.id, unicode(course_id))
+    if key not in permissions_cache:
+        permissions_cache[key] = _load_permissions(user, course_id)
+    return permissions_cache[key]
+
+
+def _load_permissions(user, course_id):
+    """
+    Returns the names of the permissions the user's roles in the course give
+    them, as `Role.has_permission` would check them.
+    """
+    permissions = set()
+    course = None
+    for role in user.roles.filter(course_id=course_id).prefetch_related('permissions'):
+        if course is None:
+            course = modulestore().get_course(course_id)
+            if course is None:
+                raise ItemNotFoundError(course_id)
+        names = set(permission.name for permission in role.permissions.all())
+        if role.name == FORUM_ROLE_STUDENT and not course.forum_posts_allowed:
+            names = set(name for name in names if not name.startswith(('edit', 'update', 'create')))
+        permissions.update(names)
+    return frozenset(permissions)
 
 
 def has_permission(user, permission, course_id=None):
@@ -38,7 +72,7 @@ def has_permission(user, permission, course_id=None):
 CONDITIONS = ['is_open', 'is_author', 'is_question_author']
 
 
-def _check_condition(user, condition, content):
+def _check_condition(user, condition, content, thread=None):
     def check_open(user, content):
         try:
             return content and not content['closed']
@@ -57,6 +91,8 @@ def _check_condition(user, condition, content):
         try:
             if content["type"] == "thread":
                 return content["thread_type"] == "question" and content["user_id"] == str(user.id)
+            elif thread and thread.get("id") == content["thread_id"]:
+                return check_question_author(user, thread)
             else:
                 # N.B. This will trigger a comments service query
                 return check_question_author(user, Thread(id=content["thread_id"]).to_dict())
@@ -72,18 +108,21 @@ def _check_condition(user, condition, content):
     return handlers[condition](user, content)
 
 
-def _check_conditions_permissions(user, permissions, course_id, content):
+def _check_conditions_permissions(user, permissions, course_id, content, thread=None):
     """
     Accepts a list of permissions and proceed if any of the permission is valid.
     Note that ["can_view", "can_edit"] will proceed if the user has either
     "can_view" or "can_edit" permission. To use AND operator in between, wrap them in
     a list.
+
+    If `content` is a comment, `thread` may be the thread it's in, to check
+    conditions on the thread without fetching it.
     """
 
     def test(user, per, operator="or"):
         if isinstance(per, basestring):
             if per in CONDITIONS:
-                return _check_condition(user, per, content)
+                return _check_condition(user, per, content, thread)
             return cached_has_permission(user, per, course_id=course_id)
         elif isinstance(per, list) and operator in ["and", "or"]:
             results = [test(user, x, operator="and") for x in per]
@@ -123,10 +162,10 @@ VIEW_PERMISSIONS = {
 }
 
 
-def check_permissions_by_view(user, course_id, content, name):
+def check_permissions_by_view(user, course_id, content, name, thread=None):
     assert isinstance(course_id, CourseKey)
     try:
         p = VIEW_PERMISSIONS[name]
     except KeyError:
         logging.warning("Permission for view named %s does not exist in permissions.py" % name)
-    return _check_conditions_permissions(user, p, course_id, content)
+    return _check_conditions_permissions(user, p, course_id, content, thread)
@@ -0,0 +1,65 @@
+"""
+Tests for the comments service client's connection pooling and request coalescing.
+"""
+import threading
+
+import requests
+from django.test import TestCase
+from mock import patch
+
+import lms.lib.comment_client.utils as utils
+from terrain.stubs.comments import StubCommentsService
+
+
+class CommentClientSessionTestCase(TestCase):
+    """
+    Test the comments service client against a stub comments service.
+    """
+    def setUp(self):
+        self.server = StubCommentsService()
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{port}/api/v1/users/1'.format(port=self.server.port)
+        self.addCleanup(utils.stop_coalescing_requests)
+
+        self.request_patcher = patch.object(
+            requests.Session, 'request', autospec=True, side_effect=requests.Session.request
+        )
+        self.session_request = self.request_patcher.start()
+        self.addCleanup(self.request_patcher.stop)
+
+    def test_perform_request(self):
+        self.assertEqual(utils.perform_request('get', self.url)['id'], '1')
+        self.assertEqual(utils.perform_request('get', self.url)['id'], '1')
+        self.assertEqual(self.session_request.call_count, 2)
+
+    def test_session_per_thread(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(utils._get_session()))  # pylint: disable=protected-access
+        thread.start()
+        thread.join()
+        session = utils._get_session()  # pylint: disable=protected-access
+
+        self.assertIs(session, utils._get_session())  # pylint: disable=protected-access
+        self.assertIsNot(session, sessions[0])
+        # but they share their connections
+        self.assertIs(session.get_adapter(self.url), sessions[0].get_adapter(self.url))
+
+    def test_coalesced_gets(self):
+        utils.start_coalescing_requests()
+        first = utils.perform_request('get', self.url)
+        self.assertEqual(utils.perform_request('get', self.url), first)
+        self.assertEqual(self.session_request.call_count, 1)
+
+        # Different parameters make a different request
+        utils.perform_request('get', self.url, {'course_id': 'edX/999/Course'})
+        self.assertEqual(self.session_request.call_count, 2)
+
+        # Other requests may change what a GET returns
+        utils.perform_request('put', self.url, {'username': 'user', 'external_id': '1'})
+        utils.perform_request('get', self.url)
+        self.assertEqual(self.session_request.call_count, 4)
+
+    def test_not_coalesced(self):
+        utils.perform_request('get', self.url)
+        utils.perform_request('get', self.url)
+        self.assertEqual(self.session_request.call_count, 2)
@@ -3,6 +3,7 @@ from django.test import TestCase
 import json
 
 import lms.lib.comment_client
+import lms.lib.comment_client.utils as utils
 import django_comment_client.middleware as middleware
 
 
@@ -37,3 +38,22 @@ class AjaxExceptionTestCase(TestCase):
         self.assertIsNone(self.a.process_exception(self.request1, self.exception0))
         self.assertIsNone(self.a.process_exception(self.request0, self.exception1))
         self.assertIsNone(self.a.process_exception(self.request0, self.exception0))
+
+
+class CoalescedRequestsTestCase(TestCase):
+    def setUp(self):
+        self.middleware = middleware.CoalescedRequestsMiddleware()
+        self.request = django.http.HttpRequest()
+        self.addCleanup(utils.stop_coalescing_requests)
+
+    def test_coalescing_during_request(self):
+        self.middleware.process_request(self.request)
+        self.assertEqual(utils._local.responses, {})  # pylint: disable=protected-access
+        response = django.http.HttpResponse()
+        self.assertIs(self.middleware.process_response(self.request, response), response)
+        self.assertIsNone(utils._local.responses)  # pylint: disable=protected-access
+
+    def test_coalescing_stopped_by_exception(self):
+        self.middleware.process_request(self.request)
+        self.assertIsNone(self.middleware.process_exception(self.request, ValueError()))
+        self.assertIsNone(utils._local.responses)  # pylint: disable=protected-access
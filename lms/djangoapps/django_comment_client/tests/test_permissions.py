@@ -0,0 +1,90 @@
+"""
+Tests for django_comment_client.permissions
+"""
+from datetime import datetime, timedelta
+
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from mock import patch
+from pytz import UTC
+
+from courseware.tests.modulestore_config import TEST_DATA_MIXED_MODULESTORE
+from django_comment_client import permissions
+from django_comment_common.models import Role
+from django_comment_common.utils import seed_permissions_roles
+from request_cache.middleware import RequestCache
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.factories import CourseFactory
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class PermissionsTestCase(ModuleStoreTestCase):
+    """
+    Test the permission checks of the views.
+    """
+    def setUp(self):
+        super(PermissionsTestCase, self).setUp()
+        self.course = CourseFactory.create()
+        seed_permissions_roles(self.course.id)
+        self.student = UserFactory.create()
+        self.moderator = UserFactory.create()
+        CourseEnrollmentFactory(user=self.student, course_id=self.course.id)
+        CourseEnrollmentFactory(user=self.moderator, course_id=self.course.id)
+        self.moderator.roles.add(Role.objects.get(name="Moderator", course_id=self.course.id))
+        RequestCache().clear_request_cache()
+
+    @patch("django_comment_client.permissions.get_current_request", lambda: RequestFactory().get("/"))
+    def test_permissions_loaded_once_per_request(self):
+        self.assertTrue(permissions.cached_has_permission(self.student, "create_thread", self.course.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.cached_has_permission(self.student, "vote", self.course.id))
+            self.assertFalse(permissions.cached_has_permission(self.student, "openclose_thread", self.course.id))
+        self.assertTrue(permissions.cached_has_permission(self.moderator, "openclose_thread", self.course.id))
+
+        # A new request loads them again
+        RequestCache().clear_request_cache()
+        self.assertTrue(permissions.cached_has_permission(self.student, "vote", self.course.id))
+
+    @patch("django_comment_client.permissions.get_current_request", lambda: None)
+    def test_permissions_not_kept_outside_request(self):
+        self.assertTrue(permissions.cached_has_permission(self.moderator, "openclose_thread", self.course.id))
+        self.moderator.roles.remove(Role.objects.get(name="Moderator", course_id=self.course.id))
+        self.assertFalse(permissions.cached_has_permission(self.moderator, "openclose_thread", self.course.id))
+
+    def test_like_has_permission(self):
+        for permission in ["create_thread", "vote", "openclose_thread", "see_all_cohorts", "no_such_permission"]:
+            for user in [self.student, self.moderator]:
+                self.assertEqual(
+                    permissions.cached_has_permission(user, permission, self.course.id),
+                    permissions.has_permission(user, permission, self.course.id)
+                )
+
+    def test_forum_blackout(self):
+        now = datetime.now(UTC)
+        self.course.discussion_blackouts = [
+            [(now - timedelta(days=1)).isoformat(), (now + timedelta(days=1)).isoformat()]
+        ]
+        self.update_course(self.course, self.moderator.id)
+
+        self.assertFalse(permissions.cached_has_permission(self.student, "create_thread", self.course.id))
+        self.assertTrue(permissions.cached_has_permission(self.student, "vote", self.course.id))
+        # Moderators aren't restricted by their Student role
+        self.assertTrue(permissions.cached_has_permission(self.moderator, "create_thread", self.course.id))
+
+    @patch("django_comment_client.permissions.Thread")
+    def test_question_author_from_thread(self, mock_thread):
+        thread = {"id": "thread_id", "type": "thread", "thread_type": "question", "user_id": str(self.student.id)}
+        comment = {"id": "comment_id", "type": "comment", "thread_id": "thread_id", "user_id": str(self.moderator.id)}
+
+        self.assertTrue(
+            permissions.check_permissions_by_view(self.student, self.course.id, comment, "endorse_comment", thread)
+        )
+        self.assertFalse(mock_thread.called)
+
+        # Without the thread, it's fetched
+        mock_thread.return_value.to_dict.return_value = thread
+        self.assertTrue(
+            permissions.check_permissions_by_view(self.student, self.course.id, comment, "endorse_comment")
+        )
+        mock_thread.assert_called_once_with(id="thread_id")
@@ -12,6 +12,8 @@ from django_comment_client.tests.factories import RoleFactory
 from django_comment_client.tests.unicode import UnicodeTestMixin
 import django_comment_client.utils as utils
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
+from xmodule.modulestore import ModuleStoreEnum
+from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from courseware.tests.tests import TEST_DATA_MONGO_MODULESTORE
 from edxmako import add_lookup
@@ -602,6 +604,39 @@ class CategoryMapTestCase(ModuleStoreTestCase):
             ["Topic_A", "Topic_B", "Topic_C", "discussion1", "discussion2", "discussion3"]
         )
 
+    def test_cached_per_course_version(self):
+        self.create_discussion("Chapter 1", "Discussion 1")
+        course = modulestore().get_course(self.course.id)
+        with mock.patch.object(utils, "_get_discussion_modules", wraps=utils._get_discussion_modules) as get_modules:
+            first_map = utils.get_discussion_category_map(course)
+            self.assertEqual(utils.get_discussion_category_map(course), first_map)
+            self.assertEqual(get_modules.call_count, 1)
+
+            # An edit to the course gives it a new version, with its own map
+            self.create_discussion("Chapter 2", "Discussion")
+            course = modulestore().get_course(self.course.id)
+            self.assertEqual(
+                utils.get_discussion_category_map(course)["children"],
+                ["Chapter 1", "Chapter 2"]
+            )
+            self.assertEqual(get_modules.call_count, 2)
+
+    def test_bulk_edits_change_version(self):
+        discussion = self.create_discussion("Chapter 1", "Discussion 1")
+        store = modulestore()
+        course = store.get_course(self.course.id)
+        self.assertEqual(utils.get_discussion_category_map(course)["children"], ["Chapter 1"])
+
+        # Studio makes its edits inside bulk operations
+        with store.bulk_operations(self.course.id):
+            discussion = store.get_item(discussion.location)
+            discussion.discussion_category = "Renamed"
+            store.update_item(discussion, ModuleStoreEnum.UserID.test)
+            self.create_discussion("Chapter 2", "Discussion")
+
+        course = store.get_course(self.course.id)
+        self.assertEqual(utils.get_discussion_category_map(course)["children"], ["Chapter 2", "Renamed"])
+
 
 class JsonResponseTestCase(TestCase, UnicodeTestMixin):
     def _test_unicode_data(self, text):
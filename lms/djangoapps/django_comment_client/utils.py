@@ -5,6 +5,7 @@ import logging
 from datetime import datetime
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import connection
 from django.http import HttpResponse
@@ -25,6 +26,9 @@ from xmodule.modulestore.django import modulestore
 
 log = logging.getLogger(__name__)
 
+# How many seconds to keep the category map of a version of a course cached.
+CATEGORY_MAP_CACHE_LIFESPAN = 60 * 60 * 24
+
 
 def extract(dic, keys):
     return {k: dic.get(k) for k in keys}
@@ -120,7 +124,7 @@ def _filter_unstarted_categories(category_map):
     return result_map
 
 
-def _sort_map_entries(category_map, sort_alpha):
+def _sort_map_entries(category_map, sort_alpha, recursive=True):
     things = []
     for title, entry in category_map["entries"].items():
         if entry["sort_key"] == None and sort_alpha:
@@ -128,20 +132,38 @@ def _sort_map_entries(category_map, sort_alpha):
         things.append((title, entry))
     for title, category in category_map["subcategories"].items():
         things.append((title, category))
-        _sort_map_entries(category_map["subcategories"][title], sort_alpha)
+        if recursive:
+            _sort_map_entries(category_map["subcategories"][title], sort_alpha)
     category_map["children"] = [x[0] for x in sorted(things, key=lambda x: x[1]["sort_key"])]
 
 
-def get_discussion_category_map(course):
-    course_id = course.id
+def _get_inline_discussion_category_map(course):
+    """
+    Returns the category map of the course's inline discussion modules, with
+    each category's children sorted, and the start dates left in.
+
+    Building it means loading every discussion module in the course, so it's
+    cached for each version of the course, as given by the time of the last
+    edit (or publish) of anything in it. Courses without edit info, such as
+    XML courses, aren't cached.
+    """
+    is_course_cohorted = course.is_cohorted
+    sort_alpha = course.discussion_sort_alpha
+
+    version = getattr(course, 'subtree_edited_on', None)
+    key = None
+    if version is not None:
+        key = u"discussion_category_map_{course_id}_{version}_{cohorted}_{sort_alpha}".format(
+            course_id=course.id, version=version.isoformat(), cohorted=is_course_cohorted, sort_alpha=sort_alpha
+        )
+        category_map = cache.get(key)
+        if category_map is not None:
+            return category_map
 
     unexpanded_category_map = defaultdict(list)
 
     modules = _get_discussion_modules(course)
 
-    is_course_cohorted = course.is_cohorted
-    cohorted_discussion_ids = course.cohorted_discussions
-
     for module in modules:
         id = module.discussion_id
         title = module.discussion_target
@@ -189,6 +211,23 @@ def get_discussion_category_map(course):
                                                       "start_date": entry["start_date"],
                                                       "is_cohorted": is_course_cohorted}
 
+    _sort_map_entries(category_map, sort_alpha)
+
+    if key is not None:
+        cache.set(key, category_map, CATEGORY_MAP_CACHE_LIFESPAN)
+    return category_map
+
+
+def get_discussion_category_map(course):
+    course_id = course.id
+
+    is_course_cohorted = course.is_cohorted
+    cohorted_discussion_ids = course.cohorted_discussions
+
+    # Inline discussions are always in a category, so the top level entries
+    # are all configured topics.
+    category_map = _get_inline_discussion_category_map(course)
+
     # TODO.  BUG! : course location is not unique across multiple course runs!
     # (I think Kevin already noticed this)  Need to send course_id with requests, store it
     # in the backend.
@@ -198,7 +237,7 @@ def get_discussion_category_map(course):
                                           "start_date": datetime.now(UTC()),
                                           "is_cohorted": is_course_cohorted and entry["id"] in cohorted_discussion_ids}
 
-    _sort_map_entries(category_map, course.discussion_sort_alpha)
+    _sort_map_entries(category_map, course.discussion_sort_alpha, recursive=False)
 
     return _filter_unstarted_categories(category_map)
 
@@ -274,21 +313,27 @@ class QueryCountDebugMiddleware(object):
         return response
 
 
-def get_ability(course_id, content, user):
+def get_ability(course_id, content, user, thread=None):
+    """
+    Get what the user can do with the content (thread or comment). If it's a
+    comment, `thread` may be the thread it's in, which is then used rather
+    than fetched for any checks which need it.
+    """
     return {
-        'editable': check_permissions_by_view(user, course_id, content, "update_thread" if content['type'] == 'thread' else "update_comment"),
-        'can_reply': check_permissions_by_view(user, course_id, content, "create_comment" if content['type'] == 'thread' else "create_sub_comment"),
-        'can_delete': check_permissions_by_view(user, course_id, content, "delete_thread" if content['type'] == 'thread' else "delete_comment"),
-        'can_openclose': check_permissions_by_view(user, course_id, content, "openclose_thread") if content['type'] == 'thread' else False,
-        'can_vote': check_permissions_by_view(user, course_id, content, "vote_for_thread" if content['type'] == 'thread' else "vote_for_comment"),
+        'editable': check_permissions_by_view(user, course_id, content, "update_thread" if content['type'] == 'thread' else "update_comment", thread),
+        'can_reply': check_permissions_by_view(user, course_id, content, "create_comment" if content['type'] == 'thread' else "create_sub_comment", thread),
+        'can_delete': check_permissions_by_view(user, course_id, content, "delete_thread" if content['type'] == 'thread' else "delete_comment", thread),
+        'can_openclose': check_permissions_by_view(user, course_id, content, "openclose_thread", thread) if content['type'] == 'thread' else False,
+        'can_vote': check_permissions_by_view(user, course_id, content, "vote_for_thread" if content['type'] == 'thread' else "vote_for_comment", thread),
     }
 
 # TODO: RENAME
 
 
-def get_annotated_content_info(course_id, content, user, user_info):
+def get_annotated_content_info(course_id, content, user, user_info, thread=None):
     """
-    Get metadata for an individual content (thread or comment)
+    Get metadata for an individual content (thread or comment), and the
+    thread it's in, if it's a comment and that's at hand
     """
     voted = ''
     if content['id'] in user_info['upvoted_ids']:
@@ -298,7 +343,7 @@ def get_annotated_content_info(course_id, content, user, user_info):
     return {
         'voted': voted,
         'subscribed': content['id'] in user_info['subscribed_thread_ids'],
-        'ability': get_ability(course_id, content, user),
+        'ability': get_ability(course_id, content, user, thread),
     }
 
 # TODO: RENAME
@@ -311,7 +356,7 @@ def get_annotated_content_infos(course_id, thread, user, user_info):
     infos = {}
 
     def annotate(content):
-        infos[str(content['id'])] = get_annotated_content_info(course_id, content, user, user_info)
+        infos[str(content['id'])] = get_annotated_content_info(course_id, content, user, user_info, thread)
         for child in (
                 content.get('children', []) +
                 content.get('endorsed_responses', []) +
@@ -14,6 +14,7 @@ ASSUMPTIONS: modules have unique IDs, even across different module_types
 """
 from cStringIO import StringIO
 from gzip import GzipFile
+from tempfile import TemporaryFile
 from uuid import uuid4
 import csv
 import json
@@ -196,7 +197,13 @@ class ReportStore(object):
     download. Should probably refactor later to create a ReportFile object that
     can simply be appended to for the sake of memory efficiency, rather than
     passing in the whole dataset. Doing that for now just because it's simpler.
+
+    Files whose names end in `PARTIAL_SUFFIX` are intermediate pieces of a
+    report that is still being assembled. They can be read back and deleted,
+    but are never listed by `links_for()`.
     """
+    PARTIAL_SUFFIX = ".part"
+
     @classmethod
     def from_config(cls):
         """
@@ -218,6 +225,32 @@ class ReportStore(object):
         for row in rows:
             yield [unicode(item).encode('utf-8') for item in row]
 
+    def _get_unicode_decoded_rows(self, rows):
+        """
+        Inverse of `_get_utf8_encoded_rows`: given rows read back from a CSV
+        file, return them with every value decoded to unicode.
+        """
+        for row in rows:
+            yield [item.decode('utf-8') for item in row]
+
+    def _read_csv_rows(self, csv_file):
+        """
+        Yield the rows of the open CSV file `csv_file` one at a time, decoded
+        to unicode, and close it once they've all been read.
+        """
+        try:
+            for row in self._get_unicode_decoded_rows(csv.reader(csv_file)):
+                yield row
+        finally:
+            csv_file.close()
+
+    @classmethod
+    def is_partial(cls, filename):
+        """
+        Return True if `filename` names an intermediate piece of a report.
+        """
+        return filename.endswith(cls.PARTIAL_SUFFIX)
+
 
 class S3ReportStore(ReportStore):
     """
@@ -285,21 +318,30 @@ class S3ReportStore(ReportStore):
         transparent via the browser). Filenames should end in whatever
         suffix makes sense for the original file, so `.txt` instead of `.gz`
         """
+        self._store_file(course_id, filename, StringIO(buff.getvalue()))
+
+    def _store_file(self, course_id, filename, data_file):
+        """
+        Store the gzip-encoded contents of the file object `data_file`, which
+        is read from its start, as `filename` for `course_id` (see `store()`).
+        """
         key = self.key_for(course_id, filename)
 
-        data = buff.getvalue()
-        key.size = len(data)
+        data_file.seek(0, os.SEEK_END)
+        size = data_file.tell()
+        data_file.seek(0)
+        key.size = size
         key.content_encoding = "gzip"
         key.content_type = "text/csv"
 
         # Just setting the content encoding and type above should work
         # according to the docs, but when experimenting, this was necessary for
         # it to actually take.
-        key.set_contents_from_string(
-            data,
+        key.set_contents_from_file(
+            data_file,
             headers={
                 "Content-Encoding": "gzip",
-                "Content-Length": len(data),
+                "Content-Length": size,
                 "Content-Type": "text/csv",
             }
         )
@@ -312,14 +354,39 @@ class S3ReportStore(ReportStore):
 
         Even though we store it in gzip format, browsers will transparently
         download and decompress it. Filenames should end in `.csv`, not `.gz`.
+
+        `rows` may be a generator; the compressed file is spooled to disk
+        rather than held in memory.
         """
-        output_buffer = StringIO()
-        gzip_file = GzipFile(fileobj=output_buffer, mode="wb")
-        csvwriter = csv.writer(gzip_file)
-        csvwriter.writerows(self._get_utf8_encoded_rows(rows))
-        gzip_file.close()
+        with TemporaryFile() as output_file:
+            gzip_file = GzipFile(fileobj=output_file, mode="wb")
+            csvwriter = csv.writer(gzip_file)
+            csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+            gzip_file.close()
 
-        self.store(course_id, filename, output_buffer)
+            self._store_file(course_id, filename, output_file)
+
+    def read_rows(self, course_id, filename):
+        """
+        Return an iterator over the rows of a CSV file previously written with
+        `store_rows()`, as lists of unicode strings. The file is downloaded to
+        disk and read a row at a time. Raises an IOError if there is no such
+        file.
+        """
+        key = self.bucket.get_key(self.key_for(course_id, filename).key)
+        if key is None:
+            raise IOError(u"No report file {} for course {}".format(filename, course_id))
+        # GzipFile needs to seek, so the file can't be decompressed as it downloads
+        compressed_file = TemporaryFile()
+        key.get_contents_to_file(compressed_file)
+        compressed_file.seek(0)
+        return self._read_csv_rows(GzipFile(fileobj=compressed_file, mode="rb"))
+
+    def delete(self, course_id, filename):
+        """
+        Remove the file `filename` stored for `course_id`, if it exists.
+        """
+        self.bucket.delete_key(self.key_for(course_id, filename).key)
 
     def links_for(self, course_id):
         """
@@ -331,6 +398,7 @@ class S3ReportStore(ReportStore):
             [
                 (key.key.split("/")[-1], key.generate_url(expires_in=300))
                 for key in self.bucket.list(prefix=course_dir.key)
+                if not self.is_partial(key.key)
             ],
             reverse=True
         )
@@ -392,12 +460,40 @@ class LocalFSReportStore(ReportStore):
         """
         Given a course_id, filename, and rows (each row is an iterable of strings),
         write this data out.
+
+        `rows` may be a generator; they are written as they are produced, to a
+        partial file that is renamed to `filename` once it is complete.
+        """
+        full_path = self.path_to(course_id, filename)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+
+        partial_path = full_path + self.PARTIAL_SUFFIX
+        try:
+            with open(partial_path, "wb") as f:
+                csvwriter = csv.writer(f)
+                csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+        except Exception:
+            os.remove(partial_path)
+            raise
+        os.rename(partial_path, full_path)
+
+    def read_rows(self, course_id, filename):
         """
-        output_buffer = StringIO()
-        csvwriter = csv.writer(output_buffer)
-        csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+        Return an iterator over the rows of a CSV file previously written with
+        `store_rows()`, as lists of unicode strings. Raises an IOError if there
+        is no such file.
+        """
+        return self._read_csv_rows(open(self.path_to(course_id, filename), "rb"))
 
-        self.store(course_id, filename, output_buffer)
+    def delete(self, course_id, filename):
+        """
+        Remove the file `filename` stored for `course_id`, if it exists.
+        """
+        full_path = self.path_to(course_id, filename)
+        if os.path.exists(full_path):
+            os.remove(full_path)
 
     def links_for(self, course_id):
         """
@@ -414,6 +510,7 @@ class LocalFSReportStore(ReportStore):
             [
                 (filename, ("file://" + urllib.quote(os.path.join(course_dir, filename))))
                 for filename in os.listdir(course_dir)
+                if not self.is_partial(filename)
             ],
             reverse=True
         )
@@ -28,9 +28,12 @@ from instructor_task.tasks_helper import (
     BaseInstructorTask,
     perform_module_state_update,
     rescore_problem_module_state,
+    rescore_problem_module_batch,
     reset_attempts_module_state,
     delete_problem_module_state,
-    upload_grades_csv,
+    delegate_grade_report_shards,
+    upload_grades_csv_shard,
+    fail_unmerged_grade_report,
     upload_students_csv
 )
 from bulk_email.tasks import perform_delegate_email_batches
@@ -64,6 +67,12 @@ def rescore_problem(entry_id, xmodule_instance_args):
         return modules_to_update.filter(state__contains='"done": true')
 
     visit_fcn = partial(perform_module_state_update, update_fcn, filter_fcn)
+    if settings.RESCORE_SUBMISSIONS_PER_BATCH:
+        visit_fcn = partial(
+            visit_fcn,
+            batch_fcn=partial(rescore_problem_module_batch, xmodule_instance_args),
+            batch_size=settings.RESCORE_SUBMISSIONS_PER_BATCH,
+        )
     return run_main_task(entry_id, visit_fcn, action_name)
 
 
@@ -136,13 +145,39 @@ def send_bulk_course_email(entry_id, _xmodule_instance_args):
 def calculate_grades_csv(entry_id, xmodule_instance_args):
     """
     Grade a course and push the results to an S3 bucket for download.
+
+    Large courses are graded in parallel by `calculate_grades_csv_shard`
+    subtasks, each covering a range of enrolled students, and checked on by
+    `check_grades_csv_shards` in case one of them is lost.
     """
     # Translators: This is a past-tense verb that is inserted into task progress messages as {action}.
     action_name = ugettext_noop('graded')
-    task_fn = partial(upload_grades_csv, xmodule_instance_args)
+    task_fn = partial(
+        delegate_grade_report_shards, calculate_grades_csv_shard, check_grades_csv_shards, xmodule_instance_args
+    )
     return run_main_task(entry_id, task_fn, action_name)
 
 
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
+def calculate_grades_csv_shard(entry_id, student_ids, timestamp_str, shard_index, subtask_status_dict):
+    """
+    Grade one range of students for a grade report started by
+    `calculate_grades_csv`, and write the partial results to the ReportStore.
+
+    The last shard to complete merges all partial results into the final report.
+    """
+    return upload_grades_csv_shard(entry_id, student_ids, timestamp_str, shard_index, subtask_status_dict)
+
+
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
+def check_grades_csv_shards(entry_id, timestamp_str):
+    """
+    Fail a grade report started by `calculate_grades_csv` whose shards haven't
+    all finished by now, and delete the partial results they left.
+    """
+    return fail_unmerged_grade_report(entry_id, timestamp_str)
+
+
 @task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
 def calculate_students_features_csv(entry_id, xmodule_instance_args):
     """
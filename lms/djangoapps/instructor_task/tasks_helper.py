@@ -6,16 +6,22 @@ running state of a course.
 import json
 import urllib
 from datetime import datetime
+from itertools import chain, count, islice
 from time import time
+from traceback import format_exc
 
 from celery import Task, current_task
 from celery.utils.log import get_task_logger
-from celery.states import SUCCESS, FAILURE
+from celery.states import SUCCESS, FAILURE, READY_STATES
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import transaction, reset_queries
+from django.utils.translation import ugettext_noop
 import dogstats_wrapper as dog_stats_api
 from pytz import UTC
 
+from capa.safe_exec import SafeExecBatch, SafeExecDeferred
 from xmodule.modulestore.django import modulestore
 from track.views import task_track
 
@@ -26,6 +32,12 @@ from courseware.module_render import get_module_for_descriptor_internal
 from instructor_analytics.basic import enrolled_students_features
 from instructor_analytics.csvs import format_dictlist
 from instructor_task.models import ReportStore, InstructorTask, PROGRESS
+from instructor_task.subtasks import (
+    SubtaskStatus,
+    check_subtask_is_valid,
+    queue_subtasks_for_query,
+    update_subtask_status,
+)
 from student.models import CourseEnrollment
 
 # define different loggers for use within tasks and on client side
@@ -39,6 +51,16 @@ UPDATE_STATUS_SUCCEEDED = 'succeeded'
 UPDATE_STATUS_FAILED = 'failed'
 UPDATE_STATUS_SKIPPED = 'skipped'
 
+# timestamp format used in the names of report files
+REPORT_TIMESTAMP_FORMAT = "%Y-%m-%d-%H%M"
+
+# the merge of a sharded grade report should happen once, well within this time
+GRADE_REPORT_MERGE_LOCK_EXPIRE = 60 * 60
+
+# how many times a batch of rescoring is rehearsed to collect the sandboxed code it runs:
+# once for the problems' scripts, and once for the check functions that need their results
+RESCORE_BATCH_REHEARSALS = 2
+
 
 class BaseInstructorTask(Task):
     """
@@ -252,7 +274,8 @@ def run_main_task(entry_id, task_fcn, action_name):
     return task_progress
 
 
-def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, task_input, action_name):
+def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, task_input, action_name,
+                                batch_fcn=None, batch_size=None):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
@@ -270,6 +293,10 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
     the update is successful; False indicates the update on the particular student module failed.
     A raised exception indicates a fatal condition -- that no other student modules should be considered.
 
+    If a `batch_fcn` is not None, the StudentModule instances are instead updated in batches of at most
+    `batch_size`, by calling `batch_fcn` with the module_descriptor and a list of the StudentModules in
+    the batch.  It returns a list of their update statuses, as `update_fcn` would have returned them.
+
     The return value is a dict containing the task's results, with the following keys:
 
           'attempted': number of attempts made
@@ -316,22 +343,37 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
     task_progress = TaskProgress(action_name, modules_to_update.count(), start_time)
     task_progress.update_task_state()
 
-    for module_to_update in modules_to_update:
-        task_progress.attempted += 1
-        # There is no try here:  if there's an error, we let it throw, and the task will
-        # be marked as FAILED, with a stack trace.
-        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=[u'action:{name}'.format(name=action_name)]):
-            update_status = update_fcn(module_descriptor, module_to_update)
-            if update_status == UPDATE_STATUS_SUCCEEDED:
-                # If the update_fcn returns true, then it performed some kind of work.
-                # Logging of failures is left to the update_fcn itself.
-                task_progress.succeeded += 1
-            elif update_status == UPDATE_STATUS_FAILED:
-                task_progress.failed += 1
-            elif update_status == UPDATE_STATUS_SKIPPED:
-                task_progress.skipped += 1
-            else:
-                raise UpdateProblemModuleStateError("Unexpected update_status returned: {}".format(update_status))
+    def record_update_status(update_status):
+        """Count the result of an update in task_progress."""
+        if update_status == UPDATE_STATUS_SUCCEEDED:
+            # If the update_fcn returns true, then it performed some kind of work.
+            # Logging of failures is left to the update_fcn itself.
+            task_progress.succeeded += 1
+        elif update_status == UPDATE_STATUS_FAILED:
+            task_progress.failed += 1
+        elif update_status == UPDATE_STATUS_SKIPPED:
+            task_progress.skipped += 1
+        else:
+            raise UpdateProblemModuleStateError("Unexpected update_status returned: {}".format(update_status))
+
+    if batch_fcn is None:
+        for module_to_update in modules_to_update:
+            task_progress.attempted += 1
+            # There is no try here:  if there's an error, we let it throw, and the task will
+            # be marked as FAILED, with a stack trace.
+            with dog_stats_api.timer('instructor_tasks.module.time.step', tags=[u'action:{name}'.format(name=action_name)]):
+                update_status = update_fcn(module_descriptor, module_to_update)
+                record_update_status(update_status)
+    else:
+        modules_iter = modules_to_update.iterator()
+        batch = list(islice(modules_iter, batch_size))
+        while batch:
+            task_progress.attempted += len(batch)
+            with dog_stats_api.timer('instructor_tasks.module.time.batch', tags=[u'action:{name}'.format(name=action_name)]):
+                for update_status in batch_fcn(module_descriptor, batch):
+                    record_update_status(update_status)
+            task_progress.update_task_state()
+            batch = list(islice(modules_iter, batch_size))
 
     return task_progress.update_task_state()
 
@@ -418,6 +460,51 @@ def rescore_problem_module_state(xmodule_instance_args, module_descriptor, stude
     Returns True if problem was successfully rescored for the given student, and False
     if problem encountered some kind of error in rescoring.
     '''
+    return _rescore_student_module(xmodule_instance_args, module_descriptor, student_module)
+
+
+@transaction.commit_on_success
+def rescore_problem_module_batch(xmodule_instance_args, module_descriptor, student_modules):
+    """
+    Rescores the submissions in the list of StudentModules `student_modules`, as
+    rescore_problem_module_state does one, and returns their update statuses.
+
+    The Python code that rescoring runs in the sandbox for all of them (the problem's
+    script, for each distinct random seed, and its check function, for each submission)
+    is collected by rehearsing the rescoring without saving it, and run in one
+    sandboxed execution.  The rescoring is then done for real, with those results,
+    and the new states are committed together.
+    """
+    batch = SafeExecBatch()
+    for _ in xrange(RESCORE_BATCH_REHEARSALS):
+        with batch.recording():
+            for student_module in student_modules:
+                try:
+                    instance = _get_module_instance_for_task(
+                        student_module.course_id, student_module.student, module_descriptor, xmodule_instance_args,
+                        grade_bucket_type='rescore'
+                    )
+                    if instance is not None and hasattr(instance, 'rescore_problem'):
+                        instance.lcp.rescore_existing_answers()
+                except SafeExecDeferred:
+                    pass
+                except Exception:  # pylint: disable=broad-except
+                    # whatever went wrong will go wrong again, and be handled, when rescoring for real
+                    pass
+        if not batch.run(slug=module_descriptor.location.to_deprecated_string()):
+            break
+
+    with batch.replaying():
+        return [
+            _rescore_student_module(xmodule_instance_args, module_descriptor, student_module)
+            for student_module in student_modules
+        ]
+
+
+def _rescore_student_module(xmodule_instance_args, module_descriptor, student_module):
+    """
+    Rescores one submission, for rescore_problem_module_state and rescore_problem_module_batch.
+    """
     # unpack the StudentModule:
     course_id = student_module.course_id
     student = student_module.student
@@ -497,6 +584,30 @@ def delete_problem_module_state(xmodule_instance_args, _module_descriptor, stude
     return UPDATE_STATUS_SUCCEEDED
 
 
+def _report_filename(csv_name, course_id, timestamp_str):
+    """
+    Return the name under which the report `csv_name` generated for
+    `course_id` at `timestamp_str` is stored in the ReportStore.
+    """
+    return u"{course_prefix}_{csv_name}_{timestamp_str}.csv".format(
+        course_prefix=urllib.quote(unicode(course_id).replace("/", "_")),
+        csv_name=csv_name,
+        timestamp_str=timestamp_str,
+    )
+
+
+def _report_shard_filename(csv_name, course_id, timestamp_str, shard_index):
+    """
+    Return the name of the partial file written by one shard of a sharded
+    report. These are hidden from download links until they are merged.
+    """
+    return u"{filename}.{shard_index:05d}{suffix}".format(
+        filename=_report_filename(csv_name, course_id, timestamp_str),
+        shard_index=shard_index,
+        suffix=ReportStore.PARTIAL_SUFFIX,
+    )
+
+
 def upload_csv_to_report_store(rows, csv_name, course_id, timestamp):
     """
     Upload data as a CSV using ReportStore.
@@ -514,40 +625,24 @@ def upload_csv_to_report_store(rows, csv_name, course_id, timestamp):
     report_store = ReportStore.from_config()
     report_store.store_rows(
         course_id,
-        u"{course_prefix}_{csv_name}_{timestamp_str}.csv".format(
-            course_prefix=urllib.quote(unicode(course_id).replace("/", "_")),
-            csv_name=csv_name,
-            timestamp_str=timestamp.strftime("%Y-%m-%d-%H%M")
-        ),
+        _report_filename(csv_name, course_id, timestamp.strftime(REPORT_TIMESTAMP_FORMAT)),
         rows
     )
 
 
-def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
+def _grade_report_rows(course_id, students, task_progress, status_interval=100):
     """
-    For a given `course_id`, generate a grades CSV file for all students that
-    are enrolled, and store using a `ReportStore`. Once created, the files can
-    be accessed by instantiating another `ReportStore` (via
-    `ReportStore.from_config()`) and calling `link_for()` on it. Writes are
-    buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
-    that are visible in ReportStore will be complete ones.
+    Grade each of `students` in `course_id` and return a tuple of
+    `(rows, err_rows)` for the grade report, each including its header row.
 
-    As we start to add more CSV downloads, it will probably be worthwhile to
-    make a more general CSVDoc class instead of building out the rows like we
-    do here.
+    The counters of `task_progress` are updated as students are graded, and
+    its state is pushed to Celery every `status_interval` students.
     """
-    start_time = time()
-    start_date = datetime.now(UTC)
-    status_interval = 100
-    enrolled_students = CourseEnrollment.users_enrolled_in(course_id)
-    task_progress = TaskProgress(action_name, enrolled_students.count(), start_time)
-
-    # Loop over all our students and build our CSV lists in memory
     header = None
     rows = []
     err_rows = [["id", "username", "error_msg"]]
     current_step = {'step': 'Calculating Grades'}
-    for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
+    for student, gradeset, err_msg in iterate_grades_for(course_id, students):
         # Periodically update task status (this is a cache write)
         if task_progress.attempted % status_interval == 0:
             task_progress.update_task_state(extra_meta=current_step)
@@ -580,6 +675,30 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
             task_progress.failed += 1
             err_rows.append([student.id, student.username, err_msg])
 
+    return rows, err_rows
+
+
+def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
+    """
+    For a given `course_id`, generate a grades CSV file for all students that
+    are enrolled, and store using a `ReportStore`. Once created, the files can
+    be accessed by instantiating another `ReportStore` (via
+    `ReportStore.from_config()`) and calling `link_for()` on it. Writes are
+    buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
+    that are visible in ReportStore will be complete ones.
+
+    As we start to add more CSV downloads, it will probably be worthwhile to
+    make a more general CSVDoc class instead of building out the rows like we
+    do here.
+    """
+    start_time = time()
+    start_date = datetime.now(UTC)
+    enrolled_students = CourseEnrollment.users_enrolled_in(course_id)
+    task_progress = TaskProgress(action_name, enrolled_students.count(), start_time)
+
+    # Loop over all our students and build our CSV lists in memory
+    rows, err_rows = _grade_report_rows(course_id, enrolled_students, task_progress)
+
     # By this point, we've got the rows we're going to stuff into our CSV files.
     current_step = {'step': 'Uploading CSVs'}
     task_progress.update_task_state(extra_meta=current_step)
@@ -595,6 +714,271 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
     return task_progress.update_task_state(extra_meta=current_step)
 
 
+def delegate_grade_report_shards(create_shard_fcn, check_shards_fcn, xmodule_instance_args,
+                                 entry_id, course_id, task_input, action_name):
+    """
+    Generate the grade report for `course_id`, splitting the enrolled students
+    into ranges of at most settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK students
+    that are graded in parallel by separate subtasks.
+
+    `create_shard_fcn` is the Celery task used for each shard; it is called
+    with the arguments of `upload_grades_csv_shard`. Each shard writes partial
+    CSV files to the ReportStore, and whichever shard finishes last merges
+    them into the final report (see `merge_grade_report_shards`).
+
+    `check_shards_fcn` is the Celery task, called with the arguments of
+    `fail_unmerged_grade_report`, that is scheduled to run once the shards
+    should long have finished, and fails the report if one of them was lost.
+
+    Courses small enough to fit in a single shard are graded in this task,
+    exactly as `upload_grades_csv` does.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    enrolled_students = CourseEnrollment.users_enrolled_in(course_id).order_by('pk')
+    if enrolled_students.count() <= settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK:
+        return upload_grades_csv(xmodule_instance_args, entry_id, course_id, task_input, action_name)
+
+    # As with bulk email, a requeued parent task must not queue a second set
+    # of shards; the existing ones will complete the report.
+    if len(entry.subtasks) > 0 and len(entry.task_output) > 0:
+        TASK_LOG.warning(u"Task %s has already been sharded!  InstructorTask = %s", entry.task_id, entry)
+        return json.loads(entry.task_output)
+
+    timestamp_str = datetime.now(UTC).strftime(REPORT_TIMESTAMP_FORMAT)
+    shard_indices = count()
+
+    def _create_grade_report_shard(student_list, initial_subtask_status):
+        """Creates a subtask to grade the given range of students."""
+        return create_shard_fcn.subtask(
+            (
+                entry_id,
+                [student['pk'] for student in student_list],
+                timestamp_str,
+                next(shard_indices),
+                initial_subtask_status.to_dict(),
+            ),
+            task_id=initial_subtask_status.task_id,
+            routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+        )
+
+    progress = queue_subtasks_for_query(
+        entry,
+        action_name,
+        _create_grade_report_shard,
+        enrolled_students,
+        [],
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK,
+    )
+    check_shards_fcn.apply_async(
+        (entry_id, timestamp_str),
+        countdown=settings.GRADES_DOWNLOAD_SHARDS_TIMEOUT,
+        routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+    )
+    return progress
+
+
+def upload_grades_csv_shard(entry_id, student_ids, timestamp_str, shard_index, subtask_status_dict):
+    """
+    Grade one range of students for a sharded grade report.
+
+    The grades and errors for the students in `student_ids` are written to
+    partial CSV files named by `shard_index`, and the subtask's progress is
+    recorded on the parent InstructorTask. If this was the last shard to
+    finish, the partial files are merged into the final report, and only then
+    is the InstructorTask marked as succeeded (see `merge_grade_report_shards`).
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    entry = InstructorTask.objects.get(pk=entry_id)
+    course_id = entry.course_id
+    if entry.task_state in READY_STATES:
+        # The report was already failed by `fail_unmerged_grade_report`, and its
+        # partial files deleted, so there's nothing this shard could add to.
+        TASK_LOG.warning(u"Grade report shard %s of finished instructor task %d was skipped", current_task_id, entry_id)
+        return subtask_status.to_dict()
+
+    task_progress = TaskProgress(ugettext_noop('graded'), len(student_ids), time())
+    try:
+        students = User.objects.filter(pk__in=student_ids).order_by('pk')
+        rows, err_rows = _grade_report_rows(course_id, students, task_progress)
+
+        report_store = ReportStore.from_config()
+        report_store.store_rows(
+            course_id, _report_shard_filename('grade_report', course_id, timestamp_str, shard_index), rows
+        )
+        if len(err_rows) > 1:
+            report_store.store_rows(
+                course_id, _report_shard_filename('grade_report_err', course_id, timestamp_str, shard_index), err_rows
+            )
+    except Exception:  # pylint: disable=broad-except
+        TASK_LOG.exception(u"Grade report shard %s of instructor task %d failed", current_task_id, entry_id)
+        subtask_status.increment(failed=len(student_ids), state=FAILURE)
+    else:
+        subtask_status.increment(succeeded=task_progress.succeeded, failed=task_progress.failed, state=SUCCESS)
+
+    update_subtask_status(entry_id, current_task_id, subtask_status, complete_parent=False)
+
+    subtask_dict = json.loads(InstructorTask.objects.get(pk=entry_id).subtasks)
+    if subtask_dict['succeeded'] + subtask_dict['failed'] >= subtask_dict['total']:
+        # cache.add fails if the key already exists, so only one shard merges.
+        if cache.add("grade-report-merge-{}".format(entry_id), 'true', GRADE_REPORT_MERGE_LOCK_EXPIRE):
+            merge_grade_report_shards(entry_id, course_id, timestamp_str, subtask_dict)
+
+    return subtask_status.to_dict()
+
+
+class MissingReportShardError(Exception):
+    """
+    Raised when a shard of a sharded report failed, never finished, or didn't
+    write its partial file.
+    """
+    pass
+
+
+def _merge_report_shards(report_store, csv_name, course_id, timestamp_str, num_shards, required=True):
+    """
+    Concatenate the partial files of `csv_name` written by `num_shards`
+    shards into a single report, then delete the partial files.
+
+    Each shard writes its own header row; the first one found is used for the
+    merged file, and rows from shards with a different header are realigned
+    to it by column name, filling missing columns with 0.0 as a single-task
+    report would. The rows are streamed from the partial files into the
+    merged one, rather than all being read into memory.
+
+    If `required`, every shard must have written its partial file, and a
+    MissingReportShardError is raised, before the report is stored, if one
+    didn't. Otherwise missing partial files are skipped. Returns the number
+    of data rows merged.
+    """
+    shard_filenames = [
+        _report_shard_filename(csv_name, course_id, timestamp_str, shard_index)
+        for shard_index in range(num_shards)
+    ]
+    num_rows = [0]
+
+    def merged_rows():
+        """Yield the header, then the rows of each shard in turn."""
+        header = None
+        for shard_filename in shard_filenames:
+            try:
+                shard_rows = report_store.read_rows(course_id, shard_filename)
+            except IOError:
+                if required:
+                    raise MissingReportShardError(
+                        u"Partial file {} of report {} is missing".format(shard_filename, csv_name)
+                    )
+                continue
+            shard_header = next(shard_rows, None)
+            if shard_header is None:
+                continue
+            if header is None:
+                header = shard_header
+                yield header
+            for row in shard_rows:
+                if shard_header != header:
+                    values = dict(zip(shard_header, row))
+                    row = [values.get(column, 0.0) for column in header]
+                num_rows[0] += 1
+                yield row
+
+    rows = merged_rows()
+    # Shards whose students all failed to grade write no header, and if none
+    # wrote one there's no report to store.
+    header = next(rows, None)
+    if header is not None:
+        report_store.store_rows(
+            course_id, _report_filename(csv_name, course_id, timestamp_str), chain([header], rows)
+        )
+    for shard_filename in shard_filenames:
+        report_store.delete(course_id, shard_filename)
+    return num_rows[0]
+
+
+def merge_grade_report_shards(entry_id, course_id, timestamp_str, subtask_dict):
+    """
+    Assemble the grade report, and the error report if any shard had errors,
+    from the partial files written by `upload_grades_csv_shard`, then mark
+    the InstructorTask `entry_id` as succeeded.
+
+    If any shard failed, the students it was grading would be missing from the
+    report, so no report is stored and the InstructorTask is marked as failed.
+    """
+    num_shards = subtask_dict['total']
+    report_store = ReportStore.from_config()
+    entry = InstructorTask.objects.get(pk=entry_id)
+    if entry.task_state in READY_STATES:
+        # already failed by `fail_unmerged_grade_report`
+        _delete_report_shards(report_store, course_id, timestamp_str, num_shards)
+        return
+    try:
+        if subtask_dict['failed'] > 0:
+            raise MissingReportShardError(
+                u"{} of {} shards of the grade report failed".format(subtask_dict['failed'], num_shards)
+            )
+        for csv_name, required in (('grade_report', True), ('grade_report_err', False)):
+            num_rows = _merge_report_shards(report_store, csv_name, course_id, timestamp_str, num_shards, required)
+            TASK_LOG.info(
+                u"Merged %d rows from %d shards into %s for course %s", num_rows, num_shards, csv_name, course_id
+            )
+    except Exception as exception:  # pylint: disable=broad-except
+        TASK_LOG.exception(u"Merging the grade report of instructor task %d failed", entry_id)
+        _delete_report_shards(report_store, course_id, timestamp_str, num_shards)
+        entry.task_state = FAILURE
+        entry.task_output = InstructorTask.create_output_for_failure(exception, format_exc())
+    else:
+        entry.task_state = SUCCESS
+    entry.save_now()
+
+
+def _delete_report_shards(report_store, course_id, timestamp_str, num_shards):
+    """
+    Delete any partial files left by the `num_shards` shards of a grade report.
+    """
+    for shard_index in range(num_shards):
+        for csv_name in ('grade_report', 'grade_report_err'):
+            report_store.delete(course_id, _report_shard_filename(csv_name, course_id, timestamp_str, shard_index))
+
+
+def fail_unmerged_grade_report(entry_id, timestamp_str):
+    """
+    Fail the sharded grade report of InstructorTask `entry_id` if it still
+    hasn't been merged, which happens when one of its shards was lost (say,
+    because the worker running it was killed) and so never reported back.
+
+    This runs settings.GRADES_DOWNLOAD_SHARDS_TIMEOUT seconds after the shards
+    were queued. The partial files the other shards wrote are deleted, and
+    the InstructorTask is marked as failed so that the report can be rerun.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    if entry.task_state in READY_STATES:
+        return
+    # Holding the merge lock keeps a shard that is only now finishing from
+    # merging the partial files while they're deleted.
+    if not cache.add("grade-report-merge-{}".format(entry_id), 'true', GRADE_REPORT_MERGE_LOCK_EXPIRE):
+        return
+    entry = InstructorTask.objects.get(pk=entry_id)
+    if entry.task_state in READY_STATES:
+        return
+
+    subtask_dict = json.loads(entry.subtasks)
+    num_shards = subtask_dict['total']
+    num_unfinished = num_shards - subtask_dict['succeeded'] - subtask_dict['failed']
+    TASK_LOG.error(
+        u"%d of %d shards of the grade report of instructor task %d never finished",
+        num_unfinished, num_shards, entry_id
+    )
+    _delete_report_shards(ReportStore.from_config(), entry.course_id, timestamp_str, num_shards)
+    exception = MissingReportShardError(
+        u"{} of {} shards of the grade report never finished".format(num_unfinished, num_shards)
+    )
+    entry.task_state = FAILURE
+    entry.task_output = InstructorTask.create_output_for_failure(exception, None)
+    entry.save_now()
+
+
 def upload_students_csv(_xmodule_instance_args, _entry_id, course_id, task_input, action_name):
     """
     For a given `course_id`, generate a CSV file containing profile
@@ -13,6 +13,7 @@ import textwrap
 from celery.states import SUCCESS, FAILURE
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 
 from capa.tests.response_xml_factory import (CodeResponseXMLFactory,
                                              CustomResponseXMLFactory)
@@ -29,6 +30,7 @@ from instructor_task.models import InstructorTask
 from instructor_task.tests.test_base import (InstructorTaskModuleTestCase, TEST_COURSE_ORG, TEST_COURSE_NUMBER,
                                              OPTION_1, OPTION_2)
 from capa.responsetypes import StudentInputError
+from capa.safe_exec import SafeExecBatch
 from lms.lib.xblock.runtime import quote_slashes
 
 
@@ -361,6 +363,13 @@ class TestRescoringTask(TestIntegrationTask):
         for username in userlist:
             self.check_state(username, descriptor, 0, 1, 2)
 
+    @override_settings(RESCORE_SUBMISSIONS_PER_BATCH=3)
+    def test_rescoring_randomized_problem_in_batches(self):
+        """Run rescore scenario on custom problem that uses randomize, a batch of submissions at a time"""
+        with patch.object(SafeExecBatch, 'run', autospec=True, side_effect=SafeExecBatch.run) as batch_run:
+            self.test_rescoring_randomized_problem()
+        self.assertTrue(batch_run.called)
+
 
 class TestResetAttemptsTask(TestIntegrationTask):
     """
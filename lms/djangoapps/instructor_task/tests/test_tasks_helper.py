@@ -4,13 +4,16 @@ Unit tests for LMS instructor-initiated background tasks helper functions.
 Tests that CSV grade report generation works with unicode emails.
 
 """
+import json
 import os
 import shutil
+from uuid import uuid4
 
 import ddt
 from mock import Mock, patch
 
 from django.conf import settings
+from django.core.cache import cache
 from django.test.testcases import TestCase
 
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
@@ -18,8 +21,12 @@ from xmodule.modulestore.tests.factories import CourseFactory
 
 from student.tests.factories import CourseEnrollmentFactory, UserFactory
 
-from instructor_task.models import ReportStore
-from instructor_task.tasks_helper import upload_grades_csv, upload_students_csv
+from instructor_task.models import InstructorTask, ReportStore
+from instructor_task.subtasks import SubtaskStatus, initialize_subtask_info
+from instructor_task.tasks_helper import (
+    _report_shard_filename, fail_unmerged_grade_report, upload_grades_csv, upload_grades_csv_shard, upload_students_csv
+)
+from instructor_task.tests.factories import InstructorTaskFactory
 
 
 class TestReport(ModuleStoreTestCase):
@@ -78,6 +85,126 @@ class TestInstructorGradeReport(TestReport):
         self.assertTrue(any('grade_report_err' in item[0] for item in report_store.links_for(self.course.id)))
 
 
+class TestShardedGradeReport(TestReport):
+    """
+    Tests that grade reports split across subtasks are merged correctly.
+    """
+    def setUp(self):
+        super(TestShardedGradeReport, self).setUp()
+        # entry ids are reused between tests, and so would be their merge locks
+        cache.clear()
+        self.students = [
+            self.create_student('student{0}'.format(i), 'student{0}@example.com'.format(i))
+            for i in range(3)
+        ]
+        self.entry = InstructorTaskFactory.create(
+            course_id=self.course.id,
+            task_type='grade_course',
+            task_key='',
+            task_id=str(uuid4()),
+        )
+        self.subtask_ids = [str(uuid4()), str(uuid4())]
+        initialize_subtask_info(self.entry, 'graded', len(self.students), self.subtask_ids)
+
+    def _run_shard(self, shard_index, students):
+        """Grade `students` as shard number `shard_index` of the report."""
+        return upload_grades_csv_shard(
+            self.entry.id,
+            [student.id for student in students],
+            '2014-01-01-0000',
+            shard_index,
+            SubtaskStatus.create(self.subtask_ids[shard_index]).to_dict(),
+        )
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_shards_are_merged(self, _mock_current_task):
+        report_store = ReportStore.from_config()
+
+        status = self._run_shard(0, self.students[:2])
+        self.assertDictContainsSubset({'attempted': 2, 'succeeded': 2, 'failed': 0}, status)
+        # Partial results are never offered for download
+        self.assertEqual(report_store.links_for(self.course.id), [])
+
+        self._run_shard(1, self.students[2:])
+        links = report_store.links_for(self.course.id)
+        self.assertEqual(len(links), 1)
+        rows = list(report_store.read_rows(self.course.id, links[0][0]))
+        self.assertEqual(rows[0][:4], [u'id', u'email', u'username', u'grade'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [student.id for student in self.students])
+
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, 'SUCCESS')
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    @patch('instructor_task.tasks_helper.iterate_grades_for')
+    def test_shard_grading_failure(self, mock_iterate_grades_for, _mock_current_task):
+        mock_iterate_grades_for.side_effect = lambda course_id, students: [
+            (student, {}, 'Cannot grade student') for student in students
+        ]
+        self._run_shard(0, self.students[:2])
+        status = self._run_shard(1, self.students[2:])
+        self.assertDictContainsSubset({'attempted': 1, 'succeeded': 0, 'failed': 1}, status)
+
+        links = ReportStore.from_config().links_for(self.course.id)
+        self.assertEqual(len(links), 1)
+        self.assertIn('grade_report_err', links[0][0])
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_shard_failure(self, _mock_current_task):
+        self._run_shard(0, self.students[:2])
+        with patch('instructor_task.tasks_helper._grade_report_rows', side_effect=Exception("Shard failed")):
+            self._run_shard(1, self.students[2:])
+
+        # A report missing some of the students is never stored
+        self.assertEqual(ReportStore.from_config().links_for(self.course.id), [])
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, 'FAILURE')
+        self.assertIn('shards of the grade report failed', json.loads(entry.task_output)['message'])
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_missing_shard_file(self, _mock_current_task):
+        report_store = ReportStore.from_config()
+        self._run_shard(1, self.students[2:])
+        report_store.delete(self.course.id, _report_shard_filename('grade_report', self.course.id, '2014-01-01-0000', 1))
+        self._run_shard(0, self.students[:2])
+
+        self.assertEqual(report_store.links_for(self.course.id), [])
+        self.assertEqual(InstructorTask.objects.get(pk=self.entry.id).task_state, 'FAILURE')
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_lost_shard(self, _mock_current_task):
+        report_store = ReportStore.from_config()
+        self._run_shard(0, self.students[:2])
+        # shard 1 never runs
+        fail_unmerged_grade_report(self.entry.id, '2014-01-01-0000')
+
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, 'FAILURE')
+        self.assertIn('1 of 2 shards of the grade report never finished', json.loads(entry.task_output)['message'])
+        with self.assertRaises(IOError):
+            report_store.read_rows(
+                self.course.id, _report_shard_filename('grade_report', self.course.id, '2014-01-01-0000', 0)
+            )
+
+        # A shard that turns up after all doesn't write anything
+        self._run_shard(1, self.students[2:])
+        self.assertEqual(report_store.links_for(self.course.id), [])
+        with self.assertRaises(IOError):
+            report_store.read_rows(
+                self.course.id, _report_shard_filename('grade_report', self.course.id, '2014-01-01-0000', 1)
+            )
+        self.assertEqual(InstructorTask.objects.get(pk=self.entry.id).task_state, 'FAILURE')
+
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_merged_report_not_failed(self, _mock_current_task):
+        self._run_shard(0, self.students[:2])
+        self._run_shard(1, self.students[2:])
+        fail_unmerged_grade_report(self.entry.id, '2014-01-01-0000')
+
+        self.assertEqual(len(ReportStore.from_config().links_for(self.course.id)), 1)
+        self.assertEqual(InstructorTask.objects.get(pk=self.entry.id).task_state, 'SUCCESS')
+
+
 @ddt.ddt
 class TestStudentReport(TestReport):
     """
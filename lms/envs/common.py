@@ -619,6 +619,14 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # How many warm sandboxed workers each process keeps to run jailed code.
+    # 0 means start a new sandboxed process for every execution.
+    'pool_size': 0,
+    # How many executions a worker handles before it's replaced.
+    'pool_max_executions': 100,
+    # How many seconds an execution waits for a free worker before it fails.
+    'pool_acquire_timeout': 30,
 }
 
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
@@ -903,6 +911,7 @@ MIDDLEWARE_CLASSES = (
     'request_cache.middleware.RequestCache',
     'microsite_configuration.middleware.MicrositeMiddleware',
     'django_comment_client.middleware.AjaxExceptionMiddleware',
+    'django_comment_client.middleware.CoalescedRequestsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
@@ -1552,12 +1561,25 @@ CERT_NAME_LONG = "Certificate of Achievement"
 ###################### Grade Downloads ######################
 GRADES_DOWNLOAD_ROUTING_KEY = HIGH_MEM_QUEUE
 
+# Courses with more enrolled students than this have their grade reports
+# split across parallel subtasks of at most this many students each.
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = 1000
+
+# A split grade report that hasn't been assembled this many seconds after its
+# subtasks were queued is failed, since one of its subtasks must have been lost.
+GRADES_DOWNLOAD_SHARDS_TIMEOUT = 6 * 60 * 60
+
 GRADES_DOWNLOAD = {
     'STORAGE_TYPE': 'localfs',
     'BUCKET': 'edx-grades',
     'ROOT_PATH': '/tmp/edx-s3/grades',
 }
 
+###################### Problem Rescoring ######################
+# When this is non-zero, rescoring tasks rescore this many submissions at a
+# time, running the Python code of all of them in one sandboxed execution.
+RESCORE_SUBMISSIONS_PER_BATCH = 0
+
 ######################## PROGRESS SUCCESS BUTTON ##############################
 # The following fields are available in the URL: {course_id} {student_id}
 PROGRESS_SUCCESS_BUTTON_URL = 'http://<domain>/<path>/{course_id}'
@@ -6,3 +6,9 @@ else:
     SERVICE_HOST = 'http://localhost:4567'
 
 PREFIX = SERVICE_HOST + '/api/v1'
+
+# The most connections to keep open to the comments service, per process.
+POOL_SIZE = getattr(settings, "COMMENTS_SERVICE_POOL_SIZE", 10)
+
+# How many seconds to wait for the comments service to respond.
+TIMEOUT = getattr(settings, "COMMENTS_SERVICE_TIMEOUT", 5)
@@ -2,13 +2,22 @@ from contextlib import contextmanager
 import dogstats_wrapper as dog_stats_api
 import logging
 import requests
+import threading
 from django.conf import settings
 from time import time
 from uuid import uuid4
 from django.utils.translation import get_language
 
+from . import settings as cc_settings
+
 log = logging.getLogger(__name__)
 
+# The connection pool that requests to the comments service share, and
+# each thread's session, which uses it.
+_adapter = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+
 
 def strip_none(dic):
     return dict([(k, v) for k, v in dic.iteritems() if v is not None])
@@ -50,6 +59,99 @@ def request_timer(request_id, method, url, tags=None):
     )
 
 
+def _get_session():
+    """
+    Return this thread's session for requests to the comments service.
+
+    Sessions aren't safe to share between threads, but all the sessions
+    share one pool of keep-alive connections, of up to
+    COMMENTS_SERVICE_POOL_SIZE connections to each host.
+    """
+    global _adapter  # pylint: disable=global-statement
+    session = getattr(_local, 'session', None)
+    if session is None:
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=cc_settings.POOL_SIZE,
+                    pool_maxsize=cc_settings.POOL_SIZE,
+                )
+        session = requests.Session()
+        session.mount('http://', _adapter)
+        session.mount('https://', _adapter)
+        _local.session = session
+    return session
+
+
+def start_coalescing_requests():
+    """
+    Make identical GET requests to the comments service (until
+    `stop_coalescing_requests` is called) share a single response.
+
+    Any other request starts over, as it may change what a GET returns.
+    """
+    _local.responses = {}
+
+
+def stop_coalescing_requests():
+    """
+    Stop coalescing identical GET requests (see `start_coalescing_requests`).
+    """
+    _local.responses = None
+
+
+def _send_request(method, url, data, params, headers, metric_tags):
+    """
+    Send a request to the comments service, or return the response to an
+    identical GET request, if requests are being coalesced.
+    """
+    responses = getattr(_local, 'responses', None)
+    key = None
+    if responses is not None:
+        if method == 'get':
+            key = repr((
+                url,
+                sorted((k, v) for k, v in params.iteritems() if k != 'request_id'),
+                sorted(headers.iteritems()),
+            ))
+            if key in responses:
+                dog_stats_api.increment('comment_client.request.coalesced', tags=metric_tags)
+                return responses[key]
+        else:
+            responses.clear()
+
+    response = _get_session().request(
+        method,
+        url,
+        data=data,
+        params=params,
+        headers=headers,
+        timeout=cc_settings.TIMEOUT
+    )
+    _record_pool_metrics(url, metric_tags)
+
+    if key is not None:
+        responses[key] = response
+    return response
+
+
+def _record_pool_metrics(url, metric_tags):
+    """
+    Record how many connections the pool for `url` has opened, and how many
+    open connections are idle.
+    """
+    try:
+        pool = _adapter.poolmanager.connection_from_url(url)
+        # The pool's queue holds its idle connections, and a None for
+        # each connection it has room to open.
+        idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        dog_stats_api.histogram('comment_client.pool.connections', value=pool.num_connections, tags=metric_tags)
+        dog_stats_api.histogram('comment_client.pool.idle', value=idle, tags=metric_tags)
+    except Exception:  # pylint: disable=broad-except
+        # The metrics aren't worth failing the request over.
+        log.debug("Couldn't record the comments service connection pool metrics", exc_info=True)
+
+
 def perform_request(method, url, data_or_params=None, raw=False,
                     metric_action=None, metric_tags=None, paged_results=False):
 
@@ -76,14 +178,7 @@ def perform_request(method, url, data_or_params=None, raw=False,
         data = None
         params = merge_dict(data_or_params, request_id_dict)
     with request_timer(request_id, method, url, metric_tags):
-        response = requests.request(
-            method,
-            url,
-            data=data,
-            params=params,
-            headers=headers,
-            timeout=5
-        )
+        response = _send_request(method, url, data, params, headers, metric_tags)
 
     metric_tags.append(u'status_code:{}'.format(response.status_code))
     if response.status_code > 200:
@@ -35,6 +35,9 @@ def run():
     if settings.FEATURES.get('ENABLE_THIRD_PARTY_AUTH', False):
         enable_third_party_auth()
 
+    if settings.CODE_JAIL.get('pool_size'):
+        enable_code_jail_pool()
+
     # Initialize Segment.io analytics module. Flushes first time a message is received and 
     # every 50 messages thereafter, or if 10 seconds have passed since last flush
     if settings.FEATURES.get('SEGMENT_IO_LMS') and hasattr(settings, 'SEGMENT_IO_LMS_KEY'):
@@ -139,3 +142,16 @@ def enable_third_party_auth():
 
     from third_party_auth import settings as auth_settings
     auth_settings.apply_settings(settings.THIRD_PARTY_AUTH, settings)
+
+
+def enable_code_jail_pool():
+    """
+    Run jailed code in a pool of warm sandboxed workers, rather than in a new
+    sandboxed process each time. See common/lib/capa/capa/safe_exec/worker_pool.py.
+    """
+    from capa.safe_exec import worker_pool
+    worker_pool.configure(
+        settings.CODE_JAIL['pool_size'],
+        max_executions=settings.CODE_JAIL.get('pool_max_executions', worker_pool.DEFAULT_MAX_EXECUTIONS),
+        acquire_timeout=settings.CODE_JAIL.get('pool_acquire_timeout', worker_pool.DEFAULT_ACQUIRE_TIMEOUT),
+    )
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Measure what constructing a capa problem costs, and how much of it the per-process caches
+of capa.capa_problem.ParsedProblem save: parsing the xml and assigning ids, copying the
+parsed tree, and running the problem's scripts.
+
+Builds a synthetic problem with the requested number of responses, so no course is needed:
+
+    python scripts/capa_problem_benchmark.py --responses 20 --repeat 50
+"""
+
+import argparse
+import timeit
+
+from lxml import etree
+
+from capa.capa_problem import LoncapaProblem, ParsedProblem
+from capa.tests import test_capa_system
+
+
+def make_problem_xml(num_responses):
+    """
+    Return the xml of a problem with a script and ``num_responses`` multiple choice responses.
+    """
+    parts = [
+        '<problem>',
+        '<script type="loncapa/python">',
+        'values = [random.randint(0, 100) for __ in range(100)]',
+        '</script>',
+    ]
+    for index in xrange(num_responses):
+        parts.append('<p>Question {}</p>'.format(index))
+        parts.append('<multiplechoiceresponse><choicegroup type="MultipleChoice" shuffle="true">')
+        for choice in xrange(4):
+            parts.append('<choice correct="{}">Choice {}</choice>'.format('true' if choice == 0 else 'false', choice))
+        parts.append('</choicegroup></multiplechoiceresponse>')
+        parts.append('<solution><p>Choice 0</p></solution>')
+    parts.append('</problem>')
+    return '\n'.join(parts)
+
+
+def time_call(function, repeat):
+    """
+    Return the mean number of milliseconds ``function()`` takes.
+    """
+    return 1000 * timeit.timeit(function, number=repeat) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time capa problem construction")
+    parser.add_argument('--responses', type=int, default=20, help="The number of responses in the problem")
+    parser.add_argument('--repeat', type=int, default=20, help="How many times to time each operation")
+    args = parser.parse_args()
+
+    xml = make_problem_xml(args.responses)
+    system = test_capa_system()
+
+    def parse():
+        """Parse the problem and assign its ids, as ParsedProblem does when it isn't cached."""
+        ParsedProblem._cache.clear()  # pylint: disable=protected-access
+        return ParsedProblem.get(xml, '1', lambda tree: None)
+
+    def construct():
+        """Construct the problem, with nothing it uses cached."""
+        ParsedProblem._cache.clear()  # pylint: disable=protected-access
+        return LoncapaProblem(xml, id='1', seed=0, capa_system=system)
+
+    parsed = parse()
+    results = [
+        ('parse xml', time_call(lambda: etree.XML(xml), args.repeat)),
+        ('parse, assign ids', time_call(parse, args.repeat)),
+        ('copy parsed', time_call(parsed.copy, args.repeat)),
+        ('construct, uncached', time_call(construct, args.repeat)),
+        ('construct, cached', time_call(
+            lambda: LoncapaProblem(xml, id='1', seed=0, capa_system=system), args.repeat
+        )),
+    ]
+
+    print '{} responses, mean of {} runs'.format(args.responses, args.repeat)
+    for name, milliseconds in results:
+        print '{:<24}{:>10.2f} ms'.format(name, milliseconds)
+
+
+if __name__ == '__main__':
+    main()
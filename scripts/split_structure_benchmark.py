@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Measure what it costs to decode (and encode) a split modulestore structure, with and
+without validating its shape.
+
+Builds a synthetic course structure of the requested size, so no database is needed:
+
+    python scripts/split_structure_benchmark.py --blocks 5000 --repeat 20
+"""
+
+import argparse
+import copy
+import datetime
+import timeit
+
+from bson.objectid import ObjectId
+
+from xmodule.modulestore.split_mongo import BlockKey
+from xmodule.modulestore.split_mongo.mongo_connection import structure_from_mongo, structure_to_mongo
+
+
+def make_mongo_structure(num_blocks, children_per_block=10):
+    """
+    Return a structure, as stored in mongo, containing a tree of about ``num_blocks`` blocks.
+    """
+    edit_info = {
+        'edited_on': datetime.datetime.utcnow(),
+        'edited_by': 'benchmark',
+        'previous_version': None,
+        'update_version': ObjectId(),
+    }
+    blocks = []
+    for index in xrange(num_blocks):
+        children = [
+            ['vertical', 'block{}'.format(child)]
+            for child in xrange(index * children_per_block + 1, min((index + 1) * children_per_block + 1, num_blocks))
+        ]
+        blocks.append({
+            'block_type': 'course' if index == 0 else 'vertical',
+            'block_id': 'block{}'.format(index),
+            'definition': ObjectId(),
+            'fields': {'children': children, 'display_name': 'Block {}'.format(index)},
+            'edit_info': dict(edit_info),
+        })
+    return {
+        '_id': ObjectId(),
+        'root': ['course', 'block0'],
+        'blocks': blocks,
+    }
+
+
+def time_call(function, make_args, repeat):
+    """
+    Return the mean number of milliseconds ``function(*make_args())`` takes, excluding
+    the time spent in ``make_args``.
+    """
+    timings = []
+    for __ in xrange(repeat):
+        args = make_args()
+        start = timeit.default_timer()
+        function(*args)
+        timings.append(timeit.default_timer() - start)
+    return 1000 * sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time split structure decoding and encoding")
+    parser.add_argument('--blocks', type=int, default=5000, help="The number of blocks in the structure")
+    parser.add_argument('--repeat', type=int, default=10, help="How many times to time each operation")
+    args = parser.parse_args()
+
+    mongo_structure = make_mongo_structure(args.blocks)
+    structure = structure_from_mongo(copy.deepcopy(mongo_structure))
+    assert isinstance(structure['root'], BlockKey)
+
+    results = [
+        ('load, validated', time_call(
+            structure_from_mongo, lambda: (copy.deepcopy(mongo_structure), True), args.repeat
+        )),
+        ('load, unchecked', time_call(
+            structure_from_mongo, lambda: (copy.deepcopy(mongo_structure), False), args.repeat
+        )),
+        ('save, validated', time_call(
+            structure_to_mongo, lambda: (structure, True), args.repeat
+        )),
+        ('save, unchecked', time_call(
+            structure_to_mongo, lambda: (structure, False), args.repeat
+        )),
+    ]
+
+    print '{} blocks, mean of {} runs'.format(args.blocks, args.repeat)
+    for name, milliseconds in results:
+        print '{:<20}{:>10.2f} ms'.format(name, milliseconds)
+
+
+if __name__ == '__main__':
+    main()